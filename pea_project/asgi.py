@@ -9,8 +9,7 @@ https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
 
 import os
 
-from django.core.asgi import get_asgi_application
-
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'pea_project.settings')
 
-application = get_asgi_application()
+# Protocol router of the project (see ASGI_APPLICATION), imported once the settings are known
+from pea_project.routing import application  # noqa: E402
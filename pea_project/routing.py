@@ -1,3 +1,19 @@
-from channels.routing import ProtocolTypeRouter
+from django.core.asgi import get_asgi_application
 
-application = ProtocolTypeRouter({})
\ No newline at end of file
+# Django is set up by get_asgi_application() before the consumers import the models
+django_asgi_app = get_asgi_application()
+
+from channels.routing import ProtocolTypeRouter, URLRouter  # noqa: E402
+from channels.security.websocket import AllowedHostsOriginValidator  # noqa: E402
+from quotes.routing import websocket_urlpatterns  # noqa: E402
+from quotes.data_sources.scheduler import start_in_process  # noqa: E402
+
+# HTTP requests go through Django's ASGI handler, which awaits the async views on the event loop
+# instead of queueing every request behind a single thread. Websockets receive the data updates.
+application = ProtocolTypeRouter({
+    "http": django_asgi_app,
+    "websocket": AllowedHostsOriginValidator(URLRouter(websocket_urlpatterns)),
+})
+
+# Market data refreshes after each close in this server process, only if REFRESH_IN_PROCESS is set
+start_in_process()
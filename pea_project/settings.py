@@ -32,6 +32,8 @@ ALLOWED_HOSTS = []
 # Application definition
 
 INSTALLED_APPS = [
+    # First: daphne's runserver serves ASGI_APPLICATION (async views and websockets)
+    'daphne',
     'django.contrib.admin',
     'django.contrib.auth',
     'django.contrib.contenttypes',
@@ -43,6 +45,7 @@ INSTALLED_APPS = [
     'quotes.apps.QuotesConfig',
     
     'django_bootstrap5',
+    'channels',
 ]
 
 MIDDLEWARE = [
@@ -110,6 +113,38 @@ CACHES = {
     }
 }
 
+# Market data refresh (getyfdata and auto-update): concurrent fetches,
+# max calls per second per data source, attempts per ticker, tickers per batch request
+DATA_REFRESH = {
+    "WORKERS": config('DATA_REFRESH_WORKERS', default=4, cast=int),
+    "RATE_LIMITS": {"Yahoo Finance": 2.0},
+    "MAX_ATTEMPTS": 3,
+    "BATCH_SIZE": 50,
+}
+
+# Scheduled market data refresh: one after each market close, DELAY minutes later for the closing
+# prices to be published. Failed refreshes are retried RETRY_BACKOFF seconds later, doubling each
+# time, MAX_ATTEMPTS times. A claimed refresh stays locked for LEASE seconds if its worker dies.
+# The scheduler runs as a separate process (`manage.py runscheduler`). Setting IN_PROCESS instead
+# starts it in every web server process (each refresh is still run by a single one).
+REFRESH_SCHEDULER = {
+    "IN_PROCESS": config('REFRESH_IN_PROCESS', default=False, cast=bool),
+    "MARKET_TIMEZONE": "Europe/Paris",
+    "MARKET_CLOSE": "17:30",
+    "DELAY": 45,
+    "MAX_ATTEMPTS": 5,
+    "RETRY_BACKOFF": 300,
+    "LEASE": 3600,
+    "POLL": 60,
+}
+
+# Memory-mapped copy of the prices and dividends, read instead of the database when up to date.
+# Set PRICE_STORE_DIR to an empty value to disable it.
+PRICE_STORE_DIR = config('PRICE_STORE_DIR', default=str(BASE_DIR / '.price_store'))
+
+# Annual risk-free rate the Sharpe and Sortino ratios of the portfolios are measured against
+RISK_FREE_RATE = config('RISK_FREE_RATE', default=0.0, cast=float)
+
 
 
 # Password validation
@@ -159,6 +194,13 @@ CRISPY_TEMPLATE_PACK = 'django_bootstrap5'
 
 ASGI_APPLICATION = 'pea_project.routing.application'
 
+# Channel layer of the websocket data updates. The in-memory layer only reaches clients connected
+# to the same process: the updates made by runscheduler or snapshotportfolios need a shared layer,
+# e.g. {"BACKEND": "channels_redis.core.RedisChannelLayer", "CONFIG": {"hosts": [...]}}.
+CHANNEL_LAYERS = {
+    "default": {"BACKEND": "channels.layers.InMemoryChannelLayer"},
+}
+
 # Logging Configuration (Development)
 LOGGING = {
     'version': 1,
@@ -185,4 +227,6 @@ LOGGING = {
             'level': 'INFO',
         },
     },
-}
\ No newline at end of file
+}
+# Threads running the blocking work (queries, computations, charts) of the async views
+VIEW_WORKERS = config('VIEW_WORKERS', default=8, cast=int)
@@ -14,3 +14,7 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'pea_project.settings')
 
 application = get_wsgi_application()
+
+# Market data refreshes after each close in this server process, only if REFRESH_IN_PROCESS is set
+from quotes.data_sources.scheduler import start_in_process  # noqa: E402
+start_in_process()
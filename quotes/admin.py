@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.apps import apps
-from quotes.models import AccountOwner, Portfolio, FinancialObject, Order, FinancialData
+from quotes.models import AccountOwner, Portfolio, FinancialObject, Order, FinancialData, PortfolioSnapshot, RefreshJob
 # Register your models here.
 
 admin.site.register(AccountOwner)
@@ -26,4 +26,18 @@ class FinancialDataAdmin(admin.ModelAdmin):
 	list_display = ["id_object", "date", "field", "value", "origin"]
 	list_filter = ["id_object", "date", "field"]
 	search_fields = ["id_object", "date", "field"]
-	ordering = ["id"]
\ No newline at end of file
+	ordering = ["id"]
+
+@admin.register(PortfolioSnapshot)
+class PortfolioSnapshotAdmin(admin.ModelAdmin):
+	list_display = ["portfolio", "date", "value", "daily_return", "cumulative_return"]
+	list_filter = ["portfolio"]
+	date_hierarchy = "date"
+	ordering = ["portfolio", "-date"]
+
+@admin.register(RefreshJob)
+class RefreshJobAdmin(admin.ModelAdmin):
+	list_display = ["slot", "status", "attempts", "worker", "started_at", "finished_at"]
+	list_filter = ["status"]
+	date_hierarchy = "slot"
+	ordering = ["-slot"]
@@ -0,0 +1,40 @@
+"""
+Analytics package for the quotes application.
+
+This package contains the vectorized computations run on top of the models:
+- positions: positions matrix and portfolio value/return series, price and total return
+- downsampling: LTTB decimation and calendar resampling of chart series
+- performance: returns of many series over many horizons
+- risk: volatility, Sharpe/Sortino ratios, drawdowns and their rolling windows
+- returns: price, dividend and total returns of many instruments over many windows, rebased series
+- attribution: contributions of instruments to a portfolio's return over many windows
+"""
+from .positions import OrderBook, DividendEvents, Checkpoint, PortfolioSeries, compute_portfolio_series, compute_portfolios_series
+from .downsampling import SAMPLING_METHODS, downsample
+from .performance import PerformanceMatrix, compute_performance
+from .risk import ROLLING_WINDOWS, RiskStatistics, RiskMatrix, compute_risk
+from .returns import RETURN_KINDS, ReturnsMatrix, compute_returns, rebase
+from .attribution import AttributionMatrix, compute_attribution
+
+__all__ = [
+    'OrderBook',
+    'DividendEvents',
+    'Checkpoint',
+    'PortfolioSeries',
+    'compute_portfolio_series',
+    'compute_portfolios_series',
+    'SAMPLING_METHODS',
+    'downsample',
+    'PerformanceMatrix',
+    'compute_performance',
+    'ROLLING_WINDOWS',
+    'RiskStatistics',
+    'RiskMatrix',
+    'compute_risk',
+    'RETURN_KINDS',
+    'ReturnsMatrix',
+    'compute_returns',
+    'rebase',
+    'AttributionMatrix',
+    'compute_attribution',
+]
@@ -0,0 +1,111 @@
+"""
+Attribution engine: contribution of each instrument to a portfolio's return, over many windows at once.
+
+The daily contribution of an instrument is its price change (or dividend) times the items held at
+the start of the day, over the portfolio value at the previous close. Contributions are linked
+across days by weighting each one with the portfolio's growth since the start of its window, so
+that they add up exactly to the compounded total return of the window. Weighted contributions
+are accumulated once, and every window is then a difference of cumulative sums.
+"""
+from dataclasses import dataclass
+from datetime import date
+from typing import Hashable
+
+import numpy as np
+import pandas as pd
+
+
+@dataclass
+class AttributionMatrix:
+    """
+    Contributions of each instrument (rows) to the portfolio total return over each window (columns).
+
+    Args:
+        ids: instrument keys, one per row
+        windows: (start, end) dates, one per column: returns run from the close of start to the close of end
+        price: contributions of price changes
+        dividend: contributions of dividends
+        total: price plus dividend contributions, adding up to portfolio_return
+        held: whether the instrument was held at some point of the window
+        portfolio_return: total return of the portfolio over each window
+    """
+    ids: list
+    windows: list[tuple[date, date]]
+    price: np.ndarray
+    dividend: np.ndarray
+    total: np.ndarray
+    held: np.ndarray
+    portfolio_return: np.ndarray
+
+    def window_frame(self, window: tuple[date, date]) -> pd.DataFrame:
+        """
+        Price, dividend and total contributions of the instruments held during one window
+        """
+        j = self.windows.index(window)
+        held = self.held[:, j]
+        return pd.DataFrame({"Price": self.price[held, j], "Dividends": self.dividend[held, j], "Total": self.total[held, j]},
+                            index=[id for id, kept in zip(self.ids, held) if kept])
+
+    def to_frame(self, kind: str = "total") -> pd.DataFrame:
+        return pd.DataFrame(getattr(self, kind), index=self.ids, columns=pd.MultiIndex.from_tuples(self.windows))
+
+
+def compute_attribution(dates: np.ndarray, nav: np.ndarray, dividends: np.ndarray, pos_start: np.ndarray,
+                        pos_end: np.ndarray, windows: list[tuple[date, date]], ids: list[Hashable]) -> AttributionMatrix:
+    """
+    Contributions of the instruments of a portfolio over several windows.
+
+    Args:
+        dates: sorted dates of the panel (datetime64[D])
+        nav: (dates x ids) prices, NaN when missing: the last known price is used instead
+        dividends: (dates x ids) dividends paid per item on their ex-date, 0 when none
+        pos_start: (dates x ids) items held at the start of each date
+        pos_end: (dates x ids) items held at the end of each date
+        windows: (start, end) dates, the close of start being the base of each window
+        ids: instrument keys of the columns
+    """
+    nb_dates, nb_ids = nav.shape
+
+    # Last known price on each date
+    rows = np.arange(nb_dates)[:, None]
+    last_priced = np.maximum.accumulate(np.where(np.isnan(nav), -1, rows), axis=0)
+    prices = np.where(last_priced >= 0, nav[np.maximum(last_priced, 0), np.arange(nb_ids)], np.nan)
+    previous = np.vstack([np.full((1, nb_ids), np.nan), prices[:-1]])
+
+    # Daily contributions over the value of the day's starting positions at the previous close
+    with np.errstate(invalid="ignore", divide="ignore"):
+        base = np.nansum(pos_start * previous, axis=1)
+        scale = np.where(base > 0, 1 / base, 0)[:, None]
+        price_contrib = np.nan_to_num(pos_start * (prices - previous)) * scale
+        dividend_contrib = np.nan_to_num(pos_start * dividends) * scale
+
+    # Portfolio growth before each date, with a leading 1
+    daily = price_contrib.sum(axis=1) + dividend_contrib.sum(axis=1)
+    growth = np.concatenate([[1.], np.cumprod(1 + daily)])
+
+    # Contributions weighted by the growth so far, accumulated with a leading row of zeros
+    zeros = np.zeros((1, nb_ids))
+    price_cumul = np.vstack([zeros, np.cumsum(price_contrib * growth[:-1, None], axis=0)])
+    dividend_cumul = np.vstack([zeros, np.cumsum(dividend_contrib * growth[:-1, None], axis=0)])
+    held_cumul = np.vstack([zeros, np.cumsum((pos_start != 0) | (pos_end != 0), axis=0)])
+
+    # Window (s, e]: rows after the last date on or before start, up to the last date on or before end
+    starts = np.searchsorted(dates, np.array([np.datetime64(start, "D") for start, _ in windows], dtype="datetime64[D]"), side="right")
+    ends = np.searchsorted(dates, np.array([np.datetime64(end, "D") for _, end in windows], dtype="datetime64[D]"), side="right")
+    ends = np.maximum(ends, starts)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        window_growth = growth[starts]
+        price = ((price_cumul[ends] - price_cumul[starts]) / window_growth[:, None]).T
+        dividend = ((dividend_cumul[ends] - dividend_cumul[starts]) / window_growth[:, None]).T
+        portfolio_return = growth[ends] / window_growth - 1
+
+    return AttributionMatrix(
+        ids=list(ids),
+        windows=list(windows),
+        price=price,
+        dividend=dividend,
+        total=price + dividend,
+        held=(held_cumul[ends] - held_cumul[starts]).T > 0,
+        portfolio_return=portfolio_return,
+    )
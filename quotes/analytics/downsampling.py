@@ -0,0 +1,95 @@
+"""
+Chart downsampling: fewer points for long series, keeping their visual shape.
+
+Series are either resampled on a calendar grid (last value of each week or month) or
+decimated with largest-triangle-three-buckets (LTTB), which keeps the points that
+contribute most to the drawn line. The first and last points are always kept, so
+that rebased series still start at 0%.
+"""
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+SAMPLING_METHODS = ("auto", "none", "weekly", "monthly", "lttb")
+DEFAULT_POINT_BUDGET = 500
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, nb_points: int) -> np.ndarray:
+    """
+    Positions of the nb_points points selected by largest-triangle-three-buckets
+    """
+    n = len(x)
+    if nb_points >= n or nb_points < 3:
+        return np.arange(n)
+
+    # nb_points - 2 buckets between the first and the last point
+    edges = np.linspace(1, n - 1, nb_points - 1).astype(np.int64)
+    kept = np.empty(nb_points, dtype=np.int64)
+    kept[0], kept[-1] = 0, n - 1
+
+    selected = 0
+    for i in range(nb_points - 2):
+        start, end = edges[i], edges[i + 1]
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x, avg_y = x[end:next_end].mean(), y[end:next_end].mean()
+
+        # Triangle formed by the last selected point, each candidate and the next bucket's average
+        areas = np.abs((x[selected] - avg_x) * (y[start:end] - y[selected])
+                       - (x[selected] - x[start:end]) * (avg_y - y[selected]))
+        selected = start + int(np.argmax(areas))
+        kept[i + 1] = selected
+
+    return kept
+
+
+def calendar_indices(dates: pd.DatetimeIndex, freq: str) -> np.ndarray:
+    """
+    Positions of the last point of each calendar period ("W" or "M"), plus the first point
+    """
+    periods = dates.to_period(freq).asi8
+    last_of_period = np.flatnonzero(np.append(periods[1:] != periods[:-1], True))
+    return np.union1d([0], last_of_period) if len(dates) else last_of_period
+
+
+def choose_sampling(dates: pd.DatetimeIndex, budget: int) -> str:
+    """
+    Finest calendar resolution that fits the point budget, LTTB when even months do not.
+    The span of the requested timeframe drives the choice: a few months stay daily,
+    a few years become weekly, decades monthly.
+    """
+    if len(dates) <= budget:
+        return "none"
+    for method, freq in (("weekly", "W"), ("monthly", "M")):
+        if len(np.unique(dates.to_period(freq).asi8)) + 1 <= budget:
+            return method
+    return "lttb"
+
+
+def downsample(ts: pd.Series, method: str = "auto", budget: Optional[int] = None) -> pd.Series:
+    """
+    Series reduced for charting with one of SAMPLING_METHODS, within `budget` points for auto and lttb
+    """
+    if method not in SAMPLING_METHODS:
+        raise ValueError(f"Unknown sampling method {method}, expected one of {', '.join(SAMPLING_METHODS)}")
+
+    budget = budget or DEFAULT_POINT_BUDGET
+    if len(ts) <= 2 or method == "none":
+        return ts
+
+    dates = pd.DatetimeIndex(ts.index)
+    if method == "auto":
+        method = choose_sampling(dates, budget)
+
+    match method:
+        case "none":
+            return ts
+        case "weekly":
+            kept = calendar_indices(dates, "W")
+        case "monthly":
+            kept = calendar_indices(dates, "M")
+        case "lttb":
+            x = dates.asi8.astype(float)
+            kept = lttb_indices(x, ts.to_numpy(dtype=float), budget)
+
+    return ts.iloc[kept]
@@ -0,0 +1,122 @@
+"""
+Performance engine: returns of many series over many horizons at once.
+
+Every series is laid end to end on a single (series, date) axis, so that the anchor date
+of every (series, horizon) pair is found by one searchsorted call, whatever the number
+of portfolios and horizons. Each series keeps its own dates: nothing assumes they share
+an index.
+"""
+from dataclasses import dataclass
+from datetime import date
+from typing import Hashable, Optional
+
+import numpy as np
+import pandas as pd
+
+# Days are encoded after the series position on the combined axis
+_DAYS_PER_SERIES = 10 ** 6
+
+
+@dataclass
+class PerformanceMatrix:
+    """
+    Returns of each series (rows) over each horizon (columns).
+
+    Args:
+        keys: series keys, one per row
+        horizons: horizon labels, one per column
+        start_dates: (keys x horizons) anchor date of each return, NaT if none
+        end_dates: last date of each series on or before the end date, NaT if none
+        returns: (keys x horizons) cumulative returns, NaN if not computable
+        annualized: (keys x horizons) annualized returns, NaN for spans shorter than a year
+    """
+    keys: list
+    horizons: list[str]
+    start_dates: np.ndarray
+    end_dates: np.ndarray
+    returns: np.ndarray
+    annualized: np.ndarray
+
+    def get(self, key: Hashable, horizon: str, annualized: bool = False) -> float | None:
+        """
+        Return of one series over one horizon, None if not computable
+        """
+        matrix = self.annualized if annualized else self.returns
+        value = matrix[self.keys.index(key), self.horizons.index(horizon)]
+        return None if np.isnan(value) else float(value)
+
+    def row(self, key: Hashable, annualized: bool = False) -> list[float | None]:
+        """
+        Returns of one series over every horizon, None where not computable
+        """
+        matrix = self.annualized if annualized else self.returns
+        return [None if np.isnan(value) else float(value) for value in matrix[self.keys.index(key)]]
+
+    def to_frame(self, annualized: bool = False) -> pd.DataFrame:
+        return pd.DataFrame(self.annualized if annualized else self.returns, index=self.keys, columns=self.horizons)
+
+
+def compute_performance(series: dict[Hashable, pd.Series], limits: dict[str, Optional[date]],
+                        end: Optional[date] = None, partial: bool = False) -> PerformanceMatrix:
+    """
+    Returns of cumulative-return (or value) series over several horizons.
+
+    Args:
+        series: {key: series indexed by date}, each one sorted
+        limits: {horizon label: limit date}, None for since inception. A return is measured from
+                the last date on or before the limit date, to the last date on or before `end`.
+        end: end date of every horizon, the last date of each series if None
+        partial: for series starting after a limit date, measure since inception instead of
+                 leaving the return empty
+    """
+    keys = list(series)
+    horizons = list(limits)
+
+    lengths = np.array([len(series[key]) for key in keys], dtype=np.int64)
+    offsets = np.concatenate([[0], np.cumsum(lengths)[:-1]]).astype(np.int64)
+    values = np.concatenate([series[key].to_numpy(dtype=float) for key in keys] + [np.array([])])
+    days = np.concatenate([np.array(series[key].index, dtype="datetime64[D]").astype(np.int64) for key in keys]
+                          + [np.array([], dtype=np.int64)])
+
+    # Combined, sorted axis: series position first, then day
+    positions = np.repeat(np.arange(len(keys), dtype=np.int64), lengths)
+    axis = positions * _DAYS_PER_SERIES + days
+    row_base = np.arange(len(keys), dtype=np.int64)[:, None] * _DAYS_PER_SERIES
+
+    # Last point of each series on or before the end date
+    if end is None:
+        end_idx = offsets + lengths - 1
+    else:
+        end_day = np.datetime64(end, "D").astype(np.int64)
+        end_idx = np.searchsorted(axis, row_base[:, 0] + end_day, side="right") - 1
+    has_end = (lengths > 0) & (end_idx >= offsets)
+
+    # Anchor of every (series, horizon) pair, in one searchsorted call
+    since_inception = np.array([limits[h] is None for h in horizons], dtype=bool)
+    limit_days = np.array([0 if limits[h] is None else np.datetime64(limits[h], "D").astype(np.int64)
+                           for h in horizons], dtype=np.int64)
+    anchor_idx = np.searchsorted(axis, (row_base + limit_days[None, :]).ravel(), side="right").reshape(len(keys), len(horizons)) - 1
+    since_inception = np.broadcast_to(since_inception[None, :], anchor_idx.shape)
+    too_young = anchor_idx < offsets[:, None]
+
+    anchor_idx = np.where(since_inception | (too_young & partial), offsets[:, None], anchor_idx)
+    has_anchor = (since_inception | partial | ~too_young) & has_end[:, None]
+    has_anchor &= anchor_idx <= end_idx[:, None]
+
+    # Indices are only read where valid: the others point at a dummy first element
+    values = np.concatenate([[np.nan], values])
+    days = np.concatenate([[0], days])
+    safe_anchor = np.where(has_anchor, anchor_idx + 1, 0)
+    safe_end = np.where(has_end, end_idx + 1, 0)
+
+    returns = np.where(has_anchor, values[safe_end][:, None] / values[safe_anchor] - 1, np.nan)
+    start_dates = np.where(has_anchor, days[safe_anchor].astype("datetime64[D]"), np.datetime64("NaT"))
+    end_dates = np.where(has_end, days[safe_end].astype("datetime64[D]"), np.datetime64("NaT"))
+
+    # Annualized over the actual span, for spans of a year or more
+    span_years = np.where(has_anchor, (days[safe_end][:, None] - days[safe_anchor]) / 365.25, np.nan)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        annualized = np.where(span_years >= 1, np.power(1 + returns, 1 / span_years) - 1, np.nan)
+
+    return PerformanceMatrix(keys=keys, horizons=horizons, start_dates=start_dates, end_dates=end_dates,
+                             returns=returns, annualized=annualized)
@@ -0,0 +1,438 @@
+"""
+Positions engine: turns portfolios' order histories and a price panel into value/return series.
+
+The whole history is computed in one pass over a dense (dates x instruments) positions matrix,
+instead of rebuilding the inventory for every order date. Several portfolios are valued together
+on a single panel holding the union of their instruments. A computation can resume from a
+Checkpoint, in which case only the dates after it are priced.
+
+Dividends are sparse payment events: the same pass turns them into the income of each portfolio,
+giving the total-return (dividends reinvested) series next to the price-return ones.
+"""
+from dataclasses import dataclass
+from datetime import date
+from typing import Hashable, Iterable, Optional, Self
+
+import numpy as np
+import pandas as pd
+
+
+@dataclass
+class OrderBook:
+    """
+    Column view of the orders of a portfolio, sorted by date.
+
+    Args:
+        dates: order dates (datetime64[D])
+        id_objects: FinancialObject id of each order
+        quantities: signed number of items (positive for BUY, negative for SELL)
+    """
+    dates: np.ndarray
+    id_objects: np.ndarray
+    quantities: np.ndarray
+
+    @classmethod
+    def from_portfolio(cls, portfolio, after: Optional[date] = None) -> Self:
+        """
+        Load the orders of a portfolio with a single query, optionally only those placed after a date
+        """
+        return cls.from_portfolios([portfolio], after={portfolio.id: after})[portfolio.id]
+
+    @classmethod
+    def from_portfolios(cls, portfolios: Iterable, after: Optional[dict[int, Optional[date]]] = None) -> dict[int, Self]:
+        """
+        Load the orders of many portfolios with a single query, as {portfolio id: OrderBook}.
+        after optionally maps portfolio ids to a date: only orders placed after it are loaded.
+        """
+        from django.db.models import Q
+        from quotes.models.order import Order
+
+        after = after or {}
+        ids = [ptf.id for ptf in portfolios]
+        selection = Q()
+        for ptf_id in ids:
+            since = after.get(ptf_id)
+            selection |= Q(portfolio_id=ptf_id) if since is None else Q(portfolio_id=ptf_id, date__gt=since)
+
+        rows = list(Order.objects.filter(selection).order_by("date", "id")
+                    .values_list("portfolio_id", "date", "id_object_id", "direction", "nb_items")) if ids else []
+
+        by_portfolio = {ptf_id: [] for ptf_id in ids}
+        for row in rows:
+            by_portfolio[row[0]].append(row)
+
+        return {
+            ptf_id: cls(
+                dates=np.array([row[1] for row in ptf_rows], dtype="datetime64[D]"),
+                id_objects=np.array([row[2] for row in ptf_rows], dtype=np.int64),
+                quantities=np.array([row[4] if row[3] == Order.OrderDirection.BUY else -row[4] for row in ptf_rows], dtype=float),
+            )
+            for ptf_id, ptf_rows in by_portfolio.items()
+        }
+
+    def __len__(self) -> int:
+        return len(self.dates)
+
+    @property
+    def instrument_ids(self) -> list[int]:
+        return sorted(set(self.id_objects.tolist()))
+
+    @property
+    def first_date(self) -> date:
+        return self.dates[0].astype(date)
+
+    def after(self, since: date) -> Self:
+        """
+        Orders placed strictly after a date
+        """
+        placed = self.dates > np.datetime64(since, "D")
+        return OrderBook(dates=self.dates[placed], id_objects=self.id_objects[placed], quantities=self.quantities[placed])
+
+    def last_date_until(self, until: date) -> Optional[date]:
+        """
+        Date of the last order placed on or before a date
+        """
+        placed = self.dates[self.dates <= np.datetime64(until, "D")]
+        return placed[-1].astype(date) if len(placed) else None
+
+    def positions(self, dates: np.ndarray, ids: list[int], include_same_day: bool = True) -> np.ndarray:
+        """
+        Dense (dates x ids) matrix of the number of items held on each date.
+
+        With include_same_day, orders placed on a date are part of that date's positions
+        (end of day view). Otherwise only orders strictly before the date are counted.
+        """
+        col_of = {id_object: j for j, id_object in enumerate(ids)}
+        rows = np.searchsorted(dates, self.dates, side="left" if include_same_day else "right")
+        cols = np.array([col_of[id_object] for id_object in self.id_objects.tolist()], dtype=np.int64)
+
+        # One extra row collects orders placed after the last date
+        deltas = np.zeros((len(dates) + 1, len(ids)))
+        np.add.at(deltas, (rows, cols), self.quantities)
+
+        return np.cumsum(deltas, axis=0)[:-1]
+
+
+@dataclass
+class DividendEvents:
+    """
+    Dividend payments as sparse events, one per (date, instrument) with a payment.
+
+    Args:
+        dates: ex-dates of the payments (datetime64[D])
+        id_objects: FinancialObject id of each payment
+        amounts: dividend paid per item
+    """
+    dates: np.ndarray
+    id_objects: np.ndarray
+    amounts: np.ndarray
+
+    @classmethod
+    def empty(cls) -> Self:
+        return cls(dates=np.array([], dtype="datetime64[D]"), id_objects=np.array([], dtype=np.int64),
+                   amounts=np.array([], dtype=float))
+
+    def __len__(self) -> int:
+        return len(self.dates)
+
+
+@dataclass
+class Checkpoint:
+    """
+    State of a portfolio series at its last valued date, enough to extend it without the history.
+
+    Args:
+        date: last date on which the portfolio was valued
+        positions: {FinancialObject id: number of items} held at the end of that date
+        value: portfolio value on that date
+        cumul_ret: cumulative return (base 1) on that date
+        total_cumul_ret: cumulative total return (base 1, dividends reinvested) on that date
+        last_order_date: date of the last order placed on or before that date
+    """
+    date: date
+    positions: dict[int, float]
+    value: float
+    cumul_ret: float
+    total_cumul_ret: float
+    last_order_date: date
+
+
+@dataclass
+class PortfolioSeries:
+    """
+    Value and return series of a portfolio, with the checkpoint to extend them from.
+    The ts_total_* series are their total-return counterparts, dividends being reinvested.
+    """
+    ts_ret: pd.Series
+    ts_val: pd.Series
+    ts_cumul_ret: pd.Series
+    ts_total_ret: pd.Series
+    ts_total_val: pd.Series
+    ts_total_cumul_ret: pd.Series
+    checkpoint: Optional[Checkpoint]
+
+    def until(self, last_date: date) -> Self:
+        """
+        Series restricted to dates on or before last_date (checkpoint left as is)
+        """
+        return PortfolioSeries(
+            ts_ret=self.ts_ret[self.ts_ret.index <= last_date],
+            ts_val=self.ts_val[self.ts_val.index <= last_date],
+            ts_cumul_ret=self.ts_cumul_ret[self.ts_cumul_ret.index <= last_date],
+            ts_total_ret=self.ts_total_ret[self.ts_total_ret.index <= last_date],
+            ts_total_val=self.ts_total_val[self.ts_total_val.index <= last_date],
+            ts_total_cumul_ret=self.ts_total_cumul_ret[self.ts_total_cumul_ret.index <= last_date],
+            checkpoint=self.checkpoint,
+        )
+
+    def extend(self, new: Self) -> Self:
+        """
+        Append series computed from this one's checkpoint
+        """
+        base = self.until(self.checkpoint.date)
+        return PortfolioSeries(
+            ts_ret=pd.concat([base.ts_ret, new.ts_ret]),
+            ts_val=pd.concat([base.ts_val, new.ts_val]),
+            ts_cumul_ret=pd.concat([base.ts_cumul_ret, new.ts_cumul_ret]),
+            ts_total_ret=pd.concat([base.ts_total_ret, new.ts_total_ret]),
+            ts_total_val=pd.concat([base.ts_total_val, new.ts_total_val]),
+            ts_total_cumul_ret=pd.concat([base.ts_total_cumul_ret, new.ts_total_cumul_ret]),
+            checkpoint=new.checkpoint,
+        )
+
+    def rewind(self, before: date, order_book: OrderBook) -> Optional[Self]:
+        """
+        Drop every date from `before` onwards, and move the checkpoint to the last valued date left.
+        Returns None if nothing is left to resume from.
+        """
+        valued = self.ts_val.index[self.ts_val.index < before]
+        if len(valued) == 0:
+            return None
+
+        last_valued = valued[-1]
+        base = self.until(last_valued)
+        ids = order_book.instrument_ids
+        positions = order_book.positions(np.array([last_valued], dtype="datetime64[D]"), ids)[0]
+
+        base.checkpoint = Checkpoint(
+            date=last_valued,
+            positions={id_object: nb for id_object, nb in zip(ids, positions.tolist()) if nb != 0},
+            value=float(self.ts_val[last_valued]),
+            cumul_ret=float(base.ts_cumul_ret.iloc[-1]),
+            total_cumul_ret=float(base.ts_total_cumul_ret.iloc[-1]),
+            last_order_date=order_book.last_date_until(last_valued),
+        )
+        return base
+
+
+def _valued(prices: np.ndarray, positions: np.ndarray, blocks: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Value of each portfolio on each date, and whether every instrument it holds has a price on that date.
+
+    prices and positions are (dates x holdings) matrices where each portfolio owns a block of
+    consecutive columns, starting at the indices in blocks. Results are (dates x portfolios).
+    """
+    held = positions != 0
+    complete = (np.logical_or.reduceat(held, blocks, axis=1)
+                & ~np.logical_or.reduceat(held & np.isnan(prices), blocks, axis=1))
+    values = np.add.reduceat(np.where(held, prices, 0) * positions, blocks, axis=1)
+    return values, complete
+
+
+def _received(dividends: Optional[DividendEvents], dates: np.ndarray, holding_ids: np.ndarray,
+              positions: np.ndarray, blocks: np.ndarray) -> np.ndarray:
+    """
+    Dividends received by each portfolio on each date (dates x portfolios).
+
+    Each payment is multiplied by the items held at the start of its ex-date, in every block of
+    columns (portfolio) holding its instrument. A payment on a date missing from the panel counts
+    on the next date of the panel, payments outside of the panel's dates are left out.
+    """
+    received = np.zeros((len(dates), len(blocks)))
+    if dividends is None or not len(dividends) or not len(dates):
+        return received
+
+    rows = np.searchsorted(dates, dividends.dates, side="left")
+
+    # Holding columns of each payment's instrument, one (payment, column) pair each
+    order = np.argsort(holding_ids, kind="stable")
+    first = np.searchsorted(holding_ids[order], dividends.id_objects, side="left")
+    counts = np.searchsorted(holding_ids[order], dividends.id_objects, side="right") - first
+    counts[(rows >= len(dates)) | (dividends.dates < dates[0])] = 0
+
+    payment = np.repeat(np.arange(len(dividends)), counts)
+    rank = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    holding = order[first[payment] + rank]
+    portfolio = np.searchsorted(blocks, holding, side="right") - 1
+
+    np.add.at(received, (rows[payment], portfolio), dividends.amounts[payment] * positions[rows[payment], holding])
+    return received
+
+
+def compute_portfolios_series(order_books: dict[Hashable, OrderBook], prices: pd.DataFrame,
+                              checkpoints: Optional[dict[Hashable, Checkpoint]] = None,
+                              dividends: Optional[DividendEvents] = None) -> dict[Hashable, PortfolioSeries]:
+    """
+    Compute the value/return series of many portfolios from their order books and one price panel
+    (dates x instrument ids) covering all of them. Returns {key: PortfolioSeries} with the keys of order_books.
+
+    Every portfolio is valued in the same vectorized pass: the positions of all portfolios are laid
+    side by side, each one on the columns of the instruments it trades, and multiplied with the
+    matching columns of the shared panel. Only the return bookkeeping, linear in the number of
+    dates, is done portfolio by portfolio. The dividend events, if any, are turned into each
+    portfolio's income in the same pass, for the total-return series.
+
+    A portfolio without checkpoint has every order in its book and its series start at the first one.
+    With a checkpoint, its book only holds orders placed after it and its series only cover the
+    dates after it.
+    """
+    checkpoints = checkpoints or {}
+    keys = list(order_books)
+    if not keys:
+        return {}
+
+    # Instruments of each portfolio, and of the panel they are all valued on
+    ptf_ids = {key: sorted(set(checkpoints[key].positions if key in checkpoints else {})
+                           | set(order_books[key].instrument_ids)) for key in keys}
+    if not all(ptf_ids.values()):
+        raise ValueError("Every portfolio needs orders or a checkpoint to be valued.")
+    ids = sorted(set(prices.columns).union(*ptf_ids.values()))
+    col_of = {id_object: j for j, id_object in enumerate(ids)}
+
+    prices = prices.sort_index().reindex(columns=ids)
+    dates = np.array(prices.index, dtype="datetime64[D]")
+    panel = prices.to_numpy(dtype=float)
+
+    # Portfolios side by side: one block of columns per portfolio
+    columns = np.array([col_of[id_object] for key in keys for id_object in ptf_ids[key]], dtype=np.int64)
+    blocks = np.cumsum([0] + [len(ptf_ids[key]) for key in keys[:-1]])
+
+    # Positions at the end of each day, and positions the day started with
+    pos_end, pos_start = [], []
+    for key in keys:
+        held_before = checkpoints[key].positions if key in checkpoints else {}
+        initial = np.array([held_before.get(id_object, 0) for id_object in ptf_ids[key]], dtype=float)
+        pos_end.append(initial + order_books[key].positions(dates, ptf_ids[key], include_same_day=True))
+        pos_start.append(initial + order_books[key].positions(dates, ptf_ids[key], include_same_day=False))
+
+    val_end, valid_end = _valued(panel[:, columns], np.hstack(pos_end), blocks)
+    val_start, valid_start = _valued(panel[:, columns], np.hstack(pos_start), blocks)
+    income = _received(dividends, dates, np.array(ids, dtype=np.int64)[columns], np.hstack(pos_start), blocks)
+
+    results = {}
+    for k, key in enumerate(keys):
+        checkpoint = checkpoints.get(key)
+        rows = dates > np.datetime64(checkpoint.date, "D") if checkpoint else np.ones(len(dates), dtype=bool)
+        results[key] = _assemble(
+            order_books[key], checkpoint, dates[rows], ptf_ids[key], pos_end[k][rows],
+            val_end[rows, k], valid_end[rows, k], val_start[rows, k], valid_start[rows, k], income[rows, k],
+        )
+
+    return results
+
+
+def compute_portfolio_series(order_book: OrderBook, prices: pd.DataFrame,
+                             checkpoint: Optional[Checkpoint] = None,
+                             dividends: Optional[DividendEvents] = None) -> PortfolioSeries:
+    """
+    Compute the value/return series of a single portfolio from its order book and a price panel
+    (dates x instrument ids). See compute_portfolios_series.
+    """
+    checkpoints = {0: checkpoint} if checkpoint else None
+    return compute_portfolios_series({0: order_book}, prices, checkpoints, dividends)[0]
+
+
+def _assemble(order_book: OrderBook, checkpoint: Optional[Checkpoint], dates: np.ndarray, ids: list[int],
+              pos_end: np.ndarray, val_end: np.ndarray, valid_end: np.ndarray,
+              val_start: np.ndarray, valid_start: np.ndarray, income: np.ndarray) -> PortfolioSeries:
+    """
+    Turn the daily valuations of one portfolio into its return series and checkpoint.
+
+    Approximation: change in number of stocks only come into effect at the end of the day
+    when the order was placed. A date is only valued when every held instrument has a price,
+    and a daily return is only computed when the previous valued date is not older than the
+    last order date, as the previous one-segment-per-order-date implementation did.
+    Total returns add the dividends received since the previous valued date.
+    """
+    # The checkpoint acts as an already valued date before the first one
+    order_dates = np.unique(order_book.dates)
+    if checkpoint:
+        dates = np.concatenate([[np.datetime64(checkpoint.date, "D")], dates])
+        val_end = np.concatenate([[checkpoint.value], val_end])
+        valid_end = np.concatenate([[True], valid_end])
+        val_start = np.concatenate([[np.nan], val_start])
+        valid_start = np.concatenate([[False], valid_start])
+        income = np.concatenate([[0.], income])
+        order_dates = np.concatenate([[np.datetime64(checkpoint.last_order_date, "D")], order_dates])
+
+    # Index of the previous valued date (-1 if none)
+    idx = np.arange(len(dates))
+    last_valid = np.maximum.accumulate(np.where(valid_end, idx, -1))
+    prev_valid = np.concatenate([[-1], last_valid[:-1]])
+
+    # Last order date strictly before each date: returns never span an order date
+    seg = np.searchsorted(order_dates, dates, side="left") - 1
+    seg_start = np.where(seg >= 0, order_dates[np.maximum(seg, 0)], np.datetime64("NaT"))
+
+    has_ret = valid_start & (seg >= 0) & (prev_valid >= 0)
+    has_ret[has_ret] &= dates[prev_valid[has_ret]] >= seg_start[has_ret]
+
+    index = pd.Index(dates.astype(date).tolist(), dtype=object)
+    rets = val_start[has_ret] / val_end[prev_valid[has_ret]] - 1
+
+    # Dividends received after the previous valued date, up to and including each date
+    paid = np.cumsum(income)
+    dividends = paid[has_ret] - paid[prev_valid[has_ret]]
+    total_rets = (val_start[has_ret] + dividends) / val_end[prev_valid[has_ret]] - 1
+
+    # Row 0 is the checkpoint itself, never part of the output
+    new_valued = valid_end.copy()
+    if checkpoint:
+        new_valued[0] = False
+
+    def cumulated(ts_ret: pd.Series, base: Optional[float]) -> pd.Series:
+        if checkpoint:
+            return ts_ret.add(1).cumprod() * base
+        ts_cumul_ret = pd.concat([
+            ts_ret.add(1),
+            pd.Series([1], index=[order_book.first_date])
+            ])
+        ts_cumul_ret.sort_index(inplace=True)
+        return ts_cumul_ret.cumprod()
+
+    ts_ret = pd.Series(rets, index=index[has_ret])
+    ts_val = pd.Series(val_end[new_valued], index=index[new_valued])
+    ts_cumul_ret = cumulated(ts_ret, checkpoint.cumul_ret if checkpoint else None)
+
+    ts_total_ret = pd.Series(total_rets, index=index[has_ret])
+    ts_total_cumul_ret = cumulated(ts_total_ret, checkpoint.total_cumul_ret if checkpoint else None)
+
+    # Value with dividends reinvested: the value scaled by the total over price growth so far
+    growth = np.ones(len(dates))
+    growth[has_ret] = (1 + total_rets) / (1 + rets)
+    base_growth = checkpoint.total_cumul_ret / checkpoint.cumul_ret if checkpoint else 1.0
+    ts_total_val = pd.Series(val_end[new_valued] * (np.cumprod(growth) * base_growth)[new_valued], index=index[new_valued])
+
+    # Checkpoint on the last valued date
+    last = last_valid[-1] if len(dates) else -1
+    if last < 0:
+        new_checkpoint = None
+    elif checkpoint and last == 0:
+        new_checkpoint = checkpoint
+    else:
+        last_date = index[last]
+        placed = order_dates[order_dates <= dates[last]]
+        cumul_until = ts_cumul_ret[ts_cumul_ret.index <= last_date]
+        total_until = ts_total_cumul_ret[ts_total_cumul_ret.index <= last_date]
+        new_checkpoint = Checkpoint(
+            date=last_date,
+            positions={id_object: nb for id_object, nb in zip(ids, pos_end[last - (1 if checkpoint else 0)].tolist()) if nb != 0},
+            value=float(val_end[last]),
+            cumul_ret=float(cumul_until.iloc[-1]) if len(cumul_until) else checkpoint.cumul_ret,
+            total_cumul_ret=float(total_until.iloc[-1]) if len(total_until) else checkpoint.total_cumul_ret,
+            last_order_date=placed[-1].astype(date),
+        )
+
+    return PortfolioSeries(ts_ret=ts_ret, ts_val=ts_val, ts_cumul_ret=ts_cumul_ret,
+                           ts_total_ret=ts_total_ret, ts_total_val=ts_total_val,
+                           ts_total_cumul_ret=ts_total_cumul_ret, checkpoint=new_checkpoint)
@@ -0,0 +1,140 @@
+"""
+Returns engine: price, dividend and total returns of many instruments over many windows at once,
+and their rebased cumulative series.
+
+The prices and dividends of every instrument are read from one (dates x instruments) panel.
+For each column, the next and previous dates with a price are precomputed once, and dividends
+are summed through cumulative sums, so that any number of (start, end) windows are answered
+with a few indexing operations.
+"""
+from dataclasses import dataclass
+from datetime import date
+from typing import Hashable
+
+import numpy as np
+import pandas as pd
+
+RETURN_KINDS = ("price", "dividend", "total")
+
+
+@dataclass
+class ReturnsMatrix:
+    """
+    Returns of each instrument (rows) over each window (columns), NaN if not computable.
+
+    Args:
+        ids: instrument keys, one per row
+        windows: (start, end) dates, one per column
+        price: price return from the first price on or after start to the last one on or before end
+        dividend: dividends paid between start and end (included) over the first price
+        total: price plus dividend return
+    """
+    ids: list
+    windows: list[tuple[date, date]]
+    price: np.ndarray
+    dividend: np.ndarray
+    total: np.ndarray
+
+    def get(self, id: Hashable, window: tuple[date, date], kind: str = "total") -> float | None:
+        """
+        Return of one instrument over one window, None if not computable
+        """
+        value = getattr(self, kind)[self.ids.index(id), self.windows.index(window)]
+        return None if np.isnan(value) else float(value)
+
+    def to_frame(self, kind: str = "total") -> pd.DataFrame:
+        return pd.DataFrame(getattr(self, kind), index=self.ids, columns=pd.MultiIndex.from_tuples(self.windows))
+
+
+def compute_returns(dates: np.ndarray, nav: np.ndarray, dividends: np.ndarray,
+                    windows: list[tuple[date, date]]) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Price, dividend and total returns, each (instruments x windows), from a panel.
+
+    Args:
+        dates: sorted dates of the panel (datetime64[D])
+        nav: (dates x instruments) prices, NaN when missing
+        dividends: (dates x instruments) dividends, 0 when none was paid
+        windows: (start, end) dates. A window without price on or after its start and
+                 on or before its end has no return.
+    """
+    nb_dates, nb_ids = nav.shape
+    starts = np.array([np.datetime64(start, "D") for start, _ in windows], dtype="datetime64[D]")
+    ends = np.array([np.datetime64(end, "D") for _, end in windows], dtype="datetime64[D]")
+
+    # Next row with a price on or after each row, previous one on or before it (extra row for "none")
+    rows = np.arange(nb_dates)[:, None]
+    valid = ~np.isnan(nav)
+    next_price = np.minimum.accumulate(np.where(valid, rows, nb_dates)[::-1], axis=0)[::-1]
+    next_price = np.vstack([next_price, np.full((1, nb_ids), nb_dates)])
+    prev_price = np.maximum.accumulate(np.where(valid, rows, -1), axis=0)
+    prev_price = np.vstack([np.full((1, nb_ids), -1), prev_price])
+
+    first_row = np.searchsorted(dates, starts, side="left")
+    after_last_row = np.searchsorted(dates, ends, side="right")
+
+    # (instruments x windows) rows of the first and last prices of each window
+    ini = next_price[first_row].T
+    end = prev_price[after_last_row].T
+    has_return = (ini < nb_dates) & (end >= 0) & (ini <= end)
+
+    padded_nav = np.vstack([nav, np.full((1, nb_ids), np.nan)])
+    columns = np.arange(nb_ids)[:, None]
+    ini_nav = np.where(has_return, padded_nav[np.where(has_return, ini, nb_dates), columns], np.nan)
+    end_nav = np.where(has_return, padded_nav[np.where(has_return, end, nb_dates), columns], np.nan)
+
+    # Dividends paid within each window, from cumulative sums
+    paid = np.vstack([np.zeros((1, nb_ids)), np.cumsum(dividends, axis=0)])
+    divs = (paid[after_last_row] - paid[first_row]).T
+
+    price = end_nav / ini_nav - 1
+    dividend = divs / ini_nav
+    return price, dividend, price + dividend
+
+
+def rebase(dates: np.ndarray, nav: np.ndarray, dividends: np.ndarray, base_date: date,
+           total_return: bool = False) -> np.ndarray:
+    """
+    Cumulative returns of every column of a panel relative to a base date (0 at the base).
+
+    Each column is rebased on its last price on or before the base date, or on its first price
+    if it has none by then. Missing prices carry the last known one. With total_return,
+    dividends are reinvested on their ex-date.
+
+    Args:
+        dates: sorted dates of the panel (datetime64[D])
+        nav: (dates x instruments) prices, NaN when missing
+        dividends: (dates x instruments) dividends, 0 when none was paid
+        base_date: date the returns are measured from
+        total_return: price return if False
+    Returns:
+        (dates x instruments) rebased returns, NaN before the first price (no rows for an empty panel)
+    """
+    nb_dates, nb_ids = nav.shape
+    if nb_dates == 0:
+        return np.empty((0, nb_ids))
+
+    columns = np.arange(nb_ids)
+    rows = np.arange(nb_dates)[:, None]
+
+    # Last known price on each date
+    last_priced = np.maximum.accumulate(np.where(np.isnan(nav), -1, rows), axis=0)
+    prices = np.where(last_priced >= 0, nav[np.maximum(last_priced, 0), columns], np.nan)
+
+    if total_return:
+        # Total return index: each day's price plus dividend over the previous price
+        with np.errstate(invalid="ignore", divide="ignore"):
+            growth = (prices[1:] + dividends[1:]) / prices[:-1]
+        growth = np.vstack([np.ones((1, nb_ids)), np.where(np.isnan(growth), 1, growth)])
+        levels = np.where(np.isnan(prices), np.nan, np.cumprod(growth, axis=0))
+    else:
+        levels = prices
+
+    # Base row: on or before the base date, else the first priced one
+    base_row = np.full(nb_ids, np.searchsorted(dates, np.datetime64(base_date, "D"), side="right") - 1)
+    first_priced = np.argmax(~np.isnan(levels), axis=0)
+    unpriced = (base_row < 0) | np.isnan(levels[np.maximum(base_row, 0), columns])
+    base_row = np.where(unpriced, np.maximum(first_priced, base_row), base_row)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return levels / levels[base_row, columns] - 1
@@ -0,0 +1,240 @@
+"""
+Risk engine: volatility, Sharpe/Sortino ratios and drawdowns of many return series at once.
+
+Every series is aligned on a single (dates x series) matrix, so the statistics of all
+portfolios come out of the same array operations. Rolling windows run over each series' own
+returns, and are read off cumulative sums of the returns and of their squares instead of
+being recomputed window by window.
+"""
+from dataclasses import dataclass
+from datetime import date
+from typing import Hashable, Optional
+
+import numpy as np
+import pandas as pd
+
+PERIODS_PER_YEAR = 252
+# Rolling windows, in trading days
+ROLLING_WINDOWS = {"1M": 21, "3M": 63, "1Y": 252}
+
+
+@dataclass
+class RiskStatistics:
+    """
+    Risk statistics of one series since inception, None where not computable.
+
+    Args:
+        volatility: annualized standard deviation of the daily returns
+        sharpe: annualized mean excess return over the annualized volatility
+        sortino: annualized mean excess return over the annualized downside deviation
+        max_drawdown: largest fall from a peak of the cumulative returns (negative)
+        peak_date, trough_date: start and bottom of the largest drawdown
+        recovery_date: first date back at the peak, None if not recovered yet
+        rolling_volatility, rolling_sharpe: {window label: value over the last window}
+    """
+    volatility: Optional[float]
+    sharpe: Optional[float]
+    sortino: Optional[float]
+    max_drawdown: Optional[float]
+    peak_date: Optional[date]
+    trough_date: Optional[date]
+    recovery_date: Optional[date]
+    rolling_volatility: dict[str, Optional[float]]
+    rolling_sharpe: dict[str, Optional[float]]
+
+
+@dataclass
+class RiskMatrix:
+    """
+    Risk statistics of each series (columns), with their rolling series.
+
+    Args:
+        keys: series keys, one per column
+        dates: dates of the return matrix
+        volatility, sharpe, sortino, max_drawdown: one value per series, NaN if not computable
+        peak_dates, trough_dates, recovery_dates: dates of the largest drawdowns, NaT if none
+        rolling_volatility, rolling_sharpe: {window label: (dates x keys) rolling values}
+    """
+    keys: list
+    dates: np.ndarray
+    volatility: np.ndarray
+    sharpe: np.ndarray
+    sortino: np.ndarray
+    max_drawdown: np.ndarray
+    peak_dates: np.ndarray
+    trough_dates: np.ndarray
+    recovery_dates: np.ndarray
+    rolling_volatility: dict[str, np.ndarray]
+    rolling_sharpe: dict[str, np.ndarray]
+
+    def rolling(self, key: Hashable, window: str, statistic: str = "volatility") -> pd.Series:
+        """
+        Rolling volatility or Sharpe ratio of one series over a window, on the dates it is computable
+        """
+        values = (self.rolling_volatility if statistic == "volatility" else self.rolling_sharpe)[window]
+        ts = pd.Series(values[:, self.keys.index(key)], index=pd.DatetimeIndex(self.dates).date)
+        return ts.dropna()
+
+    def get(self, key: Hashable) -> RiskStatistics:
+        """
+        Statistics of one series, with the last value of each rolling window
+        """
+        i = self.keys.index(key)
+
+        def number(values: np.ndarray) -> Optional[float]:
+            return None if np.isnan(values[i]) else float(values[i])
+
+        def day(values: np.ndarray) -> Optional[date]:
+            return None if np.isnat(values[i]) else values[i].astype(date)
+
+        def last(rolling: dict[str, np.ndarray]) -> dict[str, Optional[float]]:
+            # Every return after the first full window has a value: the last one is the current window
+            computed = {window: values[~np.isnan(values[:, i]), i] for window, values in rolling.items()}
+            return {window: float(values[-1]) if len(values) else None for window, values in computed.items()}
+
+        return RiskStatistics(
+            volatility=number(self.volatility),
+            sharpe=number(self.sharpe),
+            sortino=number(self.sortino),
+            max_drawdown=number(self.max_drawdown),
+            peak_date=day(self.peak_dates),
+            trough_date=day(self.trough_dates),
+            recovery_date=day(self.recovery_dates),
+            rolling_volatility=last(self.rolling_volatility),
+            rolling_sharpe=last(self.rolling_sharpe),
+        )
+
+
+def _window_sums(cumsum: np.ndarray, window: int) -> np.ndarray:
+    """
+    Sums over the last `window` rows of each row, from the cumulative sums (first row of zeros)
+    """
+    sums = np.full(cumsum[1:].shape, np.nan)
+    sums[window - 1:] = cumsum[window:] - cumsum[:-window]
+    return sums
+
+
+def _drawdowns(wealth: np.ndarray, dates: np.ndarray) -> tuple[np.ndarray, ...]:
+    """
+    Largest drawdown of each column of a (dates x series) wealth matrix, with its peak, trough and recovery dates
+    """
+    nb_dates, nb_series = wealth.shape
+    if nb_dates == 0:
+        return np.full(nb_series, np.nan), *(np.full(nb_series, np.datetime64("NaT", "D")) for _ in range(3))
+
+    valid = ~np.isnan(wealth)
+    has_data = valid.any(axis=0)
+
+    # Running peak, NaN kept until the first value of each series
+    peaks = np.fmax.accumulate(wealth, axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        drawdowns = wealth / peaks - 1
+
+    filled = np.where(valid, drawdowns, np.inf)
+    trough = np.argmin(filled, axis=0)
+    max_drawdown = np.where(has_data, filled[trough, np.arange(nb_series)], np.nan)
+    max_drawdown = np.where(np.isinf(max_drawdown), np.nan, max_drawdown)
+
+    # Peak: highest value on or before the trough, recovery: first value back at it after the trough
+    rows = np.arange(nb_dates)[:, None]
+    before_trough = np.where(valid & (rows <= trough), wealth, -np.inf)
+    peak = np.argmax(before_trough, axis=0)
+    peak_value = wealth[peak, np.arange(nb_series)]
+    recovered = valid & (rows > trough) & (wealth >= peak_value)
+    recovery = np.argmax(recovered, axis=0)
+
+    has_drawdown = has_data & (max_drawdown < 0)
+    nat = np.datetime64("NaT", "D")
+    return (
+        max_drawdown,
+        np.where(has_drawdown, dates[peak], nat),
+        np.where(has_drawdown, dates[trough], nat),
+        np.where(has_drawdown & recovered.any(axis=0), dates[recovery], nat),
+    )
+
+
+def _aligned(series: dict[Hashable, pd.Series], keys: list) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Union of the dates of several series, and their (dates x series) matrix, NaN where a series has no value
+    """
+    days = [pd.DatetimeIndex(series[key].index).to_numpy(dtype="datetime64[D]") for key in keys]
+    dates = np.unique(np.concatenate(days + [np.array([], dtype="datetime64[D]")]))
+    matrix = np.full((len(dates), len(keys)), np.nan)
+    for j, key in enumerate(keys):
+        matrix[np.searchsorted(dates, days[j]), j] = series[key].to_numpy(dtype=float)
+    return dates, matrix
+
+
+def _compacted(values: np.ndarray, valid: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Valid values of each column moved to its top rows, in order, and where each one came from.
+    Rolling windows are then taken over observations, whatever dates the other series have.
+    """
+    order = np.argsort(~valid, axis=0, kind="stable")
+    return np.take_along_axis(np.where(valid, values, 0), order, axis=0), order
+
+
+def compute_risk(returns: dict[Hashable, pd.Series], cumulative: dict[Hashable, pd.Series],
+                 risk_free: float = 0.0, windows: Optional[dict[str, int]] = None) -> RiskMatrix:
+    """
+    Risk statistics of several series at once.
+
+    Args:
+        returns: {key: daily returns indexed by date}
+        cumulative: {key: cumulative returns (wealth index) indexed by date}, for the drawdowns
+        risk_free: annual risk-free rate the Sharpe and Sortino ratios are measured against
+        windows: {label: number of returns} of the rolling statistics, ROLLING_WINDOWS if None.
+                 A rolling value needs a full window of the series' own returns.
+    """
+    windows = ROLLING_WINDOWS if windows is None else windows
+    keys = list(returns)
+
+    ret_dates, r = _aligned(returns, keys)
+    valid = ~np.isnan(r)
+    counts = valid.sum(axis=0)
+    excess = r - risk_free / PERIODS_PER_YEAR
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.nansum(r, axis=0) / counts
+        mean_excess = mean - risk_free / PERIODS_PER_YEAR
+        variance = np.nansum((r - mean) ** 2, axis=0) / (counts - 1)
+        volatility = np.where(counts >= 2, np.sqrt(variance * PERIODS_PER_YEAR), np.nan)
+        downside = np.sqrt(np.nansum(np.minimum(excess, 0) ** 2, axis=0) / counts * PERIODS_PER_YEAR)
+
+        sharpe = np.where(volatility > 0, mean_excess * PERIODS_PER_YEAR / volatility, np.nan)
+        sortino = np.where(downside > 0, mean_excess * PERIODS_PER_YEAR / downside, np.nan)
+
+        # Rolling statistics from cumulative sums over each series' observations, centered for accuracy
+        centered, order = _compacted(r - np.where(counts > 0, mean, 0), valid)
+        zeros = np.zeros((1, len(keys)))
+        sum_cumul = np.vstack([zeros, np.cumsum(centered, axis=0)])
+        square_cumul = np.vstack([zeros, np.cumsum(centered ** 2, axis=0)])
+        observations = np.arange(1, len(r) + 1)[:, None]
+
+        rolling_volatility, rolling_sharpe = {}, {}
+        for label, window in windows.items():
+            vol = np.full(r.shape, np.nan)
+            ratio = np.full(r.shape, np.nan)
+            if 2 <= window <= len(r):
+                sums = _window_sums(sum_cumul, window)
+                window_variance = np.maximum(_window_sums(square_cumul, window) - sums ** 2 / window, 0) / (window - 1)
+                full = (observations >= window) & (observations <= counts)
+                compact_vol = np.where(full, np.sqrt(window_variance * PERIODS_PER_YEAR), np.nan)
+                compact_mean = sums / window + mean_excess
+                compact_ratio = np.where(compact_vol > 0, compact_mean * PERIODS_PER_YEAR / compact_vol, np.nan)
+
+                # Back on the dates of the returns
+                np.put_along_axis(vol, order, compact_vol, axis=0)
+                np.put_along_axis(ratio, order, compact_ratio, axis=0)
+                vol[~valid] = ratio[~valid] = np.nan
+
+            rolling_volatility[label] = vol
+            rolling_sharpe[label] = ratio
+
+    wealth_dates, wealth = _aligned(cumulative, keys)
+    max_drawdown, peak_dates, trough_dates, recovery_dates = _drawdowns(wealth, wealth_dates)
+
+    return RiskMatrix(keys=keys, dates=ret_dates, volatility=volatility, sharpe=sharpe, sortino=sortino,
+                      max_drawdown=max_drawdown, peak_dates=peak_dates, trough_dates=trough_dates,
+                      recovery_dates=recovery_dates, rolling_volatility=rolling_volatility,
+                      rolling_sharpe=rolling_sharpe)
@@ -0,0 +1,14 @@
+"""
+Benchmark package for the quotes application.
+
+Measures the portfolio analytics hot paths on synthetic data, in a throwaway database:
+- seeding: synthetic instruments, prices, dividends, portfolios and orders
+- runner: timing of each hot path (cold and warm cache) with query counts
+"""
+from .seeding import seed_database
+from .runner import BenchmarkRunner
+
+__all__ = [
+    'seed_database',
+    'BenchmarkRunner',
+]
@@ -0,0 +1,114 @@
+"""
+Times the portfolio analytics hot paths, cold and warm cache, and counts their queries.
+"""
+from datetime import datetime, timedelta
+from statistics import mean, median
+from typing import Callable
+import platform
+import subprocess
+import time
+import django
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from quotes.models import Portfolio
+from quotes.utils.chart_creation import create_portfolio_chart, get_portfolio_performance
+from quotes.utils.chart_portfolio_util import performance_overview, create_allocation_chart, create_portfolio_performance_chart
+
+
+def _each(method: Callable) -> Callable:
+    """
+    Run a per-portfolio hot path on every portfolio
+    """
+    return lambda portfolios: [method(ptf) for ptf in portfolios]
+
+
+class BenchmarkRunner:
+    """
+    Runs every hot path `repeat` times on fresh Portfolio instances, with the cache cleared
+    before each run (cold) and after a priming run (warm).
+    """
+
+    def __init__(self, portfolio_ids: list[int], repeat: int = 3):
+        self.portfolio_ids = portfolio_ids
+        self.repeat = repeat
+
+        last_year = (datetime.today() - timedelta(days=365)).strftime("%Y-%m-%d")
+        today = datetime.today().strftime("%Y-%m-%d")
+
+        self.hot_paths: dict[str, Callable] = {
+            "get_inventory": _each(lambda ptf: ptf.get_inventory()),
+            "get_TS": _each(lambda ptf: ptf.get_TS()),
+            "get_many_TS": lambda portfolios: Portfolio.get_many_TS(portfolios),
+            "get_weights": _each(lambda ptf: ptf.get_weights()),
+            "get_individual_returns": _each(lambda ptf: ptf.get_individual_returns(last_year, today)),
+            "get_attribution": _each(lambda ptf: ptf.get_attribution()),
+            "performance_overview": _each(lambda ptf: performance_overview(ptf.id)),
+            "create_allocation_chart": _each(lambda ptf: create_allocation_chart(ptf.id)),
+            "create_portfolio_performance_chart": _each(lambda ptf: create_portfolio_performance_chart(ptf.id, "max")),
+            "create_portfolio_chart": lambda portfolios: create_portfolio_chart(portfolios, "Returns", "max", None),
+            "get_portfolio_performance": lambda portfolios: get_portfolio_performance(portfolios, portfolios[0].ts_val.index[-1]
+                                                                                      if portfolios[0].ts_val is not None else datetime.today().date()),
+        }
+
+    def _portfolios(self) -> list[Portfolio]:
+        """
+        Fresh instances, so that no series is memoized on them between runs
+        """
+        return list(Portfolio.objects.filter(id__in=self.portfolio_ids).select_related("owner").order_by("id"))
+
+    def _measure(self, hot_path: Callable, cold: bool) -> dict:
+        timings, queries = [], []
+
+        if not cold:
+            hot_path(self._portfolios())
+
+        for _ in range(self.repeat):
+            if cold:
+                cache.clear()
+            portfolios = self._portfolios()
+
+            with CaptureQueriesContext(connection) as ctx:
+                start = time.perf_counter()
+                hot_path(portfolios)
+                timings.append(time.perf_counter() - start)
+            queries.append(len(ctx.captured_queries))
+
+        return {
+            "min": min(timings),
+            "median": median(timings),
+            "mean": mean(timings),
+            "per_portfolio": median(timings) / len(self.portfolio_ids),
+            "queries": max(queries),
+        }
+
+    def run(self, only: list[str] | None = None) -> list[dict]:
+        """
+        Measure every hot path (or only some of them), returns one record per path and cache state
+        """
+        results = []
+        for name, hot_path in self.hot_paths.items():
+            if only and name not in only:
+                continue
+            for cold in (True, False):
+                results.append({"name": name, "cache": "cold" if cold else "warm", **self._measure(hot_path, cold)})
+        return results
+
+    @staticmethod
+    def metadata() -> dict:
+        """
+        Context to compare runs across commits
+        """
+        try:
+            commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            commit = None
+
+        return {
+            "commit": commit,
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "django": django.get_version(),
+            "database": connection.vendor,
+        }
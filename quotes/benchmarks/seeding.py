@@ -0,0 +1,68 @@
+"""
+Synthetic data for benchmarks: instruments with daily prices and dividends, portfolios with orders.
+"""
+from datetime import date
+import logging
+import numpy as np
+import pandas as pd
+
+from quotes.models import AccountOwner, Portfolio, FinancialObject, FinancialData, DataWatermark, Order
+from quotes.utils.chart_creation import user_colors
+
+logger = logging.getLogger(__name__)
+
+
+def seed_database(nb_portfolios: int, nb_orders: int, nb_instruments: int, nb_years: float,
+                  seed: int = 0, end: date | None = None) -> list[Portfolio]:
+    """
+    Fill the (empty, throwaway) database with synthetic data.
+
+    Args:
+        nb_portfolios: number of portfolios, spread over the owners known to the charts
+        nb_orders: number of orders per portfolio
+        nb_instruments: number of instruments, each with nb_years of business-day prices
+        nb_years: years of history
+    """
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range(end=end or date.today(), periods=int(nb_years * 252)).date
+
+    # Instruments, prices (geometric random walk) and quarterly dividends
+    fin_objs = FinancialObject.objects.bulk_create([
+        FinancialObject(name=f"Bench {i}", category=FinancialObject.ObjectType.ETF, isin=f"BENCH{i:07d}", ticker=f"BENCH{i}")
+        for i in range(nb_instruments)
+    ])
+    for fin_obj in fin_objs:
+        prices = rng.uniform(20, 200) * np.exp(np.cumsum(rng.normal(0.0003, 0.01, len(dates))))
+        rows = [FinancialData(id_object=fin_obj, date=d, field=FinancialData.TimeSeriesField.NAV, value=float(p),
+                              origin=FinancialData.DataOrigin.YF) for d, p in zip(dates, prices)]
+        rows += [FinancialData(id_object=fin_obj, date=dates[i], field=FinancialData.TimeSeriesField.Dividends,
+                               value=float(prices[i] * 0.005), origin=FinancialData.DataOrigin.YF)
+                 for i in range(int(rng.integers(0, 63)), len(dates), 63)]
+        FinancialData.objects.bulk_create(rows, batch_size=5000)
+    DataWatermark.rebuild()
+
+    # Portfolios, owned by the names the charts have a color for
+    owners = [AccountOwner.objects.get_or_create(name=name)[0] for name in user_colors]
+    portfolios = Portfolio.objects.bulk_create([
+        Portfolio(owner=owners[i % len(owners)], name=f"Bench {i}") for i in range(nb_portfolios)
+    ])
+
+    # Orders: mostly buys, sells never exceeding what is held
+    orders = []
+    for ptf in portfolios:
+        held = np.zeros(nb_instruments, dtype=int)
+        for day in np.sort(rng.integers(0, len(dates) - 1, nb_orders)):
+            j = int(rng.integers(0, nb_instruments))
+            if held[j] > 1 and rng.random() < 0.25:
+                nb, direction = int(rng.integers(1, held[j])), Order.OrderDirection.SELL
+                held[j] -= nb
+            else:
+                nb, direction = int(rng.integers(1, 50)), Order.OrderDirection.BUY
+                held[j] += nb
+            orders.append(Order(portfolio=ptf, id_object=fin_objs[j], date=dates[day], direction=direction,
+                                nb_items=nb, price=100, total_fee=1))
+    Order.objects.bulk_create(orders, batch_size=5000)
+
+    logger.info(f"Seeded {nb_instruments} instruments x {len(dates)} days, "
+                f"{nb_portfolios} portfolios x {nb_orders} orders")
+    return portfolios
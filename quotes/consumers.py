@@ -0,0 +1,28 @@
+"""
+Websocket consumers of the quotes application.
+"""
+import asyncio
+
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+
+from quotes import updates
+
+
+class PortfolioUpdatesConsumer(AsyncJsonWebsocketConsumer):
+    """
+    Pushes a data_updated event with the new points whenever the snapshots of a portfolio change:
+    ws/portfolios/ follows every portfolio, ws/portfolios/<pk>/ a single one
+    """
+
+    async def connect(self):
+        self.group = updates.portfolio_group(self.scope["url_route"]["kwargs"].get("pk"))
+        updates.subscribe(self.group, asyncio.get_running_loop())
+        await self.channel_layer.group_add(self.group, self.channel_name)
+        await self.accept()
+
+    async def disconnect(self, code):
+        await self.channel_layer.group_discard(self.group, self.channel_name)
+        updates.unsubscribe(self.group)
+
+    async def data_updated(self, event):
+        await self.send_json({"event": "data_updated", **{key: value for key, value in event.items() if key != "type"}})
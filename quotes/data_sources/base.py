@@ -1,12 +1,27 @@
 from abc import ABC, abstractmethod
 from datetime import date
-from typing import List, Tuple, Optional
+from typing import Dict, List, Tuple, Optional
 from enum import Enum
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 50
+
+
+def default_batch_size() -> int:
+    """
+    Max number of tickers fetched together, from settings.DATA_REFRESH["BATCH_SIZE"]
+    """
+    from django.conf import settings
+
+    return getattr(settings, "DATA_REFRESH", {}).get("BATCH_SIZE", DEFAULT_BATCH_SIZE)
 
 class SourceType(Enum):
     YAHOO_FINANCE = "Yahoo Finance"
     FMP = "Financial Modeling Prep"
     CUSTOM_PROVIDER = "Custom Provider"
+    REPLAY = "Replay"
 
 class DataSourceResult:
     """
@@ -33,6 +48,27 @@ class DataSource(ABC):
         """Fetch data since a specific date"""
         pass
 
+    def fetch_batch_data(self, requests: Dict[str, Optional[date]]) -> Dict[str, Optional[DataSourceResult]]:
+        """
+        Fetch many tickers at once, each one since its own date (full history if None).
+        Returns one result per requested ticker, None for the ones that failed.
+
+        Default implementation fetches tickers one by one; sources able to group
+        requests should override it.
+        """
+        results = {}
+        for ticker, since_date in requests.items():
+            try:
+                if since_date is None:
+                    results[ticker] = self.fetch_historical_data(ticker)
+                else:
+                    results[ticker] = self.fetch_incremental_data(ticker, since_date)
+            except Exception as e:
+                # One failing ticker must not fail the whole batch
+                logger.warning(f"{self.get_source_name()} failed for {ticker}: {e}")
+                results[ticker] = None
+        return results
+
     @abstractmethod
     def get_source_name(self) -> str:
         """Return the name of this data source"""
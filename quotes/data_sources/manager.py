@@ -1,27 +1,52 @@
 import logging
+import threading
 import time
-from typing import List, Optional
+from typing import Dict, List, Optional
 from datetime import date
 from .base import DataSource, DataSourceResult
 from .yahoo import YahooDataSource
 
 logger = logging.getLogger(__name__)
 
+class RateLimiter:
+    """
+    Spaces calls to a data source so that at most `rate` calls per second are made, across threads.
+    """
+
+    def __init__(self, rate: float):
+        self.interval = 1 / rate if rate else 0
+        self._lock = threading.Lock()
+        self._next_call = 0.0
+
+    def acquire(self):
+        """Block until the next call is allowed"""
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next_call - now
+            self._next_call = max(now, self._next_call) + self.interval
+
+        if wait > 0:
+            time.sleep(wait)
+
 class DataSourceManager:
     """
     Manages multiple data sources with fallback logic.
     Tries sources in order until one succeeds.
     """
     
-    def __init__(self, sources: Optional[List[DataSource]] = None):
+    def __init__(self, sources: Optional[List[DataSource]] = None, rate_limits: Optional[Dict[str, float]] = None):
         """
         Initialize with a list of data sources.
         If none provided, defaults to [YahooDataSource]
+
+        rate_limits optionally caps the calls per second made to each source, keyed by source name.
         """
         if sources is None:
             self.sources = [YahooDataSource()]
         else:
             self.sources = sources
+
+        self.rate_limiters = {name: RateLimiter(rate) for name, rate in (rate_limits or {}).items()}
         
         logger.info(f"DataSourceManager initialized with sources: {[s.get_source_name().value for s in self.sources]}")
 
@@ -37,10 +62,14 @@ class DataSourceManager:
         logger.info(f"Attempting {method_name} for {ticker}")
         
         for source in self.sources:
-            start_time = time.time()
             source_name = source.get_source_name().value
             
             logger.debug(f"Trying {source_name} for {ticker}")
+
+            if source_name in self.rate_limiters:
+                self.rate_limiters[source_name].acquire()
+
+            start_time = time.time()
             
             # Call the method dynamically
             method = getattr(source, method_name)
@@ -64,5 +93,39 @@ class DataSourceManager:
     def fetch_incremental_data(self, ticker: str, since_date: date) -> Optional[DataSourceResult]:
         """Try to fetch incremental data from available sources."""
         return self._try_sources('fetch_incremental_data', ticker, since_date=since_date)
-    
+
+    def fetch_batch_data(self, requests: Dict[str, Optional[date]]) -> Dict[str, Optional[DataSourceResult]]:
+        """
+        Fetch many tickers, each since its own date (full history if None).
+        Each source is only asked for the tickers all previous sources failed on.
+        """
+        results = {}
+        remaining = dict(requests)
+
+        for source in self.sources:
+            if not remaining:
+                break
+
+            source_name = source.get_source_name().value
+            logger.debug(f"Trying {source_name} for {len(remaining)} tickers")
+
+            if source_name in self.rate_limiters:
+                self.rate_limiters[source_name].acquire()
+
+            start_time = time.time()
+            fetched = source.fetch_batch_data(remaining)
+            duration = time.time() - start_time
+
+            succeeded = [ticker for ticker, result in fetched.items() if result and ticker in remaining]
+            for ticker in succeeded:
+                results[ticker] = fetched[ticker]
+                del remaining[ticker]
+
+            logger.info(f"✓ Fetched {len(succeeded)} tickers from {source_name} in {duration:.2f}s, "
+                        f"{len(remaining)} left for the next source")
+
+        if remaining:
+            logger.error(f"All data sources failed for {sorted(remaining)}")
+
+        return {ticker: results.get(ticker) for ticker in requests}
 
@@ -0,0 +1,209 @@
+import logging
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from datetime import date
+from typing import Callable, Dict, Iterable, List, Optional
+
+from django.conf import settings
+from tenacity import Retrying, retry_if_exception_type, retry_if_result, stop_after_attempt, wait_exponential
+
+from .base import DataSource, DataSourceResult, default_batch_size
+from .manager import DataSourceManager
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = 4
+DEFAULT_RATE_LIMITS = {"Yahoo Finance": 2.0}
+DEFAULT_MAX_ATTEMPTS = 3
+
+
+@dataclass
+class TickerRefresh:
+    """
+    Outcome of the refresh of one instrument
+    """
+    ticker: Optional[str]
+    name: str
+    id_object: Optional[int] = None
+    status: str = "pending"
+    attempts: int = 0
+    fetch_seconds: float = 0.0
+    write_seconds: float = 0.0
+    nb_prices: int = 0
+    nb_dividends: int = 0
+    error: Optional[str] = None
+
+
+@dataclass
+class RefreshReport:
+    """
+    Outcome of a whole refresh run
+    """
+    tickers: List[TickerRefresh] = field(default_factory=list)
+    total_seconds: float = 0.0
+
+    @property
+    def succeeded(self) -> List[TickerRefresh]:
+        return [t for t in self.tickers if t.status == "ok"]
+
+    @property
+    def failed(self) -> List[TickerRefresh]:
+        return [t for t in self.tickers if t.status == "failed"]
+
+    def summary(self) -> str:
+        """
+        Human readable table of per-ticker timings, followed by totals
+        """
+        lines = [f"{'Ticker':<14}{'Status':<9}{'Tries':>6}{'Fetch (s)':>11}{'Write (s)':>11}{'Prices':>8}{'Divs':>6}"]
+        for t in sorted(self.tickers, key=lambda t: -t.fetch_seconds):
+            lines.append(f"{(t.ticker or '-'):<14}{t.status:<9}{t.attempts:>6}{t.fetch_seconds:>11.2f}"
+                         f"{t.write_seconds:>11.2f}{t.nb_prices:>8}{t.nb_dividends:>6}")
+        for t in self.failed:
+            lines.append(f"FAILED {t.ticker} ({t.name}): {t.error}")
+        lines.append(f"{len(self.succeeded)} succeeded, {len(self.failed)} failed, "
+                     f"{len(self.tickers) - len(self.succeeded) - len(self.failed)} skipped "
+                     f"in {self.total_seconds:.2f}s")
+        return "\n".join(lines)
+
+
+class RefreshOrchestrator:
+    """
+    Refreshes prices and dividends of many instruments at once.
+
+    Tickers are fetched in batches (one multi-ticker request per batch when the source supports it)
+    by a pool of worker threads, each source being rate limited and failed tickers being retried
+    with exponential backoff. Every database write happens on the calling thread, one instrument
+    at a time, so that SQLite only ever sees a single writer.
+    """
+
+    def __init__(self, workers: Optional[int] = None, rate_limits: Optional[Dict[str, float]] = None,
+                 max_attempts: Optional[int] = None, sources: Optional[List[DataSource]] = None,
+                 batch_size: Optional[int] = None):
+        refresh_settings = getattr(settings, "DATA_REFRESH", {})
+        self.workers = workers or refresh_settings.get("WORKERS", DEFAULT_WORKERS)
+        self.max_attempts = max_attempts or refresh_settings.get("MAX_ATTEMPTS", DEFAULT_MAX_ATTEMPTS)
+        self.batch_size = batch_size or default_batch_size()
+        rate_limits = rate_limits if rate_limits is not None else refresh_settings.get("RATE_LIMITS", DEFAULT_RATE_LIMITS)
+
+        self.manager = DataSourceManager(sources=sources, rate_limits=rate_limits)
+
+    def _fetch_batch(self, requests: Dict[str, Optional[date]],
+                     outcomes: Dict[str, List[TickerRefresh]]) -> Dict[str, DataSourceResult]:
+        """
+        Fetch a batch of tickers, retrying the ones that failed with exponential backoff. Runs in a worker thread.
+        """
+        retrying = Retrying(
+            stop=stop_after_attempt(self.max_attempts),
+            wait=wait_exponential(multiplier=0.5, max=10),
+            retry=retry_if_result(bool) | retry_if_exception_type(Exception),
+            retry_error_callback=lambda retry_state: None,
+        )
+
+        start = time.time()
+        results = {}
+        remaining = dict(requests)
+
+        for attempt in retrying:
+            with attempt:
+                for ticker in remaining:
+                    for outcome in outcomes[ticker]:
+                        outcome.attempts += 1
+
+                fetched = self.manager.fetch_batch_data(remaining)
+                for ticker, result in fetched.items():
+                    if result and ticker in remaining:
+                        results[ticker] = result
+                        for outcome in outcomes[ticker]:
+                            outcome.fetch_seconds = time.time() - start
+                remaining = {ticker: since for ticker, since in remaining.items() if ticker not in results}
+
+            if not attempt.retry_state.outcome.failed:
+                attempt.retry_state.set_result(remaining)
+
+        for ticker in remaining:
+            for outcome in outcomes[ticker]:
+                outcome.fetch_seconds = time.time() - start
+
+        return results
+
+    def refresh(self, fin_objs: Iterable, full_history: bool = False,
+                on_batch: Optional[Callable[[], None]] = None) -> RefreshReport:
+        """
+        Refresh the given FinancialObjects, and return a report of what happened to each one.
+        With full_history, the whole history is fetched again and replaces the values stored.
+        on_batch is called on the calling thread once each batch is saved (e.g. to renew a lease).
+        """
+        start = time.time()
+        report = RefreshReport()
+
+        from quotes.models import DataWatermark
+
+        # Plan on the calling thread: database reads stay out of the workers
+        fin_objs = list(fin_objs)
+        watermarks = DataWatermark.for_instruments(fin_obj.id for fin_obj in fin_objs)
+        targets = defaultdict(list)
+        requests = {}
+        for fin_obj in fin_objs:
+            outcome = TickerRefresh(ticker=fin_obj.ticker, name=fin_obj.name, id_object=fin_obj.id)
+            report.tickers.append(outcome)
+            if not fin_obj.ticker:
+                outcome.status = "skipped"
+                continue
+
+            # Instruments whose stored closes are still adjusted ones are reloaded whole, never extended
+            reload = full_history or fin_obj.needs_reload()
+            last_date = None if reload else watermarks.get(fin_obj.id)
+            if fin_obj.ticker in requests:
+                # Same ticker on several instruments: fetch from the oldest need
+                known = requests[fin_obj.ticker]
+                last_date = None if known is None or last_date is None else min(known, last_date)
+            requests[fin_obj.ticker] = last_date
+            targets[fin_obj.ticker].append((fin_obj, outcome, reload))
+
+        outcomes = {ticker: [outcome for _, outcome, _ in objs] for ticker, objs in targets.items()}
+        tickers = list(requests)
+        batches = [{ticker: requests[ticker] for ticker in tickers[i:i + self.batch_size]}
+                   for i in range(0, len(tickers), self.batch_size)]
+
+        logger.info(f"Refreshing {len(tickers)} tickers in {len(batches)} batches with {self.workers} workers")
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="refresh") as pool:
+            futures = {pool.submit(self._fetch_batch, batch, outcomes): batch for batch in batches}
+
+            # Single writer: results are saved as batches arrive, on this thread only
+            for future in as_completed(futures):
+                results = future.result()
+
+                for ticker in futures[future]:
+                    for fin_obj, outcome, reload in targets[ticker]:
+                        if ticker not in results:
+                            outcome.status = "failed"
+                            outcome.error = f"no data after {outcome.attempts} attempt(s)"
+                            continue
+
+                        write_start = time.time()
+                        try:
+                            outcome.nb_prices, outcome.nb_dividends = fin_obj.save_nav_and_divs(results[ticker], overwrite=reload)
+                            outcome.status = "ok"
+                        except Exception as e:
+                            logger.exception(f"Could not save data for {fin_obj.ticker}")
+                            outcome.status = "failed"
+                            outcome.error = str(e)
+                        outcome.write_seconds = time.time() - write_start
+
+                if on_batch is not None:
+                    on_batch()
+
+        # Append the new rows to the columnar price store, once for the whole run
+        from quotes.price_store import PriceStore
+
+        store = PriceStore.default()
+        if store is not None and report.succeeded:
+            store.sync()
+
+        report.total_seconds = time.time() - start
+        logger.info(f"Refresh done: {len(report.succeeded)} succeeded, {len(report.failed)} failed "
+                    f"in {report.total_seconds:.2f}s")
+        return report
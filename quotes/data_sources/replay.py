@@ -0,0 +1,145 @@
+import logging
+import random
+import threading
+import time
+from datetime import date
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from .base import SourceType, DataSource, DataSourceResult
+
+logger = logging.getLogger(__name__)
+
+class ReplayDataSource(DataSource):
+    """
+    Offline data source serving prices and dividends from local fixture files, for reproducible
+    load testing and air-gapped environments.
+
+    Each ticker has its own file in `directory`, <ticker>.csv or <ticker>.parquet (parquet needs
+    pyarrow), with columns date, close and optionally dividends. Every call can be slowed down by
+    `latency` seconds and fail (return None) with probability `failure_rate`, to mimic a remote source.
+    """
+
+    def __init__(self, directory, latency: float = 0.0, failure_rate: float = 0.0, seed: Optional[int] = None):
+        self.directory = Path(directory)
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._frames: Dict[str, Optional[pd.DataFrame]] = {}
+
+    def get_source_name(self) -> str:
+        return SourceType.REPLAY
+
+    def _load(self, ticker: str) -> Optional[pd.DataFrame]:
+        """
+        Read (once) the fixture file of a ticker, None if there is none
+        """
+        with self._lock:
+            if ticker in self._frames:
+                return self._frames[ticker]
+
+        csv_path, parquet_path = self.directory / f"{ticker}.csv", self.directory / f"{ticker}.parquet"
+        if parquet_path.exists():
+            df = pd.read_parquet(parquet_path)
+        elif csv_path.exists():
+            df = pd.read_csv(csv_path)
+        else:
+            logger.warning(f"No replay fixture for ticker {ticker} in {self.directory}")
+            df = None
+
+        if df is not None:
+            df["date"] = pd.to_datetime(df["date"]).dt.date
+            if "dividends" not in df.columns:
+                df["dividends"] = 0.0
+            df = df.sort_values("date")
+
+        with self._lock:
+            self._frames[ticker] = df
+        return df
+
+    def _simulate_remote_call(self) -> bool:
+        """
+        Wait for the injected latency, and tell whether this call should fail
+        """
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            return self._random.random() < self.failure_rate
+
+    def _result(self, ticker: str, since_date: Optional[date]) -> Optional[DataSourceResult]:
+        df = self._load(ticker)
+        if df is None:
+            return None
+
+        if since_date is not None:
+            # Same convention as Yahoo Finance: the since_date itself is excluded
+            df = df[df["date"] > since_date]
+
+        prices = [(d, float(v)) for d, v in zip(df["date"], df["close"]) if not pd.isna(v)]
+        # Missing dividends (NaN, truthy) are no dividend, like zeros
+        dividends = [(d, float(v)) for d, v in zip(df["date"], df["dividends"]) if pd.notna(v) and v != 0]
+
+        logger.info(f"Replayed {len(prices)} prices and {len(dividends)} dividends for {ticker}")
+        return DataSourceResult(prices, dividends, self.get_source_name())
+
+    def fetch_historical_data(self, ticker: str) -> Optional[DataSourceResult]:
+        if self._simulate_remote_call():
+            logger.warning(f"Injected failure for ticker {ticker}")
+            return None
+        return self._result(ticker, None)
+
+    def fetch_incremental_data(self, ticker: str, since_date: date) -> Optional[DataSourceResult]:
+        if self._simulate_remote_call():
+            logger.warning(f"Injected failure for ticker {ticker}")
+            return None
+        return self._result(ticker, since_date)
+
+    def fetch_batch_data(self, requests: Dict[str, Optional[date]]) -> Dict[str, Optional[DataSourceResult]]:
+        """
+        One simulated round trip for the whole batch, failures drawn per ticker
+        """
+        if self.latency:
+            time.sleep(self.latency)
+
+        results = {}
+        for ticker, since_date in requests.items():
+            with self._lock:
+                failed = self._random.random() < self.failure_rate
+            results[ticker] = None if failed else self._result(ticker, since_date)
+        return results
+
+
+def generate_replay_fixtures(directory, nb_tickers: int, nb_years: float, file_format: str = "csv",
+                             seed: int = 0, end: Optional[date] = None, prefix: str = "SYN") -> List[str]:
+    """
+    Write synthetic fixtures for ReplayDataSource: nb_tickers files of nb_years of business-day
+    prices (geometric random walk) with quarterly dividends. Returns the generated tickers.
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    rng = np.random.default_rng(seed)
+
+    end = end or date.today()
+    dates = pd.bdate_range(end=end, periods=int(nb_years * 252))
+    tickers = [f"{prefix}{i:04d}" for i in range(nb_tickers)]
+
+    for ticker in tickers:
+        drift, vol = rng.normal(0.0003, 0.0002), rng.uniform(0.005, 0.02)
+        close = rng.uniform(20, 200) * np.exp(np.cumsum(rng.normal(drift, vol, len(dates))))
+        # Quarterly dividend of 0.5% of the price
+        dividends = np.zeros(len(dates))
+        first_payment = rng.integers(0, 63)
+        dividends[first_payment::63] = close[first_payment::63] * 0.005
+
+        df = pd.DataFrame({"date": dates.date, "close": close.round(4), "dividends": dividends.round(4)})
+        if file_format == "parquet":
+            df.to_parquet(directory / f"{ticker}.parquet", index=False)
+        else:
+            df.to_csv(directory / f"{ticker}.csv", index=False)
+
+    logger.info(f"Generated {nb_tickers} replay fixtures of {len(dates)} days in {directory}")
+    return tickers
@@ -0,0 +1,244 @@
+"""
+Scheduler of the market data refreshes: one refresh after each market close.
+
+Every close is a job of the RefreshJob table, created by whichever process sees it missing
+and claimed by a single worker (see RefreshJob.claim_due), so the scheduler can run as a
+standalone process (manage.py runscheduler), or in every web server process if
+REFRESH_IN_PROCESS is set, without refreshing twice. The worker renews its lease after each
+batch saved and around the cache warming, and only records the outcome of a job it still holds.
+Instruments that failed are retried with exponential backoff, on their own, and a job whose last
+attempt still failed on some of them ends Partial rather than Failed if the others were refreshed.
+Once a refresh completes, the portfolio series, risk statistics and home chart are computed, so
+that the first page loads after the close find them cached.
+"""
+from datetime import datetime, date, time, timedelta
+from socket import gethostname
+from typing import Callable, Optional
+from zoneinfo import ZoneInfo
+import logging
+import os
+import threading
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections
+from django.utils import timezone
+
+from quotes.data_sources.refresh import RefreshOrchestrator
+
+logger = logging.getLogger(__name__)
+
+_started = False
+
+
+def _config() -> dict:
+    return settings.REFRESH_SCHEDULER
+
+
+def _close_on(day: date) -> datetime:
+    config = _config()
+    return datetime.combine(day, time.fromisoformat(config["MARKET_CLOSE"]), tzinfo=ZoneInfo(config["MARKET_TIMEZONE"]))
+
+
+def last_close(now: datetime) -> datetime:
+    """
+    Most recent market close on or before a moment (business days only)
+    """
+    day = now.astimezone(ZoneInfo(_config()["MARKET_TIMEZONE"])).date()
+    while day.weekday() >= 5 or _close_on(day) > now:
+        day -= timedelta(days=1)
+    return _close_on(day)
+
+
+def next_close(after: datetime) -> datetime:
+    """
+    First market close strictly after a moment (business days only)
+    """
+    day = after.astimezone(ZoneInfo(_config()["MARKET_TIMEZONE"])).date()
+    while day.weekday() >= 5 or _close_on(day) <= after:
+        day += timedelta(days=1)
+    return _close_on(day)
+
+
+class RefreshFailed(Exception):
+    """
+    Some instruments could not be refreshed, the data of the others was saved
+    """
+
+    def __init__(self, message: str, failed_ids: list[int], partial: bool, summary: str):
+        super().__init__(message)
+        self.failed_ids = failed_ids
+        # Whether any instrument of the job was refreshed, by this attempt or a previous one
+        self.partial = partial
+        self.summary = summary
+
+
+class RefreshScheduler:
+    """
+    Creates, claims and runs the refresh jobs. run_once() does one round, run_forever() loops.
+    """
+
+    def __init__(self, orchestrator_factory: Callable[[], RefreshOrchestrator] = RefreshOrchestrator):
+        self.orchestrator_factory = orchestrator_factory
+        self.worker = f"{gethostname()}:{os.getpid()}"
+
+    def ensure_scheduled(self) -> "RefreshJob":
+        """
+        Job of the next refresh: the one pending or running, else the one of the next close
+        (of the last close if it was missed, so that it runs right away)
+        """
+        from quotes.models import RefreshJob
+
+        active = RefreshJob.objects.filter(status__in=[RefreshJob.Status.PENDING, RefreshJob.Status.RUNNING]).first()
+        if active is not None:
+            return active
+
+        latest = RefreshJob.objects.order_by("-slot").first()
+        missed = last_close(timezone.now())
+        slot = missed if latest is None or latest.slot < missed else next_close(latest.slot)
+        run_after = slot + timedelta(minutes=_config()["DELAY"])
+
+        try:
+            job, created = RefreshJob.objects.get_or_create(slot=slot, defaults={"run_after": run_after})
+        except IntegrityError:
+            # Created by another process in the meantime
+            job, created = RefreshJob.objects.get(slot=slot), False
+        if created:
+            logger.info(f"[scheduler] Next market data refresh scheduled at {run_after}")
+        return job
+
+    def run_due(self) -> Optional["RefreshJob"]:
+        """
+        Run the job due, if any and if no other worker took it first
+        """
+        from quotes.models import RefreshJob
+
+        job = RefreshJob.claim_due(self.worker, timedelta(seconds=_config()["LEASE"]))
+        if job is None:
+            return None
+
+        logger.info(f"[scheduler] Refreshing market data for the close of {job.slot} (attempt {job.attempts})")
+        try:
+            summary = self.refresh(job)
+        except Exception as e:
+            # Instruments that failed are the only ones retried, the data of the others is kept
+            failed_ids = e.failed_ids if isinstance(e, RefreshFailed) else None
+            if job.attempts < _config()["MAX_ATTEMPTS"]:
+                retry_at = timezone.now() + timedelta(seconds=_config()["RETRY_BACKOFF"] * 2 ** (job.attempts - 1))
+                if job.fail(str(e), retry_at=retry_at, retry_ids=failed_ids):
+                    logger.warning(f"[scheduler] Refresh for {job.slot} failed ({e}), retrying at {retry_at}")
+                    return job
+            elif isinstance(e, RefreshFailed) and e.partial:
+                if job.succeed_partially(e.summary, str(e)):
+                    logger.warning(f"[scheduler] Refresh for {job.slot} partially complete after {job.attempts} attempts: {e}")
+                    return job
+            elif job.fail(str(e)):
+                logger.exception(f"[scheduler] Refresh for {job.slot} failed after {job.attempts} attempts")
+                return job
+            self._lease_lost(job, f"its failure ({e}) was not recorded")
+            return job
+
+        if not job.succeed(summary):
+            self._lease_lost(job, "its data was saved but the job was not marked complete")
+            return job
+        logger.info(f"[scheduler] Refresh for {job.slot} complete")
+        return job
+
+    def refresh(self, job: "RefreshJob") -> str:
+        """
+        Fetch the data of the job's close unless already there, then extend and warm the portfolio series.
+        A retried job only fetches the instruments that failed before. The lease of the job is renewed
+        after each batch saved, and before and after the portfolio updates and the cache warming. Raises RefreshFailed if some instruments could not be refreshed.
+        """
+        from quotes.models import DataWatermark, FinancialObject
+        from quotes.signals import market_data_refreshed
+
+        expected = job.slot.astimezone(ZoneInfo(_config()["MARKET_TIMEZONE"])).date()
+        as_of = DataWatermark.as_of_date()
+        # Instruments still holding adjusted closes are reloaded even when the data is up to date
+        reloads = FinancialObject.objects.filter(closes_unadjusted=False).exclude(ticker__isnull=True).exclude(ticker="")
+        lease = timedelta(seconds=_config()["LEASE"])
+        if as_of is not None and as_of >= expected and not reloads.exists():
+            summary = f"Data already up to date (as of {as_of})"
+            self._renew(job, lease)
+            self.warm_caches()
+            self._renew(job, lease)
+            return summary
+
+        fin_objs = FinancialObject.objects.all()
+        if job.retry_ids:
+            fin_objs = fin_objs.filter(id__in=job.retry_ids)
+
+        report = self.orchestrator_factory().refresh(fin_objs, on_batch=lambda: self._renew(job, lease))
+        logger.info(f"[scheduler] Data refresh report:\n{report.summary()}")
+
+        # Whatever was fetched extends the snapshots, failures included
+        self._renew(job, lease)
+        market_data_refreshed.send(sender=RefreshScheduler)
+        self._renew(job, lease)
+        self.warm_caches()
+        self._renew(job, lease)
+
+        if report.failed:
+            # Partial if the job saved anything: in this attempt, or in a previous one (whose instruments are not retried)
+            refreshable = FinancialObject.objects.exclude(ticker__isnull=True).exclude(ticker="").count()
+            partial = bool(report.succeeded) or 0 < len(job.retry_ids) < refreshable
+            raise RefreshFailed(f"{len(report.failed)} instruments failed: "
+                                f"{', '.join(t.ticker or t.name for t in report.failed)}",
+                                failed_ids=[t.id_object for t in report.failed], partial=partial,
+                                summary=report.summary())
+        return report.summary()
+
+    def _renew(self, job: "RefreshJob", lease: timedelta) -> None:
+        if not job.renew(lease):
+            self._lease_lost(job, "another worker may run it")
+
+    @staticmethod
+    def _lease_lost(job: "RefreshJob", consequence: str) -> None:
+        logger.warning(f"[scheduler] Lease of the refresh for {job.slot} was lost: {consequence}")
+
+    def warm_caches(self) -> None:
+        """
+        Compute what the first page loads need: portfolio series, risk statistics and the home chart
+        """
+        from quotes.models import DataWatermark, Portfolio
+        from quotes.utils.chart_creation import home_chart_payload
+
+        try:
+            portfolios = list(Portfolio.objects.select_related("owner"))
+            DataWatermark.as_of_date()
+            Portfolio.get_many_TS(portfolios)
+            Portfolio.get_many_risk_statistics(portfolios)
+            home_chart_payload(portfolios)
+        except Exception:
+            logger.exception("[scheduler] Could not warm the portfolio caches")
+
+    def run_once(self) -> Optional["RefreshJob"]:
+        self.ensure_scheduled()
+        return self.run_due()
+
+    def run_forever(self, stop: Optional[threading.Event] = None) -> None:
+        """
+        Check for a job due every POLL seconds until stopped
+        """
+        stop = stop or threading.Event()
+        while not stop.is_set():
+            try:
+                self.run_once()
+            except Exception:
+                logger.exception("[scheduler] Scheduling round failed")
+            finally:
+                close_old_connections()
+            stop.wait(_config()["POLL"])
+
+
+def start_in_process() -> None:
+    """
+    Run the scheduler in a daemon thread of this server process, once, if REFRESH_IN_PROCESS is set.
+    Every server process may run one: a job is only ever claimed by one of them.
+    """
+    global _started
+    if _started or not _config()["IN_PROCESS"]:
+        return
+    _started = True
+    threading.Thread(target=RefreshScheduler().run_forever, name="refresh-scheduler", daemon=True).start()
+    logger.info("[scheduler] Market data refresh scheduler started")
@@ -1,9 +1,11 @@
 import yfinance as yf
 import logging
-from typing import Optional
+import pandas as pd
+from collections import defaultdict
+from typing import Dict, List, Optional
 from datetime import date, datetime, time
 
-from .base import SourceType, DataSource, DataSourceResult
+from .base import SourceType, DataSource, DataSourceResult, default_batch_size
 
 logger = logging.getLogger(__name__)
 
@@ -11,35 +13,68 @@ class YahooDataSource(DataSource):
     """
     Yahoo Finance data source implementation.
     """
+
     def get_source_name(self) -> str:
         return SourceType.YAHOO_FINANCE
+
+    def _parse(self, ticker: str, df: pd.DataFrame) -> Optional[DataSourceResult]:
+        """
+        Turn a Yahoo Finance frame (Close and Dividends columns) into a DataSourceResult.
+        Frames are requested with auto_adjust=False: Close is the traded price, not adjusted for
+        dividends, which are stored on their own and only added back by total return series.
+        """
+        df = df.dropna(subset=["Close"])
+
+        if df.shape[0] == 0:
+            logger.warning(f"No data returned from Yahoo Finance for ticker {ticker}")
+            return None
+        
+        # Extract prices and dividends
+        prices = list(df["Close"].items())
+        divs = list(df["Dividends"][df["Dividends"] != 0].items())
+
+        # Convert to (date, value) tuples
+        prices = [(i.date(), float(price)) for i, price in prices]
+        dividends = [(i.date(), float(div)) for i, div in divs]
+        
+        logger.info(f"Successfully fetched {len(prices)} prices and {len(dividends)} dividends for {ticker}")
+        
+        return DataSourceResult(prices, dividends, self.get_source_name())
     
     def _fetch_and_parse(self, ticker: str, **history_kwargs) -> Optional[DataSourceResult]:
         try:
             stock = yf.Ticker(ticker)
-            df = stock.history(**history_kwargs)
-
-            if df.shape[0] == 0:
-                logger.warning(f"No data returned from Yahoo Finance for ticker {ticker}")
-                return None
-            
-            # Extract prices and dividends
-            prices = list(df["Close"].items())
-            divs = list(df["Dividends"][df["Dividends"] != 0].items())
-
-            # Convert to (date, value) tuples
-            prices = [(i.date(), float(price)) for i, price in prices]
-            dividends = [(i.date(), float(div)) for i, div in divs]
-            
-            logger.info(f"Successfully fetched {len(prices)} prices and {len(dividends)} dividends for {ticker}")
-            
-            return DataSourceResult(prices, dividends, self.get_source_name())
-        
+            return self._parse(ticker, stock.history(auto_adjust=False, **history_kwargs))
         
         except Exception as e:
             logger.error(f"Error fetching from Yahoo Finance for ticker {ticker}: {e}", exc_info=True)
             return None
 
+    def _download_and_parse(self, tickers: List[str], **download_kwargs) -> Dict[str, Optional[DataSourceResult]]:
+        """
+        One grouped yf.download call for several tickers sharing the same period
+        """
+        try:
+            df = yf.download(tickers, group_by="ticker", actions=True, auto_adjust=False,
+                             progress=False, threads=True, **download_kwargs)
+        except Exception as e:
+            logger.error(f"Error downloading {len(tickers)} tickers from Yahoo Finance: {e}", exc_info=True)
+            return {ticker: None for ticker in tickers}
+
+        results = {}
+        for ticker in tickers:
+            try:
+                if isinstance(df.columns, pd.MultiIndex):
+                    frame = df[ticker] if ticker in df.columns.get_level_values(0) else None
+                else:
+                    # Single ticker downloads may come back with flat columns
+                    frame = df if len(tickers) == 1 else None
+                results[ticker] = None if frame is None else self._parse(ticker, frame)
+            except Exception as e:
+                logger.error(f"Error parsing Yahoo Finance data for ticker {ticker}: {e}", exc_info=True)
+                results[ticker] = None
+        return results
+
     def fetch_historical_data(self, ticker: str) -> Optional[DataSourceResult]:
         logger.debug(f"Fetching historical data for {ticker}")
         return self._fetch_and_parse(ticker=ticker, period="max")
@@ -57,4 +92,34 @@ class YahooDataSource(DataSource):
             result.prices = [(d, v) for d, v in result.prices if d != since_date]
             result.dividends = [(d, v) for d, v in result.dividends if d != since_date]
         
-        return result
\ No newline at end of file
+        return result
+
+    def fetch_batch_data(self, requests: Dict[str, Optional[date]]) -> Dict[str, Optional[DataSourceResult]]:
+        """
+        Tickers sharing the same since-date are downloaded together, DATA_REFRESH["BATCH_SIZE"] at a time
+        """
+        batch_size = default_batch_size()
+        groups = defaultdict(list)
+        for ticker, since_date in requests.items():
+            groups[since_date].append(ticker)
+
+        results = {}
+        for since_date, tickers in groups.items():
+            for i in range(0, len(tickers), batch_size):
+                chunk = tickers[i:i + batch_size]
+
+                if since_date is None:
+                    logger.debug(f"Downloading historical data for {len(chunk)} tickers")
+                    results.update(self._download_and_parse(chunk, period="max"))
+                    continue
+
+                logger.debug(f"Downloading incremental data for {len(chunk)} tickers since {since_date}")
+                fetched = self._download_and_parse(chunk, start=datetime.combine(since_date, time.min), end=datetime.now())
+                for ticker, result in fetched.items():
+                    if result:
+                        # Filter out the since_date itself
+                        result.prices = [(d, v) for d, v in result.prices if d != since_date]
+                        result.dividends = [(d, v) for d, v in result.dividends if d != since_date]
+                    results[ticker] = result
+
+        return results
\ No newline at end of file
@@ -0,0 +1,59 @@
+import json
+import tempfile
+from pathlib import Path
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import override_settings
+from quotes.benchmarks import seed_database, BenchmarkRunner
+
+class Command(BaseCommand):
+    help="Time the portfolio analytics hot paths on synthetic data, in a throwaway SQLite database"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--portfolios", type=int, default=3)
+        parser.add_argument("--orders", type=int, default=200, help="Orders per portfolio")
+        parser.add_argument("--instruments", type=int, default=30)
+        parser.add_argument("--years", type=float, default=10, help="Years of daily history")
+        parser.add_argument("--repeat", type=int, default=3, help="Timed runs per hot path and cache state")
+        parser.add_argument("--only", nargs="*", help="Only these hot paths")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--output", default="benchmark.json", help="Where to write the JSON results")
+        parser.add_argument("--db-path", default=None, help="Throwaway database file (default: temporary file)")
+        parser.add_argument("--keep-db", action="store_true", help="Do not delete the throwaway database")
+
+    def handle(self, *args, **options):
+
+        # Throwaway database, tables created from the models (no data migration)
+        test_settings = connection.settings_dict.setdefault("TEST", {})
+        test_settings["NAME"] = options["db_path"] or str(Path(tempfile.mkdtemp()) / "benchmark.sqlite3")
+        test_settings["MIGRATE"] = False
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+
+        # Never touch the real cache
+        caches = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "benchmark"}}
+
+        try:
+            with override_settings(CACHES=caches):
+                portfolios = seed_database(nb_portfolios=options["portfolios"], 
+                                           nb_orders=options["orders"],
+                                           nb_instruments=options["instruments"], 
+                                           nb_years=options["years"], 
+                                           seed=options["seed"])
+
+                runner = BenchmarkRunner([ptf.id for ptf in portfolios], repeat=options["repeat"])
+                results = runner.run(only=options["only"])
+
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options["keep_db"])
+
+        report = {
+            "metadata": BenchmarkRunner.metadata(),
+            "parameters": {key: options[key] for key in ["portfolios", "orders", "instruments", "years", "repeat", "seed"]},
+            "results": results,
+        }
+        Path(options["output"]).write_text(json.dumps(report, indent=2))
+
+        print(f"{'Hot path':<38}{'Cache':<7}{'Median (ms)':>12}{'Queries':>9}")
+        for result in results:
+            print(f"{result['name']:<38}{result['cache']:<7}{result['median'] * 1000:>12.1f}{result['queries']:>9}")
+        print(f"Results written to {options['output']}")
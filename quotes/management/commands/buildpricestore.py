@@ -0,0 +1,19 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from quotes.price_store import PriceStore
+
+class Command(BaseCommand):
+    help="Build the memory-mapped price store from the FinancialData table, or append the rows added since"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rebuild", action="store_true", help="Rebuild from scratch instead of appending new rows")
+
+    def handle(self, *args, **options):
+
+        store = PriceStore.default()
+        if store is None:
+            raise CommandError("Price store disabled (PRICE_STORE_DIR is empty)")
+
+        start = time.time()
+        nb_rows = store.rebuild() if options["rebuild"] else store.sync()
+        print(f"{nb_rows} rows absorbed in {time.time() - start:.2f}s, store is in {store.directory}")
@@ -0,0 +1,46 @@
+from datetime import date
+import sys
+from django.core.management.base import BaseCommand
+from quotes.models import Portfolio
+from quotes.utils.data_export import EXPORT_FORMATS, portfolio_series_export, financial_data_export, stream_export
+
+class Command(BaseCommand):
+    help="Stream portfolio series or instrument price/dividend history to a CSV or Parquet file"
+
+    def add_arguments(self, parser):
+        parser.add_argument("dataset", choices=["portfolios", "financialdata"])
+        parser.add_argument("output", help="File to write, - for the standard output")
+        parser.add_argument("--format", choices=EXPORT_FORMATS, default="csv", help="parquet needs pyarrow")
+        parser.add_argument("--ids", type=int, nargs="*", help="Portfolio or instrument ids (default: all)")
+        parser.add_argument("--field", help="NAV or Dividends (financialdata only, default: both)")
+        parser.add_argument("--start", type=date.fromisoformat, help="First date, YYYY-MM-DD")
+        parser.add_argument("--end", type=date.fromisoformat, help="Last date, YYYY-MM-DD")
+
+    def handle(self, *args, **options):
+
+        try:
+            if options["dataset"] == "portfolios":
+                portfolios = Portfolio.objects.all()
+                if options["ids"]:
+                    portfolios = portfolios.filter(id__in=options["ids"])
+                export = portfolio_series_export(portfolios, options["start"], options["end"])
+            else:
+                export = financial_data_export(options["ids"], options["field"], options["start"], options["end"])
+            chunks = stream_export(export, options["format"])
+        except ValueError as e:
+            self.stderr.write(str(e))
+            return
+
+        to_stdout = options["output"] == "-"
+        output = sys.stdout.buffer if to_stdout else open(options["output"], "wb")
+        size = 0
+        try:
+            for chunk in chunks:
+                output.write(chunk)
+                size += len(chunk)
+        finally:
+            if not to_stdout:
+                output.close()
+
+        if not to_stdout:
+            print(f"Exported {options['dataset']} to {options['output']} ({size / 1e6:.1f} MB)")
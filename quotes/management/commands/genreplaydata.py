@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from quotes.models import FinancialObject
+from quotes.data_sources.replay import generate_replay_fixtures
+
+class Command(BaseCommand):
+    help="Generate synthetic price/dividend fixtures for the offline replay data source"
+
+    def add_arguments(self, parser):
+        parser.add_argument("directory", help="Where to write one fixture file per ticker")
+        parser.add_argument("--tickers", type=int, default=100, help="Number of tickers")
+        parser.add_argument("--years", type=float, default=10, help="Years of daily history per ticker")
+        parser.add_argument("--format", choices=["csv", "parquet"], default="csv", help="parquet needs pyarrow")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--register", action="store_true", help="Also declare the tickers as FinancialObjects")
+
+    def handle(self, *args, **options):
+
+        tickers = generate_replay_fixtures(options["directory"], 
+                                           nb_tickers=options["tickers"], 
+                                           nb_years=options["years"], 
+                                           file_format=options["format"], 
+                                           seed=options["seed"])
+        print(f"Generated {len(tickers)} fixtures in {options['directory']}")
+
+        if options["register"]:
+            known = set(FinancialObject.objects.filter(ticker__in=tickers).values_list("ticker", flat=True))
+            FinancialObject.objects.bulk_create([
+                FinancialObject(name=f"Synthetic {ticker}", category=FinancialObject.ObjectType.ETF, isin=ticker, ticker=ticker)
+                for ticker in tickers if ticker not in known
+            ])
+            print(f"Registered {len(tickers) - len(known)} new FinancialObjects")
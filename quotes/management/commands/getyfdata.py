@@ -1,15 +1,42 @@
 from django.core.management.base import BaseCommand, CommandError
 from quotes.models import FinancialObject, FinancialData, Portfolio
+from quotes.data_sources.refresh import RefreshOrchestrator
+from quotes.data_sources.replay import ReplayDataSource
+from quotes.signals import market_data_refreshed
 
 class Command(BaseCommand):
     help="Download from YF api all necessary data to get portfolio time series"
 
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=None, help="Number of concurrent fetches (default: settings.DATA_REFRESH)")
+        parser.add_argument("--rate-limit", type=float, default=None, help="Max Yahoo Finance calls per second")
+        parser.add_argument("--max-attempts", type=int, default=None, help="Attempts per ticker before giving up")
+        parser.add_argument("--reload-history", action="store_true",
+                            help="Fetch the whole history again and replace the stored values "
+                                 "(instruments still holding adjusted closes are always reloaded)")
+        parser.add_argument("--replay-dir", default=None, help="Replay local fixtures instead of calling Yahoo Finance")
+        parser.add_argument("--replay-latency", type=float, default=0.0, help="Seconds added to each replayed call")
+        parser.add_argument("--replay-failure-rate", type=float, default=0.0, help="Probability a replayed ticker fails")
+
     def handle(self, *args, **options):
 
         # Step 1: get all Financial Objects currently declared in DB
         fin_objs = FinancialObject.objects.all()
 
-        # Step 2: is first time or not?
-        for fin_obj in fin_objs:
-            print(fin_obj.name)
-            fin_obj.update_nav_and_divs()
+        # Step 2: fetch them concurrently, first time or not, and save them one by one
+        rate_limits = None if options["rate_limit"] is None else {"Yahoo Finance": options["rate_limit"]}
+        sources = None
+        if options["replay_dir"]:
+            sources = [ReplayDataSource(options["replay_dir"], 
+                                        latency=options["replay_latency"], 
+                                        failure_rate=options["replay_failure_rate"])]
+
+        orchestrator = RefreshOrchestrator(workers=options["workers"], 
+                                           rate_limits=rate_limits, 
+                                           max_attempts=options["max_attempts"],
+                                           sources=sources)
+        report = orchestrator.refresh(fin_objs, full_history=options["reload_history"])
+        print(report.summary())
+
+        # Step 3: extend portfolio snapshots with the new data
+        market_data_refreshed.send(sender=self.__class__)
@@ -0,0 +1,34 @@
+from time import perf_counter
+from django.core.management.base import BaseCommand
+from quotes.models import Portfolio
+from quotes.utils.order_import import IMPORT_FORMATS, import_orders, import_format
+
+class Command(BaseCommand):
+    help="Import the orders of a broker statement (CSV or XLSX) into a portfolio, all of them or none"
+
+    def add_arguments(self, parser):
+        parser.add_argument("portfolio", type=int, help="Portfolio id")
+        parser.add_argument("file", help="CSV or XLSX file with columns date, instrument, direction, nb_items, price, total_fee")
+        parser.add_argument("--format", choices=IMPORT_FORMATS, help="Default: from the file extension")
+        parser.add_argument("--dry-run", action="store_true", help="Only validate the file")
+
+    def handle(self, *args, **options):
+
+        portfolio = Portfolio.objects.get(id=options["portfolio"])
+        start = perf_counter()
+        try:
+            file_format = options["format"] or import_format(options["file"])
+            with open(options["file"], "rb") as file:
+                result = import_orders(portfolio, file, file_format, dry_run=options["dry_run"])
+        except ValueError as e:
+            self.stderr.write(str(e))
+            return
+
+        for error in result.errors:
+            self.stderr.write(error)
+        if result.errors:
+            self.stderr.write(f"{len(result.errors)} invalid rows: no order imported")
+            return
+
+        action = "Validated" if options["dry_run"] else "Imported"
+        print(f"{portfolio}: {action} {len(result.orders)} orders in {perf_counter() - start:.2f}s")
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from quotes.data_sources.scheduler import RefreshScheduler
+from quotes.updates import shared_layer
+
+class Command(BaseCommand):
+    help="Run the market data refresh scheduler as a standalone process (unless REFRESH_IN_PROCESS runs it in the web servers)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Run the refresh due, if any, and exit")
+
+    def handle(self, *args, **options):
+
+        if not shared_layer():
+            self.stderr.write("The in-memory channel layer does not reach the web servers: websocket clients "
+                              "will not be sent the refreshed data (see CHANNEL_LAYERS)")
+
+        scheduler = RefreshScheduler()
+        if not options["once"]:
+            print(f"Scheduler running as {scheduler.worker}, next refresh at {scheduler.ensure_scheduled().run_after}")
+            scheduler.run_forever()
+            return
+
+        job = scheduler.run_once()
+        if job is None:
+            print(f"No refresh due, next one at {scheduler.ensure_scheduled().run_after}")
+            return
+
+        if job.status == job.Status.SUCCEEDED:
+            print(f"Refresh for {job.slot} complete:\n{job.summary}")
+        elif job.status == job.Status.RUNNING:
+            self.stderr.write(f"Refresh for {job.slot}: lease lost to another worker, outcome not recorded")
+        else:
+            self.stderr.write(f"Refresh for {job.slot} failed ({job.status}): {job.last_error}")
@@ -0,0 +1,30 @@
+from datetime import date
+from django.core.management.base import BaseCommand
+from quotes.models import Portfolio
+
+class Command(BaseCommand):
+    help="Materialize the daily value/return series of portfolios in the PortfolioSnapshot table"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--portfolio", type=int, nargs="*", help="Portfolio ids (default: all)")
+        parser.add_argument("--rebuild", action="store_true", help="Recompute from inception instead of extending")
+
+    def handle(self, *args, **options):
+
+        portfolios = Portfolio.objects.all()
+        if options["portfolio"]:
+            portfolios = portfolios.filter(id__in=options["portfolio"])
+
+        if options["rebuild"]:
+            for ptf in portfolios:
+                ptf.invalidate_ts(date.min)
+
+        # All portfolios computed together, on one price panel
+        series = Portfolio.get_many_TS(portfolios)
+
+        for ptf in portfolios:
+            if ptf.id not in series:
+                self.stderr.write(f"{ptf}: No order data.")
+                continue
+
+            print(f"{ptf}: {ptf.snapshots.count()} snapshots")
@@ -0,0 +1,34 @@
+# Generated by Django 6.0.2 on 2026-10-17 08:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quotes', '0013_financialdata_add_index'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='order',
+            options={'ordering': ['date']},
+        ),
+        migrations.CreateModel(
+            name='PortfolioSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('value', models.FloatField(null=True)),
+                ('daily_return', models.FloatField(null=True)),
+                ('cumulative_return', models.FloatField(null=True)),
+                ('portfolio', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='snapshots', to='quotes.portfolio')),
+            ],
+            options={
+                'ordering': ['date'],
+                'indexes': [models.Index(fields=['portfolio', 'date'], name='snapshot_ptf_date_idx')],
+                'unique_together': {('portfolio', 'date')},
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.0.2 on 2026-10-17 09:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quotes', '0014_portfoliosnapshot'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='financialdata',
+            name='origin',
+            field=models.CharField(choices=[('Yahoo Finance', 'Yf'), ('Provider', 'Provider'), ('Financial Times', 'Ft'), ('Replay', 'Replay')], max_length=20),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 6.0.2 on 2026-10-17 10:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def fill_watermarks(apps, schema_editor):
+
+    FinancialData = apps.get_model("quotes", "FinancialData")
+    DataWatermark = apps.get_model("quotes", "DataWatermark")
+
+    rows = FinancialData.objects.order_by().values_list("id_object_id", "field").annotate(latest=Max("date"))
+    DataWatermark.objects.bulk_create([
+        DataWatermark(id_object_id=id_object, field=field, latest_date=latest)
+        for id_object, field, latest in rows
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quotes', '0015_financialdata_origin_replay'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DataWatermark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('field', models.CharField(choices=[('NAV', 'Nav'), ('Dividends', 'Dividends')], max_length=15)),
+                ('latest_date', models.DateField()),
+                ('id_object', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='watermarks', to='quotes.financialobject')),
+            ],
+            options={
+                'unique_together': {('id_object', 'field')},
+            },
+        ),
+        migrations.RunPython(fill_watermarks, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 6.0.2 on 2026-10-17 11:02
+
+from django.db import migrations, models
+
+
+def drop_snapshots(apps, schema_editor):
+    # Snapshots without total returns are materialized again, all columns filled, on next read
+    PortfolioSnapshot = apps.get_model("quotes", "PortfolioSnapshot")
+    PortfolioSnapshot.objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quotes', '0016_datawatermark'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='portfoliosnapshot',
+            name='total_cumulative_return',
+            field=models.FloatField(null=True),
+        ),
+        migrations.AddField(
+            model_name='portfoliosnapshot',
+            name='total_daily_return',
+            field=models.FloatField(null=True),
+        ),
+        migrations.AddField(
+            model_name='portfoliosnapshot',
+            name='total_value',
+            field=models.FloatField(null=True),
+        ),
+        migrations.RunPython(drop_snapshots, migrations.RunPython.noop),
+    ]
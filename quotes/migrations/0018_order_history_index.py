@@ -0,0 +1,17 @@
+# Generated by Django 6.0.2 on 2026-10-17 11:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quotes', '0017_snapshot_total_return'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['portfolio', 'date', 'id'], name='order_ptf_date_id_idx'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 6.0.2 on 2026-10-17 12:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quotes', '0018_order_history_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RefreshJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(default='market_data', max_length=50)),
+                ('slot', models.DateTimeField()),
+                ('run_after', models.DateTimeField()),
+                ('status', models.CharField(choices=[('Pending', 'Pending'), ('Running', 'Running'), ('Succeeded', 'Succeeded'), ('Failed', 'Failed')], default='Pending', max_length=10)),
+                ('attempts', models.IntegerField(default=0)),
+                ('worker', models.CharField(blank=True, max_length=100)),
+                ('lease_until', models.DateTimeField(blank=True, null=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('summary', models.TextField(blank=True)),
+                ('last_error', models.TextField(blank=True)),
+            ],
+            options={
+                'ordering': ['-slot'],
+                'indexes': [models.Index(fields=['status', 'run_after'], name='refreshjob_status_run_idx')],
+                'unique_together': {('name', 'slot')},
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 6.0.2 on 2026-10-17 13:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quotes', '0019_refresh_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='portfolio',
+            name='ts_changed_from',
+            field=models.DateField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='portfolio',
+            name='ts_changes',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 6.0.2 on 2026-10-17 14:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quotes', '0020_portfolio_ts_changed_from'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='refreshjob',
+            name='retry_ids',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AlterField(
+            model_name='refreshjob',
+            name='status',
+            field=models.CharField(choices=[('Pending', 'Pending'), ('Running', 'Running'), ('Succeeded', 'Succeeded'), ('Partial', 'Partial'), ('Failed', 'Failed')], default='Pending', max_length=10),
+        ),
+    ]
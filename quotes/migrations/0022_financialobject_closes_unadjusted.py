@@ -0,0 +1,18 @@
+# Generated by Django 6.0.2 on 2026-10-17 15:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quotes', '0021_refresh_job_retry_ids'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='financialobject',
+            name='closes_unadjusted',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+    ]
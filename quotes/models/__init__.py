@@ -5,9 +5,12 @@ This package contains all Django models organized by domain:
 - financial_object: FinancialObject (stocks, ETFs, indices)
 - account: AccountOwner
 - portfolio: Portfolio, PortfolioEntry, PortfolioInventory
+- portfolio_snapshot: PortfolioSnapshot (materialized portfolio series)
 - order: Order
 - financial_data: FinancialData (time series data)
-- yahoo_finance: YahooFinanceQuery (utility class)
+- data_watermark: DataWatermark (most recent date stored per instrument and field)
+- refresh_job: RefreshJob (scheduled market data refreshes)
+- yahoo_finance: YahooFinanceQuery (utility class), InstrumentPanel
 """
 import django_stubs_ext
 django_stubs_ext.monkeypatch()
@@ -15,9 +18,12 @@ django_stubs_ext.monkeypatch()
 from .financial_object import FinancialObject
 from .account import AccountOwner
 from .portfolio import Portfolio, PortfolioEntry, PortfolioInventory
+from .portfolio_snapshot import PortfolioSnapshot
 from .order import Order
 from .financial_data import FinancialData
-from .yahoo_finance import YahooFinanceQuery
+from .data_watermark import DataWatermark
+from .refresh_job import RefreshJob
+from .yahoo_finance import YahooFinanceQuery, InstrumentPanel
 
 __all__ = [
     'FinancialObject',
@@ -25,7 +31,11 @@ __all__ = [
     'Portfolio',
     'PortfolioEntry',
     'PortfolioInventory',
+    'PortfolioSnapshot',
     'Order',
     'FinancialData',
+    'DataWatermark',
+    'RefreshJob',
     'YahooFinanceQuery',
+    'InstrumentPanel',
 ]
@@ -0,0 +1,123 @@
+"""
+DataWatermark model - most recent date stored per instrument and field, maintained by ingestion
+and by the FinancialData signal receivers for rows written one by one or updated in bulk.
+"""
+from datetime import date, timedelta
+from typing import Iterable, Optional
+from django.db import models
+from django.db.models import Max
+
+from .financial_object import FinancialObject
+from .financial_data import FinancialData
+
+AS_OF_DATE_CACHE_KEY = "data_as_of_date"
+
+
+class DataWatermark(models.Model):
+
+    # Instruments whose prices stopped this long before the most recent ones (delisted,
+    # no longer fetched) do not hold the consistent as-of date back
+    STALE_AFTER = timedelta(days=7)
+
+    class Meta:
+        unique_together = [('id_object', 'field')]
+
+    id_object = models.ForeignKey(FinancialObject, on_delete=models.CASCADE, related_name="watermarks")
+    field = models.CharField(max_length=15, choices=FinancialData.TimeSeriesField.choices)
+    latest_date = models.DateField()
+
+    def __str__(self):
+        return f"{self.id_object} | {self.field} | {self.latest_date}"
+
+    @staticmethod
+    def advance(fin_obj: FinancialObject, latest_dates: dict[str, date]) -> dict[str, date]:
+        """
+        Move the watermarks of an instrument forward to the dates just saved ({field: date}).
+        Called by the ingestion path after every write. Returns the watermarks before the move.
+        """
+        from django.core.cache import cache
+
+        current = dict(DataWatermark.objects.filter(id_object=fin_obj).values_list("field", "latest_date"))
+        moved = [DataWatermark(id_object=fin_obj, field=field, latest_date=latest)
+                 for field, latest in latest_dates.items()
+                 if latest is not None and (field not in current or latest > current[field])]
+
+        if moved:
+            DataWatermark.objects.bulk_create(moved, update_conflicts=True,
+                                              unique_fields=["id_object", "field"], update_fields=["latest_date"])
+            cache.delete(AS_OF_DATE_CACHE_KEY)
+        return current
+
+    @staticmethod
+    def recompute(id_object: int, fields: Iterable[str] = tuple(FinancialData.TimeSeriesField.values)) -> None:
+        """
+        Watermarks of one instrument read back from its FinancialData rows, after rows were
+        deleted or modified outside ingestion
+        """
+        from django.core.cache import cache
+
+        fields = list(fields)
+        latest = dict(FinancialData.objects.filter(id_object_id=id_object, field__in=fields).order_by()
+                      .values_list("field").annotate(latest=Max("date")))
+        for field in fields:
+            if field in latest:
+                DataWatermark.objects.update_or_create(id_object_id=id_object, field=field,
+                                                       defaults={"latest_date": latest[field]})
+            else:
+                DataWatermark.objects.filter(id_object_id=id_object, field=field).delete()
+        cache.delete(AS_OF_DATE_CACHE_KEY)
+
+    @staticmethod
+    def rebuild() -> int:
+        """
+        Recompute every watermark from the FinancialData table, for data written outside ingestion
+        """
+        from django.core.cache import cache
+        from quotes.utils.chart_cache import bump_market_data_version
+
+        rows = FinancialData.objects.order_by().values_list("id_object_id", "field").annotate(latest=Max("date"))
+        watermarks = [DataWatermark(id_object_id=id_object, field=field, latest_date=latest)
+                      for id_object, field, latest in rows]
+
+        DataWatermark.objects.all().delete()
+        DataWatermark.objects.bulk_create(watermarks, batch_size=1000)
+        cache.delete(AS_OF_DATE_CACHE_KEY)
+        bump_market_data_version()
+        return len(watermarks)
+
+    @staticmethod
+    def latest(id_object: int, field: str = FinancialData.TimeSeriesField.NAV) -> Optional[date]:
+        """
+        Most recent date stored for one instrument and field, None if it has no data
+        """
+        return (DataWatermark.objects.filter(id_object=id_object, field=field)
+                .values_list("latest_date", flat=True).first())
+
+    @staticmethod
+    def for_instruments(id_objects: Iterable[int], field: str = FinancialData.TimeSeriesField.NAV) -> dict[int, date]:
+        """
+        {FinancialObject id: most recent date} in one query. Instruments without data are left out.
+        """
+        return dict(DataWatermark.objects.filter(id_object__in=list(id_objects), field=field)
+                    .values_list("id_object_id", "latest_date"))
+
+    @staticmethod
+    def as_of_date() -> Optional[date]:
+        """
+        Most recent date on which every instrument still being updated has a price.
+        Cached until the next watermark change.
+        """
+        from django.core.cache import cache
+
+        as_of = cache.get(AS_OF_DATE_CACHE_KEY)
+        if as_of is None:
+            dates = list(DataWatermark.objects.filter(field=FinancialData.TimeSeriesField.NAV)
+                         .values_list("latest_date", flat=True))
+            if not dates:
+                return None
+
+            most_recent = max(dates)
+            as_of = min(d for d in dates if d >= most_recent - DataWatermark.STALE_AFTER)
+            cache.set(AS_OF_DATE_CACHE_KEY, as_of, timeout=None)
+
+        return as_of
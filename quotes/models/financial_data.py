@@ -2,11 +2,45 @@
 FinancialData model - stores time series data (prices, dividends, etc.)
 """
 from django.db import models
+from django.db.models import Min
 from datetime import date
 
 from .financial_object import FinancialObject
 
 
+class FinancialDataQuerySet(models.QuerySet):
+    """
+    update() and bulk_update() send no post_save signal: they send financial_data_updated instead,
+    with the first date changed per instrument, so that the price store, portfolio series and charts
+    react as they do for rows saved one by one
+    """
+
+    def update(self, **kwargs):
+        from quotes.signals import financial_data_updated
+
+        changes = dict(self.order_by().values_list("id_object_id").annotate(first_date=Min("date")))
+        if isinstance(kwargs.get("date"), date):
+            changes = {id_object: min(first_date, kwargs["date"]) for id_object, first_date in changes.items()}
+
+        nb_rows = super().update(**kwargs)
+        if nb_rows:
+            financial_data_updated.send(sender=FinancialData, changes=changes)
+        return nb_rows
+
+    def bulk_update(self, objs, fields, batch_size=None):
+        from quotes.signals import financial_data_updated
+
+        objs = list(objs)
+        nb_rows = super().bulk_update(objs, fields, batch_size=batch_size)
+
+        changes = {}
+        for obj in objs:
+            changes[obj.id_object_id] = min(obj.date, changes.get(obj.id_object_id, obj.date))
+        if nb_rows:
+            financial_data_updated.send(sender=FinancialData, changes=changes)
+        return nb_rows
+
+
 class FinancialData(models.Model):
 
     class TimeSeriesField(models.TextChoices):
@@ -17,6 +51,7 @@ class FinancialData(models.Model):
         YF = "Yahoo Finance"
         PROVIDER = "Provider"
         FT = "Financial Times"
+        REPLAY = "Replay"
 
     class Meta:
         ordering = ["-date"]
@@ -31,13 +66,16 @@ class FinancialData(models.Model):
     value = models.FloatField(default=0)
     origin = models.CharField(max_length=20, choices = DataOrigin.choices)
 
+    objects = FinancialDataQuerySet.as_manager()
+
     def __str__(self):
         return f"object: {self.id_object}, date: {self.date}, value: {self.value}"
     
     @staticmethod          
     def get_price_most_recent_date() -> date:
         """
-        Get the second most recent date from price dates, in case all values were not updated to the most recent one
+        Most recent date on which prices are available for every instrument still being updated
         """
-        dates = sorted(FinancialData.objects.values_list("date", flat=True).distinct(), reverse=True)
-        return dates[1] if len(dates) > 1 else dates[0]
+        from .data_watermark import DataWatermark
+
+        return DataWatermark.as_of_date()
@@ -1,11 +1,14 @@
 """
 FinancialObject model - represents stocks, ETFs, indices, etc.
 """
-from typing import Iterable, Optional
+from typing import Iterable, Optional, TYPE_CHECKING
 from django.db import models
 from datetime import date, datetime, time
 import logging
 
+if TYPE_CHECKING:
+    from quotes.analytics import ReturnsMatrix
+
 logger = logging.getLogger(__name__)
 
 class FinancialObject(models.Model):
@@ -20,138 +23,178 @@ class FinancialObject(models.Model):
     category = models.CharField(max_length=10, choices=ObjectType.choices)
     isin = models.CharField(max_length=12)
     ticker = models.CharField(max_length=12, blank=True, null=True)
+    # Stored closes are traded prices, not dividend-adjusted ones: until the history is reloaded
+    # once with them, every refresh fetches it whole and replaces the stored values
+    closes_unadjusted = models.BooleanField(default=False, editable=False)
 
     def __str__(self):
         return f"{self.category} - {self.name}"
 
     def get_latest_available_nav(self):
         """
-        Queries FinancialData table to see until when data has been populated.
+        Until when data has been populated, read from the watermark maintained by ingestion.
         """
-        from .financial_data import FinancialData
-        
-        if (FinancialData.objects.filter(id_object=self.id).exists()):
-            return FinancialData.objects.filter(id_object=self.id).order_by("-date").first().date
-        else:
-            return None
+        from .data_watermark import DataWatermark
+
+        return DataWatermark.latest(self.id)
 
     def update_nav_and_divs(self):
         """
         Updates time series
         """
-        from .financial_data import FinancialData
         from quotes.data_sources.manager import DataSourceManager
+        from quotes.price_store import PriceStore
 
         manager = DataSourceManager()
-        last_date = self.get_latest_available_nav()
+        reload = self.needs_reload()
+        result = self.fetch_nav_and_divs(manager, None if reload else self.get_latest_available_nav())
+        self.save_nav_and_divs(result, overwrite=reload)
+
+        store = PriceStore.default()
+        if store is not None:
+            store.sync()
+
+    def needs_reload(self) -> bool:
+        """
+        True while the stored history may hold dividend-adjusted closes: new unadjusted days must
+        not be appended to it, the whole history is fetched and replaced instead
+        """
+        return not self.closes_unadjusted
 
+    def fetch_nav_and_divs(self, manager, last_date: Optional[date]):
+        """
+        Fetch prices and dividends after last_date (full history if None). Network only, no database access.
+        """
         if last_date is None:
             logger.info(f"Fetching historical data for {self.ticker}")
-            result = manager.fetch_historical_data(self.ticker)
+            return manager.fetch_historical_data(self.ticker)
         else:
             logger.info(f"Fetching incremental data for {self.ticker} since {last_date}")
-            result = manager.fetch_incremental_data(self.ticker, last_date)
+            return manager.fetch_incremental_data(self.ticker, last_date)
+
+    def save_nav_and_divs(self, result, overwrite: bool = False) -> tuple[int, int]:
+        """
+        Save fetched prices and dividends, skipping rows already stored, or replacing their values
+        if overwrite is set (history reloaded). Returns (nb prices, nb dividends) saved.
+        """
+        from .financial_data import FinancialData
+        from .data_watermark import DataWatermark
+        from .portfolio import Portfolio
+        from quotes.utils.chart_cache import bump_market_data_version
 
         if not result:
             logger.warning(f"No data fetched for {self.ticker}")
-            return
-        
-        # Save prices to database
-        price_data = []
-        for date_val, price_val in result.prices:
-            price_data.append(FinancialData(
-                id_object=self,
-                date=date_val,
-                field="NAV",
-                value=price_val,
-                origin=result.source_name.value
-            ))
-
-        if price_data:
-            created = FinancialData.objects.bulk_create(price_data, ignore_conflicts=True)
-            logger.info(f"Saved {len(created)} new price records for {self.ticker} (skipped duplicates)")
-
-        # Save dividends to database
-        div_data = []
-        for date_val, div_val in result.dividends:
-            div_data.append(
-                FinancialData(
-                    id_object=self,
-                    date=date_val,
-                    field="Dividends",
-                    value=div_val,
-                    origin=result.source_name.value
-                )
-            )
+            return 0, 0
         
-        if div_data:
-            created = FinancialData.objects.bulk_create(div_data, ignore_conflicts=True)
-            logger.info(f"Saved {len(created)} new dividend records for {self.ticker} (skipped duplicates)")
+        # Save prices and dividends to database
+        price_dates = self._save_new_rows(FinancialData.TimeSeriesField.NAV, result.prices, result.source_name.value,
+                                          overwrite)
+        nb_prices = len(price_dates)
+        if result.prices:
+            logger.info(f"Saved {nb_prices} new price records for {self.ticker} (skipped duplicates)")
+
+        div_dates = self._save_new_rows(FinancialData.TimeSeriesField.Dividends, result.dividends, result.source_name.value,
+                                        overwrite)
+        nb_divs = len(div_dates)
+        if result.dividends:
+            logger.info(f"Saved {nb_divs} new dividend records for {self.ticker} (skipped duplicates)")
+
+        previous = DataWatermark.advance(self, {
+            FinancialData.TimeSeriesField.NAV: max((d for d, _ in result.prices), default=None),
+            FinancialData.TimeSeriesField.Dividends: max((d for d, _ in result.dividends), default=None),
+        })
+
+        # Rows older than the data already stored (backfill) come before the checkpoints of the portfolio series
+        backfilled = [d for field, dates in ((FinancialData.TimeSeriesField.NAV, price_dates),
+                                             (FinancialData.TimeSeriesField.Dividends, div_dates))
+                      if field in previous for d in dates if d <= previous[field]]
+        if backfilled:
+            Portfolio.invalidate_holders(self.id, min(backfilled))
+        if nb_prices or nb_divs:
+            bump_market_data_version()
+        if overwrite and result.prices and not self.closes_unadjusted:
+            # The whole history was replaced: later refreshes may append to it
+            self.closes_unadjusted = True
+            FinancialObject.objects.filter(id=self.id).update(closes_unadjusted=True)
+
+        return nb_prices, nb_divs
+
+    def _save_new_rows(self, field: str, rows: list[tuple[date, float]], origin: str,
+                       overwrite: bool = False) -> list[date]:
+        """
+        Insert the (date, value) rows of a field that are not stored yet, and update the values of the
+        stored ones that differ if overwrite is set. Returns the dates inserted.
+        """
+        from .financial_data import FinancialData
 
+        if not rows:
+            return []
+
+        # bulk_create(ignore_conflicts=True) returns every row it was given, inserted or not:
+        # the dates already stored are left out beforehand, with one range query
+        dates = [date_val for date_val, _ in rows]
+        stored = {row.date: row for row in FinancialData.objects.filter(id_object=self, field=field, date__gte=min(dates),
+                                                                         date__lte=max(dates))
+                  .only("id", "id_object", "date", "value")}
+
+        new_rows, changed_rows = {}, {}
+        for date_val, value in rows:
+            if date_val not in stored:
+                new_rows[date_val] = FinancialData(id_object=self, date=date_val, field=field, value=value, origin=origin)
+            elif overwrite and stored[date_val].value != value:
+                row = stored[date_val]
+                row.value, row.origin = value, origin
+                changed_rows[date_val] = row
+
+        FinancialData.objects.bulk_create(list(new_rows.values()), ignore_conflicts=True)
+        if changed_rows:
+            # Sends financial_data_updated: the price store, watermarks and portfolio series follow
+            FinancialData.objects.bulk_update(list(changed_rows.values()), ["value", "origin"], batch_size=500)
+            logger.info(f"Replaced {len(changed_rows)} {field} values for {self.ticker}")
+        return list(new_rows)
+
+    @staticmethod
+    def get_many_returns(instruments: Iterable["FinancialObject | int"],
+                         windows: Iterable[tuple[date, date | None]]) -> "ReturnsMatrix":
+        """
+        Price, dividend and total returns of many instruments over many (start, end) windows, as
+        (instruments x windows) arrays. An end date of None means today.
+
+        Prices and dividends of every instrument are loaded in one query (or from the price store)
+        over the span of all windows, whatever the number of instruments and windows.
+        """
+        from .yahoo_finance import YahooFinanceQuery
+        from quotes.analytics import ReturnsMatrix, compute_returns
+
+        ids = [instrument if isinstance(instrument, int) else instrument.id for instrument in instruments]
+        today = datetime.today().date()
+        windows = [(start, today if end is None else end) for start, end in windows]
+
+        panel = YahooFinanceQuery.get_panel(ids, min((start for start, _ in windows), default=today),
+                                            max((end for _, end in windows), default=today))
+
+        # Panel columns are sorted and unique: back to the requested order
+        columns = [panel.ids.index(id) for id in ids]
+        price, dividend, total = compute_returns(panel.dates, panel.nav[:, columns], panel.dividends[:, columns], windows)
+        return ReturnsMatrix(ids=ids, windows=windows, price=price, dividend=dividend, total=total)
 
     def get_price_return(self, start_date: date, end_date: date | None = None) -> float | None:
         """
         Get Price Return between 2 dates
         """
-        from .financial_data import FinancialData
-
-        if end_date is None:
-            end_date = datetime.today().date()
-
-        ini_nav = FinancialData.objects.filter(
-            id_object=self, 
-            date__gte=start_date, 
-            field="NAV", 
-            origin="Yahoo Finance").order_by("date").values_list("value", flat=True).first()
-        
-        end_nav = FinancialData.objects.filter(
-            id_object=self, 
-            date__lte=end_date, 
-            field="NAV", 
-            origin="Yahoo Finance").order_by("-date").values_list("value", flat=True).first()
-
-        if ini_nav is None or end_nav is None:
-            return None
-        
-        return end_nav / ini_nav -1
+        window = (start_date, end_date or datetime.today().date())
+        return FinancialObject.get_many_returns([self], [window]).get(self.id, window, "price")
     
     def get_div_return(self, start_date: date, end_date: date | None = None) -> float | None:
         """
         Get Dividend Return between 2 dates
         """
-        from .financial_data import FinancialData
-
-        if end_date is None:
-            end_date = datetime.today().date()
-
-        divs = FinancialData.objects.filter(
-            id_object=self, 
-            date__gte=start_date, 
-            date__lte=end_date, 
-            field="Dividends", 
-            origin="Yahoo Finance").values_list("value", flat=True)
-
-        total_divs = sum(divs)
-
-        ini_nav = FinancialData.objects.filter(
-            id_object=self, 
-            date__gte=start_date, 
-            field="NAV", 
-            origin="Yahoo Finance").order_by("date").values_list("value", flat=True).first()
-        
-        if ini_nav is None:
-            return None
-        
-        return total_divs / ini_nav
+        window = (start_date, end_date or datetime.today().date())
+        return FinancialObject.get_many_returns([self], [window]).get(self.id, window, "dividend")
     
     def get_total_return(self, start_date: date, end_date: date | None = None) -> float | None:
         """
         Get Total Return between 2 dates
         """
-        price_return = self.get_price_return(start_date, end_date)
-        div_return = self.get_div_return(start_date, end_date)
-
-        if price_return is None or div_return is None:
-            return None
-        
-        return price_return + div_return
\ No newline at end of file
+        window = (start_date, end_date or datetime.today().date())
+        return FinancialObject.get_many_returns([self], [window]).get(self.id, window, "total")
@@ -15,6 +15,9 @@ class Order(models.Model):
 
     class Meta:
         ordering = ["date"]
+        indexes = [
+            models.Index(fields=['portfolio', 'date', 'id'], name='order_ptf_date_id_idx'),
+        ]
 
     date = models.DateField()
     portfolio = models.ForeignKey(Portfolio, on_delete=models.CASCADE, related_name="orders")
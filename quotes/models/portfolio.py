@@ -1,8 +1,12 @@
 """
 Portfolio-related models: Portfolio, PortfolioEntry, PortfolioInventory
 """
-from django.db import models
-from datetime import datetime, date
+from django.db import models, transaction
+from django.db.models import F, Q, Value
+from django.db.models.functions import Coalesce, Least
+from datetime import datetime, date, timedelta
+from functools import reduce
+from operator import or_
 import pandas as pd
 import numpy as np
 from dataclasses import dataclass
@@ -13,6 +17,7 @@ from .financial_object import FinancialObject
 
 if TYPE_CHECKING:
     from .order import Order
+    from quotes.analytics import RiskStatistics, AttributionMatrix
 
 
 @dataclass
@@ -133,10 +138,17 @@ class Portfolio(models.Model):
     
     owner = models.ForeignKey(AccountOwner, on_delete=models.CASCADE)
     name = models.CharField(max_length=30, default="")
+    # Computed series are wrong from this date onwards (orders or prices changed since), and the
+    # number of such changes, telling whether one came in while the series were being recomputed
+    ts_changed_from = models.DateField(null=True, blank=True, editable=False)
+    ts_changes = models.PositiveIntegerField(default=0, editable=False)
 
     ts_ret = None
     ts_val = None
     ts_cumul_ret = None
+    ts_total_ret = None
+    ts_total_val = None
+    ts_total_cumul_ret = None
 
     def __str__(self):
         return f"{self.owner} - {self.name}"
@@ -153,7 +165,7 @@ class Portfolio(models.Model):
         """
         if date is None:
             date = datetime.today()
-        all_orders = self.orders.filter(date__lte=date).order_by("date")
+        all_orders = self.orders.filter(date__lte=date).order_by("date").select_related("id_object")
         
         curr_inventory: PortfolioInventory = []
 
@@ -173,158 +185,317 @@ class Portfolio(models.Model):
         Returns dictionary {FinancialInstrument: weight} for most recent portfolio data
         """
         from .financial_data import FinancialData
+        from .data_watermark import DataWatermark
+        from .yahoo_finance import YahooFinanceQuery
 
-        most_recent_date = FinancialData.get_price_most_recent_date()
+        most_recent_date = DataWatermark.as_of_date()
         
         inventory = self.get_inventory(most_recent_date)
         
-        # Get NAV df
-        qs = [FinancialData.objects\
-                    .filter(id_object=obj, field="NAV", origin="Yahoo Finance", date=most_recent_date)\
-                    .values_list("value", flat=True) for obj in inventory.fin_objs]
-        
-        # Evaluate Query set to only have lists
-        qs = [list(q) for q in qs]
+        # Get NAV of every held instrument in one query
+        panel = YahooFinanceQuery.get_panel(inventory.id_objects, most_recent_date, most_recent_date,
+                                            fields=[FinancialData.TimeSeriesField.NAV])
+        prices = dict(zip(panel.ids, panel.nav[0])) if len(panel.dates) else {}
 
-        # unlist
-        prices = [x for xs in qs for x in xs]
-        
-        amounts = [price * nb for price, nb in zip(prices, inventory.nbs)]
+        amounts = [(name, prices[id] * nb) for id, name, nb in zip(inventory.id_objects, inventory.names, inventory.nbs)
+                   if not np.isnan(prices.get(id, np.nan))]
+        total = sum(amount for _, amount in amounts)
+
+        # Instruments sharing a name are merged, as they would be on a chart
+        weights = {}
+        for name, amount in amounts:
+            weights[name] = weights.get(name, 0) + amount / total
 
-        return {k: v/sum(amounts) for k,v in zip(inventory.names, amounts)}
+        return weights
 
-    def get_TS(self) -> None:
+    def get_TS(self, series: dict | None = None) -> None:
         """
-        Returns the time series of the portfolio since its inception
+        Returns the time series of the portfolio since its inception, price and total return.
+
+        The series are cached with a checkpoint at their last valued date: later calls only
+        price the days after it, or the days after the earliest order changed since.
+        series is the result of get_many_TS for this portfolio, if already known.
+        """
+        if series is None:
+            series = Portfolio.get_many_TS([self])
+        if self.id not in series:
+            raise Exception("No order data.")
+
+        self.ts_ret, self.ts_val, self.ts_cumul_ret = series[self.id].ts_ret, series[self.id].ts_val, series[self.id].ts_cumul_ret
+        self.ts_total_ret, self.ts_total_val, self.ts_total_cumul_ret = (series[self.id].ts_total_ret, series[self.id].ts_total_val,
+                                                                         series[self.id].ts_total_cumul_ret)
+
+    @staticmethod
+    def get_many_TS(portfolios: list["Portfolio"]) -> dict:
+        """
+        Returns {portfolio id: PortfolioSeries} for many portfolios at once, portfolios without
+        orders being left out.
+
+        Whatever the number of portfolios, their cached series are read in one cache call, their
+        orders in one query and the prices and dividends of the union of their instruments in one
+        panel, on which every portfolio needing work is computed in a single pass.
         """
         from .yahoo_finance import YahooFinanceQuery
+        from .financial_data import FinancialData
         from django.core.cache import cache
-        from .financial_data import FinancialData        
-        
-        # Retrieve all orders
-        all_order_dates = set([order.date for order in self.orders.all()])
-        all_order_dates = sorted(all_order_dates, reverse=False)
+        from .portfolio_snapshot import PortfolioSnapshot
+        from quotes.analytics import OrderBook, PortfolioSeries, compute_portfolios_series
+        from quotes.utils.chart_cache import bump_portfolio_versions
+
+        portfolios = list(portfolios)
+        keys = {ptf.id: f"portfolio_{ptf.id}_ts" for ptf in portfolios}
+        cached = cache.get_many(list(keys.values()))
+
+        series = {}
+        for ptf in portfolios:
+            # Series cached before they had total returns are computed again
+            if isinstance(cached.get(keys[ptf.id]), PortfolioSeries) and hasattr(cached[keys[ptf.id]], "ts_total_ret"):
+                series[ptf.id] = cached[keys[ptf.id]]
+
+        # Pending changes, read before the orders, with their count to clear only those taken into account
+        pending = {ptf_id: (changed, changes) for ptf_id, changed, changes in
+                   Portfolio.objects.filter(id__in=keys, ts_changed_from__isnull=False)
+                   .values_list("id", "ts_changed_from", "ts_changes")}
+        changed_from = {ptf_id: changed for ptf_id, (changed, _) in pending.items()}
+
+        # Orders: whole history when it has to be replayed, else only the ones after the checkpoint
+        after = {ptf_id: s.checkpoint.date for ptf_id, s in series.items()
+                 if s.checkpoint is not None and ptf_id not in changed_from}
+        order_books = OrderBook.from_portfolios(portfolios, after)
+
+        # Orders changed: only dates before the earliest change are still right
+        for ptf_id in changed_from:
+            if ptf_id in series:
+                series[ptf_id] = series[ptf_id].rewind(changed_from[ptf_id], order_books[ptf_id])
+                if series[ptf_id] is None:
+                    del series[ptf_id]
+
+        # Full computation from the first order, or only the days after the checkpoint
+        books, checkpoints, starts = {}, {}, {}
+        for ptf in portfolios:
+            current = series.get(ptf.id)
+            if current is None or current.checkpoint is None:
+                if len(order_books[ptf.id]):
+                    books[ptf.id] = order_books[ptf.id]
+                    starts[ptf.id] = order_books[ptf.id].first_date
+            else:
+                checkpoint = current.checkpoint
+                books[ptf.id] = order_books[ptf.id].after(checkpoint.date)
+                checkpoints[ptf.id] = checkpoint
+                starts[ptf.id] = checkpoint.date + timedelta(days=1)
+
+        # Single price and dividend panel for every portfolio, columns keyed by FinancialObject id
+        ids = set()
+        for ptf_id in books:
+            ids.update(books[ptf_id].instrument_ids)
+            ids.update(checkpoints[ptf_id].positions if ptf_id in checkpoints else {})
+        today = datetime.today().date()
+        panel = YahooFinanceQuery.get_panel(ids, from_date = min(starts.values(), default=today), until_date = today,
+                                            fields = [FinancialData.TimeSeriesField.NAV, FinancialData.TimeSeriesField.Dividends])
+        prices = panel.prices_df()
+        dividends = panel.dividend_events()
+
+        # Portfolios with nothing new since their checkpoint are left as they are
+        def has_news(ptf_id) -> bool:
+            if ptf_id not in checkpoints or len(books[ptf_id]) or ptf_id in changed_from:
+                return True
+            held = [id_object for id_object in checkpoints[ptf_id].positions if id_object in prices.columns]
+            return bool(prices.loc[prices.index > checkpoints[ptf_id].date, held].notna().any().any())
+
+        books = {ptf_id: book for ptf_id, book in books.items() if has_news(ptf_id)}
+        computed = compute_portfolios_series(books, prices, {ptf_id: checkpoints[ptf_id] for ptf_id in books if ptf_id in checkpoints},
+                                             dividends)
+
+        # Every order of a changed portfolio was deleted: nothing left to show
+        emptied = [ptf for ptf in portfolios if ptf.id in changed_from and ptf.id not in series and ptf.id not in computed]
+
+        # Snapshots rewritten and change flags cleared together: if anything fails, the flags stay
+        # and the next call computes again
+        updated = {}
+        with transaction.atomic():
+            for ptf in portfolios:
+                if ptf.id not in computed:
+                    continue
+                if ptf.id in checkpoints and ptf.id not in changed_from and computed[ptf.id].checkpoint is checkpoints[ptf.id]:
+                    # New prices, but not for every held instrument yet: nothing valued
+                    continue
+                if ptf.id in checkpoints:
+                    series[ptf.id] = series[ptf.id].extend(computed[ptf.id])
+                    PortfolioSnapshot.write_series(ptf, series[ptf.id], checkpoints[ptf.id].date)
+                else:
+                    series[ptf.id] = computed[ptf.id]
+                    PortfolioSnapshot.write_series(ptf, series[ptf.id])
+                updated[keys[ptf.id]] = series[ptf.id]
 
-        if len(all_order_dates) == 0:
-            raise Exception("No order data.")
-        
-        latest_price_date = FinancialData.get_price_most_recent_date()
+            if emptied:
+                PortfolioSnapshot.objects.filter(portfolio__in=emptied).delete()
+
+            # Changes made while computing keep their flag, for the next call
+            if pending:
+                Portfolio.objects.filter(reduce(or_, (Q(id=ptf_id, ts_changes=changes) for ptf_id, (_, changes) in pending.items()))
+                                         ).update(ts_changed_from=None)
+
+        if emptied:
+            cache.delete_many([keys[ptf.id] for ptf in emptied])
+        if updated:
+            # Kept until orders change, so that new price days can be appended
+            cache.set_many(updated, timeout=None)
+        bump_portfolio_versions([ptf.id for ptf in portfolios if keys[ptf.id] in updated] + [ptf.id for ptf in emptied])
+
+        return series
+
+    @staticmethod
+    def changed_ts(portfolios: list["Portfolio"]) -> list["Portfolio"]:
+        """
+        Portfolios whose orders or prices changed since their time series were last computed, in one query
+        """
+        changed = set(Portfolio.objects.filter(id__in=[ptf.id for ptf in portfolios], ts_changed_from__isnull=False)
+                      .values_list("id", flat=True))
+        return [ptf for ptf in portfolios if ptf.id in changed]
+
+    def invalidate_ts(self, from_date: date) -> None:
+        """
+        Flag the time series as wrong from a date onwards, after an order was added, edited or deleted.
+        """
+        Portfolio.invalidate_many_ts([self.id], from_date)
 
-        # Add today so that the time series is computed until today
-        all_order_dates.append(datetime.today().date())
+    @staticmethod
+    def invalidate_many_ts(portfolio_ids: list[int], from_date: date) -> None:
+        """
+        Flag the time series of portfolios as wrong from a date onwards.
+
+        A single conditional UPDATE only ever moves the date back, so that concurrent changes
+        cannot overwrite an earlier one, and the flag survives a cache clear.
+        """
+        from quotes.utils.chart_cache import bump_portfolio_versions
 
-        cache_key = f"portfolio_{self.id}_ts"
-        cached = cache.get(cache_key)
-        if cached:
-            self.ts_ret, self.ts_val, self.ts_cumul_ret = cached
+        portfolio_ids = list(portfolio_ids)
+        if not portfolio_ids:
             return
+        Portfolio.objects.filter(id__in=portfolio_ids).update(
+            ts_changed_from=Least(Coalesce(F("ts_changed_from"), Value(from_date)), Value(from_date)),
+            ts_changes=F("ts_changes") + 1,
+        )
+        bump_portfolio_versions(portfolio_ids)
 
-        ts = []
-        ts_ret = []
+    @staticmethod
+    def invalidate_holders(id_object: int, from_date: date) -> None:
+        """
+        Prices or dividends of an instrument changed from a date: flag the series of the portfolios trading it
+        """
+        from .order import Order
 
-        for i, order_date in enumerate(all_order_dates):
-            if i == 0:
-                continue
+        holders = Order.objects.filter(id_object_id=id_object).values_list("portfolio_id", flat=True).distinct()
+        Portfolio.invalidate_many_ts(list(holders), from_date)
 
-            start = all_order_dates[i-1]
-            inventory = self.get_inventory(start)
-            prices_df = YahooFinanceQuery.get_prices_from_inventory(fin_objs = inventory.fin_objs,
-                                                                 from_date = start,
-                                                                 until_date = order_date)
+    def get_risk_statistics(self, series: dict | None = None) -> "RiskStatistics":
+        """
+        Volatility, Sharpe/Sortino ratios, maximum drawdown and rolling statistics of the portfolio
+        """
+        statistics = Portfolio.get_many_risk_statistics([self], series)
+        if self.id not in statistics:
+            raise Exception("No order data.")
+        return statistics[self.id]
 
-            # Make inventory a 2d numpy array
-            inventory = np.array(inventory.nbs)
-            
-            ##### Return computation
-            # Approximation: change in number of stocks only come into
-            # effect at the end of the day when the order was placed.
-            
-            # Remove rows with NA, compute returns and remove first NA row
-            prices_without_na = prices_df.dropna(axis=0, how="any")
-            rets = prices_without_na.pct_change()[1:]
+    @staticmethod
+    def get_many_risk_statistics(portfolios: list["Portfolio"], series: dict | None = None) -> dict:
+        """
+        Returns {portfolio id: RiskStatistics}, portfolios without orders being left out.
 
-            # EUR amount in each stock is stock_price x nb_stock
-            # Dimensions: (n_stocks, 1) = (n_dates -1, n_stocks) x (1, n_stocks)
-            amount_per_stock = prices_without_na[:-1] * inventory
-            
+        Statistics are cached with the version of the time series they were computed on, so they are
+        recomputed, all missing portfolios together, only once the series changed. series is the result
+        of get_many_TS for these portfolios, if already known.
+        """
+        from django.conf import settings
+        from django.core.cache import cache
+        from quotes.analytics import compute_risk
+        from quotes.utils.chart_cache import portfolio_versions
 
-            # div because element-wise division
-            weights = amount_per_stock.div(amount_per_stock.sum(axis=1), axis=0)
-            
-            # Keep rets date index
-            ptf_ret = (rets * weights.set_index(rets.index)).sum(axis=1)        
+        if series is None:
+            series = Portfolio.get_many_TS(portfolios)
+        versions = portfolio_versions(series)
+        keys = {ptf_id: f"portfolio_{ptf_id}_risk" for ptf_id in series}
+        cached = cache.get_many(list(keys.values()))
 
-            ts_ret.append(ptf_ret)
+        statistics = {ptf_id: cached[key][1] for ptf_id, key in keys.items()
+                      if key in cached and cached[key][0] == versions[ptf_id]}
 
-            ##### Portfolio TS computation
-            # matrix multiplication
-            if i == len(all_order_dates) -1:
-                # last one
-                ts.append(prices_without_na.dot(inventory))
-            else:
-                ts.append(prices_without_na.dot(inventory).iloc[:-1])
-            
+        missing = [ptf_id for ptf_id in series if ptf_id not in statistics]
+        if missing:
+            risk = compute_risk({ptf_id: series[ptf_id].ts_ret for ptf_id in missing},
+                                {ptf_id: series[ptf_id].ts_cumul_ret for ptf_id in missing},
+                                risk_free=getattr(settings, "RISK_FREE_RATE", 0.0))
+            computed = {ptf_id: risk.get(ptf_id) for ptf_id in missing}
+            cache.set_many({keys[ptf_id]: (versions[ptf_id], computed[ptf_id]) for ptf_id in missing}, timeout=None)
+            statistics.update(computed)
 
-        self.ts_ret = pd.concat(ts_ret, axis=0).squeeze()
-        self.ts_val = pd.concat(ts, axis=0).squeeze()
-        self.ts_cumul_ret = pd.concat([
-            self.ts_ret.add(1), 
-            pd.Series([1], index=[all_order_dates[0]])
-            ])
-        self.ts_cumul_ret.sort_index(inplace=True)
-        self.ts_cumul_ret = self.ts_cumul_ret.cumprod()
-        cache.set(cache_key, (self.ts_ret, self.ts_val, self.ts_cumul_ret))
+        return statistics
 
     def get_ytd_price_return(self) -> float | None:
         """
         Returns the YTD price return of the portfolio as a float (e.g. 0.065 for +6.5%).
         """
-        from quotes.utils.chart_creation import timeframe_to_limit_date
+        from quotes.analytics import compute_performance
+        from quotes.utils.chart_creation import horizon_limits
 
         if self.ts_cumul_ret is None:
             self.get_TS()
 
-        ytd_start = pd.Timestamp(timeframe_to_limit_date("ytd"))
-        series = self.ts_cumul_ret.copy()
-        series.index = pd.DatetimeIndex(series.index)
+        # Portfolios opened this year: since inception
+        performance = compute_performance({self.id: self.ts_cumul_ret}, horizon_limits(["YTD"]), partial=True)
+        return performance.get(self.id, "YTD")
+
+    def get_attribution(self, windows: list[tuple[date, date]] | None = None) -> "AttributionMatrix":
+        """
+        Contribution of each instrument to the portfolio total return over each (start, end) window,
+        split into price and dividend parts, from the daily positions: trades inside a window count.
+        Every calendar year since inception if no window is given.
+
+        The matrix is cached with the version of the portfolio (its orders) and of the market data,
+        so it is only recomputed once either changed.
+        """
+        from django.core.cache import cache
+        from .financial_data import FinancialData
+        from .yahoo_finance import YahooFinanceQuery
+        from quotes.analytics import OrderBook, compute_attribution
+        from quotes.utils.chart_cache import market_data_version, portfolio_versions
 
-        start_candidates = series[series.index >= ytd_start]
-        if start_candidates.empty:
-            return None
+        book = OrderBook.from_portfolio(self)
+        if not len(book):
+            raise Exception("No order data.")
 
-        return float(series.iloc[-1] / start_candidates.iloc[0] - 1)
+        today = datetime.today().date()
+        if windows is None:
+            windows = [(date(year - 1, 12, 31), min(date(year, 12, 31), today))
+                       for year in range(book.first_date.year, today.year + 1)]
+
+        key = f"portfolio_{self.id}_attribution_" + "_".join(f"{start}:{end}" for start, end in windows)
+        version = (portfolio_versions([self.id])[self.id], market_data_version())
+        cached = cache.get(key)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+
+        # A few days before the first start, for its closing price even on a holiday
+        ids = book.instrument_ids
+        panel = YahooFinanceQuery.get_panel(ids, min(start for start, _ in windows) - timedelta(days=10),
+                                            max(end for _, end in windows),
+                                            fields=[FinancialData.TimeSeriesField.NAV, FinancialData.TimeSeriesField.Dividends])
+
+        attribution = compute_attribution(panel.dates, panel.nav, panel.dividends,
+                                          book.positions(panel.dates, ids, include_same_day=False),
+                                          book.positions(panel.dates, ids, include_same_day=True),
+                                          windows, ids)
+        cache.set(key, (version, attribution), timeout=None)
+        return attribution
 
     def get_individual_returns(self, start_date: str, end_date: str) -> pd.DataFrame:
         """
         Lines: All Financial Instruments that have been in the portfolio during the time frame
         Columns: Price contribution, Dividend contribution, Total contribution 
         """
-        from .order import Order
-        from .yahoo_finance import YahooFinanceQuery
-        
-        # Retrieve all Financial Instruments that have been in the portfolio during the time frame
-        fin_ins = self.get_inventory(start_date).fin_objs
-        subsequent_orders = Order.objects.filter(portfolio=self, date__gte=start_date, date__lte=end_date)
-        fin_ins.extend([ord.id_object for ord in subsequent_orders])
-        all_fin_instr = list(set(fin_ins))
-
-        # Load Time Series during the time frame
-        prices = YahooFinanceQuery.get_prices_from_inventory(fin_objs = all_fin_instr, from_date = start_date, until_date = end_date)        
-        prices.index = pd.to_datetime(prices.index)
-        divs = YahooFinanceQuery.get_divs_from_inventory(fin_objs = all_fin_instr, from_date = start_date, until_date = end_date)
-        divs.index = pd.to_datetime(divs.index)
-
-        available_start_date = prices.index[0]
-        available_end_date = prices.index[-1]
-
-        rets = dict()
-
-        for fin in all_fin_instr:
-            # quantity did not vary during time frame
-            price_ret_tf = prices.loc[available_end_date][fin.name] / prices.loc[available_start_date][fin.name] - 1
-            div_ret_tf = sum(divs[fin.name]) / prices[fin.name][available_start_date]
-            total_ret_tf = price_ret_tf + div_ret_tf
-            
-            rets[fin.name] = [price_ret_tf, div_ret_tf, total_ret_tf]
+        window = (pd.Timestamp(start_date).date(), pd.Timestamp(end_date).date())
+        rets = self.get_attribution([window]).window_frame(window)
 
-        return pd.DataFrame.from_dict(rets, orient="index", columns=["Price", "Dividends", "Total"])
+        names = FinancialObject.objects.in_bulk(rets.index.tolist())
+        rets.index = [names[id].name for id in rets.index]
+        return rets
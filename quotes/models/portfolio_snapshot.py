@@ -0,0 +1,159 @@
+"""
+PortfolioSnapshot model - daily portfolio value/return series materialized in the database.
+"""
+from datetime import date
+from typing import Iterable, Optional
+import logging
+import pandas as pd
+from django.db import models, transaction
+
+from .portfolio import Portfolio
+
+logger = logging.getLogger(__name__)
+
+
+class PortfolioSnapshot(models.Model):
+
+    class Meta:
+        ordering = ["date"]
+        unique_together = [('portfolio', 'date')]
+        indexes = [
+            models.Index(fields=['portfolio', 'date'], name='snapshot_ptf_date_idx'),
+        ]
+
+    portfolio = models.ForeignKey(Portfolio, on_delete=models.CASCADE, related_name="snapshots")
+    date = models.DateField()
+    value = models.FloatField(null=True)
+    daily_return = models.FloatField(null=True)
+    cumulative_return = models.FloatField(null=True)
+    # Total return counterparts, dividends reinvested
+    total_value = models.FloatField(null=True)
+    total_daily_return = models.FloatField(null=True)
+    total_cumulative_return = models.FloatField(null=True)
+
+    def __str__(self):
+        return f"{self.portfolio} | {self.date} | {self.value}"
+
+    @staticmethod
+    def write_series(portfolio: Portfolio, series, since: Optional[date] = None) -> int:
+        """
+        Replace the snapshots of a portfolio after `since` (all of them if None) with its series,
+        and push the new points to the portfolio's followers once committed
+        """
+        from quotes.updates import broadcast_series_update
+
+        frame = pd.DataFrame({
+            "value": series.ts_val,
+            "daily_return": series.ts_ret,
+            "cumulative_return": series.ts_cumul_ret,
+            "total_value": series.ts_total_val,
+            "total_daily_return": series.ts_total_ret,
+            "total_cumulative_return": series.ts_total_cumul_ret,
+        })
+        previous = None
+        if since is not None:
+            # Last unchanged row, that the pushed points chain to
+            kept = frame[frame.index <= since]
+            previous = kept.iloc[-1] if len(kept) else None
+            frame = frame[frame.index > since]
+
+        snapshots = [
+            PortfolioSnapshot(
+                portfolio=portfolio,
+                date=row[0],
+                **{field: None if pd.isna(value) else value for field, value in zip(frame.columns, row[1:])},
+            )
+            for row in frame.itertuples()
+        ]
+
+        stale = PortfolioSnapshot.objects.filter(portfolio=portfolio)
+        if since is not None:
+            stale = stale.filter(date__gt=since)
+
+        with transaction.atomic():
+            stale.delete()
+            PortfolioSnapshot.objects.bulk_create(snapshots, batch_size=1000)
+            transaction.on_commit(lambda: broadcast_series_update(portfolio.id, frame, since, previous))
+
+        logger.debug(f"Wrote {len(snapshots)} snapshots for portfolio {portfolio.id} since {since}")
+        return len(snapshots)
+
+    @staticmethod
+    def refresh(portfolios: Iterable[Portfolio]) -> None:
+        """
+        Bring the snapshots of portfolios up to date, in one batch (get_many_TS writes its changes through)
+        """
+        portfolios = list(portfolios)
+        try:
+            Portfolio.get_many_TS(portfolios)
+        except Exception:
+            logger.exception(f"Could not refresh snapshots of portfolios {[ptf.id for ptf in portfolios]}")
+
+    @staticmethod
+    def refresh_stale(portfolios: Iterable[Portfolio]) -> None:
+        """
+        Refresh, in one batch, the portfolios whose orders changed or that were never materialized
+        """
+        portfolios = list(portfolios)
+        materialized = set(PortfolioSnapshot.objects.filter(portfolio__in=portfolios)
+                           .values_list("portfolio_id", flat=True).distinct())
+        changed = Portfolio.changed_ts(portfolios)
+        stale = changed + [ptf for ptf in portfolios if ptf.id not in materialized and ptf not in changed]
+        if stale:
+            PortfolioSnapshot.refresh(stale)
+
+    @staticmethod
+    def _read(portfolio_ids: list[int], field: str, start: Optional[date], end: Optional[date],
+              before: Optional[date] = None) -> dict[int, pd.Series]:
+        """
+        Single range query on (portfolio, date), pivoted into one series per portfolio
+        """
+        rows = PortfolioSnapshot.objects.filter(portfolio__in=portfolio_ids, **{f"{field}__isnull": False})
+        if start is not None:
+            rows = rows.filter(date__gte=start)
+        if end is not None:
+            rows = rows.filter(date__lte=end)
+        if before is not None:
+            rows = rows.filter(date__lt=before)
+
+        frame = pd.DataFrame(list(rows.order_by("portfolio", "date").values_list("portfolio_id", "date", field)),
+                             columns=["portfolio_id", "date", field])
+
+        return {ptf_id: pd.Series(group[field].to_numpy(), index=pd.Index(group["date"].tolist(), dtype=object))
+                for ptf_id, group in frame.groupby("portfolio_id", sort=False)}
+
+    @staticmethod
+    def get_series(portfolios: Iterable[Portfolio], field: str,
+                   start: Optional[date] = None, end: Optional[date] = None) -> dict[int, pd.Series]:
+        """
+        Returns {portfolio id: series of `field`} between 2 dates, read from the table.
+
+        Portfolios whose orders or prices changed since their last computation, or that were
+        never computed, are refreshed first, all together.
+        """
+        portfolios = list(portfolios)
+        changed = Portfolio.changed_ts(portfolios)
+
+        series = PortfolioSnapshot._read([ptf.id for ptf in portfolios if ptf not in changed], field, start, end)
+
+        absent = [ptf for ptf in portfolios if ptf.id not in series and ptf not in changed]
+        missing = []
+        if absent:
+            materialized = set(PortfolioSnapshot.objects.filter(portfolio__in=absent)
+                               .values_list("portfolio_id", flat=True).distinct())
+            missing = [ptf for ptf in absent if ptf.id not in materialized]
+
+        if changed or missing:
+            # Orders changed, or never materialized: computed together in one batch,
+            # next reads only hit the table
+            PortfolioSnapshot.refresh(changed + missing)
+
+            # A refresh that failed leaves the change flag: only the rows before the change are still right
+            flagged = dict(Portfolio.objects.filter(id__in=[ptf.id for ptf in changed], ts_changed_from__isnull=False)
+                           .values_list("id", "ts_changed_from"))
+            series.update(PortfolioSnapshot._read([ptf.id for ptf in changed + missing if ptf.id not in flagged],
+                                                  field, start, end))
+            for ptf_id, changed_from in flagged.items():
+                series.update(PortfolioSnapshot._read([ptf_id], field, start, end, before=changed_from))
+
+        return {ptf.id: series.get(ptf.id, pd.Series(dtype=float)) for ptf in portfolios}
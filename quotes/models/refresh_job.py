@@ -0,0 +1,108 @@
+"""
+RefreshJob model - scheduled market data refreshes, each run by a single worker process.
+"""
+from datetime import datetime, timedelta
+from typing import Optional
+from django.db import models
+from django.db.models import F, Q
+from django.utils import timezone
+
+
+class RefreshJob(models.Model):
+
+    class Status(models.TextChoices):
+        PENDING = "Pending"
+        RUNNING = "Running"
+        SUCCEEDED = "Succeeded"
+        # Refreshed, except for some instruments that still failed after every attempt
+        PARTIAL = "Partial"
+        FAILED = "Failed"
+
+    class Meta:
+        ordering = ["-slot"]
+        unique_together = [('name', 'slot')]
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='refreshjob_status_run_idx'),
+        ]
+
+    name = models.CharField(max_length=50, default="market_data")
+    # Market close the refresh is for, and when it may run (after the close, or after a failure)
+    slot = models.DateTimeField()
+    run_after = models.DateTimeField()
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.PENDING)
+    attempts = models.IntegerField(default=0)
+    # Worker holding the job, until its lease expires (a worker that died releases it that way)
+    worker = models.CharField(max_length=100, blank=True)
+    lease_until = models.DateTimeField(null=True, blank=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    summary = models.TextField(blank=True)
+    last_error = models.TextField(blank=True)
+    # FinancialObject ids the next attempt refreshes, the ones a previous attempt failed on (all of them if empty)
+    retry_ids = models.JSONField(default=list, blank=True)
+
+    def __str__(self):
+        return f"{self.name} | {self.slot} | {self.status} ({self.attempts} attempts)"
+
+    @staticmethod
+    def claim_due(worker: str, lease: timedelta, name: str = "market_data") -> Optional["RefreshJob"]:
+        """
+        Take the next job due: pending, or running with an expired lease.
+
+        The claim is a conditional UPDATE, atomic on every database: when several processes
+        try to claim the same job, exactly one of them updates the row and gets it.
+        """
+        now = timezone.now()
+        due = Q(status=RefreshJob.Status.PENDING, run_after__lte=now) | Q(status=RefreshJob.Status.RUNNING, lease_until__lt=now)
+
+        for job_id in RefreshJob.objects.filter(due, name=name).order_by("run_after").values_list("id", flat=True)[:5]:
+            claimed = RefreshJob.objects.filter(due, id=job_id).update(
+                status=RefreshJob.Status.RUNNING, worker=worker, lease_until=now + lease,
+                started_at=now, attempts=F("attempts") + 1,
+            )
+            if claimed:
+                return RefreshJob.objects.get(id=job_id)
+        return None
+
+    def _release(self, **fields) -> bool:
+        """
+        Update the job if this worker still holds it (its lease may have expired and been taken over).
+        False, and the instance left unchanged, if it was lost.
+        """
+        held = RefreshJob.objects.filter(id=self.id, worker=self.worker, status=RefreshJob.Status.RUNNING).update(
+            lease_until=None, **fields) > 0
+        if held:
+            self.lease_until = None
+            for field, value in fields.items():
+                setattr(self, field, value)
+        return held
+
+    def renew(self, lease: timedelta) -> bool:
+        """
+        Extend the lease of a job still held by this worker, so that a long refresh is not taken over.
+        False if it was lost.
+        """
+        self.lease_until = timezone.now() + lease
+        return RefreshJob.objects.filter(id=self.id, worker=self.worker, status=RefreshJob.Status.RUNNING).update(
+            lease_until=self.lease_until) > 0
+
+    def succeed(self, summary: str) -> bool:
+        return self._release(status=RefreshJob.Status.SUCCEEDED, finished_at=timezone.now(), summary=summary)
+
+    def succeed_partially(self, summary: str, error: str) -> bool:
+        """
+        Record a refresh that saved the data of every instrument but those of error
+        """
+        return self._release(status=RefreshJob.Status.PARTIAL, finished_at=timezone.now(), summary=summary,
+                             last_error=error)
+
+    def fail(self, error: str, retry_at: Optional[datetime] = None, retry_ids: Optional[list[int]] = None) -> bool:
+        """
+        Record a failed attempt: the job is pending again from retry_at, or failed for good if None.
+        The next attempt only refreshes retry_ids if given (the instruments that failed), else the same ones.
+        """
+        if retry_at is None:
+            return self._release(status=RefreshJob.Status.FAILED, finished_at=timezone.now(), last_error=error)
+        if retry_ids is None:
+            return self._release(status=RefreshJob.Status.PENDING, run_after=retry_at, last_error=error)
+        return self._release(status=RefreshJob.Status.PENDING, run_after=retry_at, last_error=error, retry_ids=retry_ids)
@@ -1,74 +1,138 @@
 """
 YahooFinanceQuery - utility class for querying Yahoo Finance data.
 """
+from dataclasses import dataclass
 from datetime import date
+from typing import Iterable, TYPE_CHECKING
+import numpy as np
 import pandas as pd
 
 from .financial_object import FinancialObject
 from .financial_data import FinancialData
 
+if TYPE_CHECKING:
+    from quotes.analytics import DividendEvents
+
+
+@dataclass
+class InstrumentPanel:
+    """
+    Prices and dividends of several instruments on a shared date axis.
+
+    Args:
+        dates: sorted dates having at least one row (datetime64[D])
+        ids: FinancialObject ids, one column each
+        nav: (dates x ids) prices, NaN when missing
+        dividends: (dates x ids) dividends, 0 when none was paid
+    """
+    dates: np.ndarray
+    ids: list[int]
+    nav: np.ndarray
+    dividends: np.ndarray
+
+    @property
+    def index(self) -> pd.Index:
+        return pd.Index(self.dates.astype(date).tolist(), dtype=object)
+
+    def prices_df(self) -> pd.DataFrame:
+        """
+        Prices as a dataframe (dates x ids), only keeping dates with at least one price
+        """
+        has_price = ~np.isnan(self.nav).all(axis=1)
+        return pd.DataFrame(self.nav[has_price], index=self.index[has_price], columns=self.ids)
+
+    def divs_df(self) -> pd.DataFrame:
+        """
+        Dividends as a dataframe (dates x ids), only keeping dates with at least one dividend
+        """
+        has_div = (self.dividends != 0).any(axis=1)
+        return pd.DataFrame(self.dividends[has_div], index=self.index[has_div], columns=self.ids)
+
+    def dividend_events(self) -> "DividendEvents":
+        """
+        Dividends as sparse payment events, one per (date, id) with a dividend
+        """
+        from quotes.analytics import DividendEvents
+
+        rows, cols = np.nonzero(self.dividends)
+        return DividendEvents(dates=self.dates[rows], id_objects=np.array(self.ids, dtype=np.int64)[cols],
+                              amounts=self.dividends[rows, cols])
+
 
 class YahooFinanceQuery:
 
+    @staticmethod
+    def get_panel(id_objects: Iterable[int], from_date: date, until_date: date,
+                  fields: Iterable[str] = (FinancialData.TimeSeriesField.NAV, FinancialData.TimeSeriesField.Dividends)
+                  ) -> InstrumentPanel:
+        """
+        Queries the database once for all fields of all objects between 2 dates,
+        and pivots the rows into an InstrumentPanel keyed by FinancialObject id.
+        Reads the memory-mapped price store instead when it is up to date.
+        """
+        from quotes.price_store import PriceStore
+
+        store = PriceStore.default()
+        if store is not None and store.is_current():
+            return store.load_panel(id_objects, from_date, until_date, fields)
+
+        ids = sorted(set(id_objects))
+        rows = (FinancialData.objects
+                .filter(id_object__in=ids, field__in=list(fields), date__gte=from_date, date__lte=until_date)
+                .order_by()
+                .values_list("date", "id_object_id", "field", "value")
+                .iterator(chunk_size=10000))
+
+        row_dates, row_ids, row_is_nav, row_values = [], [], [], []
+        for row_date, row_id, row_field, row_value in rows:
+            row_dates.append(row_date)
+            row_ids.append(row_id)
+            row_is_nav.append(row_field == FinancialData.TimeSeriesField.NAV)
+            row_values.append(row_value)
+
+        dates, row_pos = np.unique(np.array(row_dates, dtype="datetime64[D]"), return_inverse=True)
+        col_pos = np.searchsorted(np.array(ids, dtype=np.int64), np.array(row_ids, dtype=np.int64))
+        row_is_nav = np.array(row_is_nav, dtype=bool)
+        row_values = np.array(row_values, dtype=float)
+
+        nav = np.full((len(dates), len(ids)), np.nan)
+        nav[row_pos[row_is_nav], col_pos[row_is_nav]] = row_values[row_is_nav]
+        dividends = np.zeros((len(dates), len(ids)))
+        dividends[row_pos[~row_is_nav], col_pos[~row_is_nav]] = row_values[~row_is_nav]
+
+        return InstrumentPanel(dates=dates, ids=ids, nav=nav, dividends=dividends)
+
     @staticmethod
     def get_prices_from_inventory(fin_objs: list[FinancialObject], from_date: date, until_date: date) -> pd.DataFrame:
         """
-        Queries the database for prices, and returns dataframe (objs x dates)
+        Queries the database for prices, and returns dataframe (dates x objs) with object names as columns
         """
         if not all(isinstance(x, FinancialObject) for x in fin_objs):
               raise TypeError(f"Not a list of Financial Objects:{type(fin_objs[0])}")
-        
-        def query_price_from_db(obj: FinancialObject, from_date: date, until_date: date) -> pd.DataFrame:
-            """
-            Query the database for prices of a single financial object
-            """
-            df = pd.DataFrame(list(
-                FinancialData.objects.filter(id_object=obj.id, field="NAV", date__gte=from_date, date__lte=until_date)
-                .values("date", "value")))
-            
-            if df.empty:
-                  raise ValueError(f"No data for {obj.name} (ISIN is {obj.isin}) between "
-                                   f"{from_date} and {until_date}.")
-            
-            df = df.set_index("date").squeeze().rename(obj.name)
-            return df
-
-        # Query prices and adjust dfs to series with date index and relevant column names 
-        dfs = [query_price_from_db(obj, from_date, until_date) for obj in fin_objs]
-        prices = dfs[0].to_frame() if len(dfs) == 1 else pd.concat(dfs, axis=1, sort=True)
-
-        # For some reason, datetime index unordered (later dates before earlier dates)
-        # => messes up return calculation
-        prices.sort_index(inplace=True)
 
+        panel = YahooFinanceQuery.get_panel([obj.id for obj in fin_objs], from_date, until_date,
+                                            fields=[FinancialData.TimeSeriesField.NAV])
+        prices = panel.prices_df()
+
+        for obj in fin_objs:
+            if prices.empty or prices[obj.id].isna().all():
+                raise ValueError(f"No data for {obj.name} (ISIN is {obj.isin}) between "
+                                 f"{from_date} and {until_date}.")
+
+        prices = prices[[obj.id for obj in fin_objs]]
+        prices.columns = [obj.name for obj in fin_objs]
         return prices
-    
+
     @staticmethod
     def get_divs_from_inventory(fin_objs: list[FinancialObject], from_date: str, until_date: str) -> pd.DataFrame:
-
+        """
+        Queries the database for dividends, and returns dataframe (dates x objs) with object names as columns
+        """
         if not all(isinstance(x, FinancialObject) for x in fin_objs):
               raise TypeError(f"Not a list of Financial Objects:{type(fin_objs[0])}")
-        
-        # Query prices
-        dfs = [pd.DataFrame(list(
-                FinancialData.objects.filter(
-                      id_object=obj.id, field=FinancialData.TimeSeriesField.Dividends, origin="Yahoo Finance", date__gte=from_date, date__lte=until_date)
-                .values("date", "value"))) for obj in fin_objs]
-
-        # ISSUE IS HERE => PUT 0 WHEN NO DIVIDEND WAS PROVIDED
-        # Adjust dfs to series with date index and relevant column names 
-        for i, df in enumerate(dfs):
-            if not df.empty:
-                df = df.set_index("date")
-                df = pd.Series(data=df.squeeze(), index=df.index, name=fin_objs[i].name) if df.shape == (1,1) else\
-                     df.squeeze().rename(fin_objs[i].name)
-            else:
-                df = pd.Series(name=fin_objs[i].name)
-
-            dfs[i] = df
-        
-        # To dataframe with ordered index dates
-        divs = dfs[0].to_frame() if len(dfs) == 1 else pd.concat(dfs, axis=1, sort=True)
-        divs.fillna(0, inplace=True)
 
+        panel = YahooFinanceQuery.get_panel([obj.id for obj in fin_objs], from_date, until_date,
+                                            fields=[FinancialData.TimeSeriesField.Dividends])
+        divs = panel.divs_df()[[obj.id for obj in fin_objs]]
+        divs.columns = [obj.name for obj in fin_objs]
         return divs
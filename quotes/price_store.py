@@ -0,0 +1,297 @@
+"""
+PriceStore - columnar, memory-mapped read-side cache of the FinancialData table.
+
+Layout of the store directory:
+- generation_<n>/dates.npy: shared date axis (datetime64[D]), sorted
+- generation_<n>/<field>/<id>.npy: one float64 array per instrument and field, aligned on the
+  date axis. An array shorter than the axis means no data on the last dates (NaN prices, 0 dividends).
+- manifest.json: database the store mirrors, id of the last FinancialData row absorbed, and
+  generation directory the readers use
+
+The store only ever absorbs new rows (sync), which is what the ingestion path produces. New
+dates after the axis are appended in place, which readers of the current generation can't
+tell from the old state. New dates inside the axis move every array: they are written to a new
+generation, which the manifest switches to at once. The previous generation is kept for the
+reads still on it.
+
+Deleting or modifying rows flags the store as stale until it is rebuilt (buildpricestore
+command), and reads fall back to the database whenever the store is not current. Single rows
+are flagged by the post_save/post_delete receivers, QuerySet.update() and bulk_update() by
+FinancialDataQuerySet. Raw SQL writes are not seen: rebuild the store after them.
+
+Writers may be separate processes (web workers, scheduler, management commands): every write
+holds an exclusive lock on store.lock in the store directory (flock, where available).
+"""
+from contextlib import contextmanager
+from datetime import date
+from pathlib import Path
+from typing import Iterable, Optional
+import json
+import logging
+import os
+import shutil
+import threading
+
+import numpy as np
+from django.conf import settings
+from django.db import connection
+
+from quotes.models import FinancialData, InstrumentPanel
+
+try:
+    import fcntl
+except ImportError:
+    # No flock (Windows): writers are only serialized within a process
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+FILL_VALUES = {
+    FinancialData.TimeSeriesField.NAV: np.nan,
+    FinancialData.TimeSeriesField.Dividends: 0.0,
+}
+
+
+class PriceStore:
+
+    _write_lock = threading.Lock()
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+
+    @classmethod
+    def default(cls) -> Optional["PriceStore"]:
+        """
+        Store configured by settings.PRICE_STORE_DIR, None if disabled
+        """
+        directory = getattr(settings, "PRICE_STORE_DIR", None)
+        return cls(directory) if directory else None
+
+    # ---- Files
+
+    def _generation_dir(self, generation: int) -> Path:
+        return self.directory / f"generation_{generation}"
+
+    def _path(self, generation: int, field: str, id_object: int) -> Path:
+        return self._generation_dir(generation) / field / f"{id_object}.npy"
+
+    @staticmethod
+    def _save(path: Path, array: np.ndarray) -> None:
+        """
+        Atomic write: readers either see the old or the new array
+        """
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp")
+        with open(tmp, "wb") as f:
+            np.save(f, array)
+        os.replace(tmp, path)
+
+    def _load_axis(self, generation: int) -> np.ndarray:
+        path = self._generation_dir(generation) / "dates.npy"
+        return np.load(path) if path.exists() else np.array([], dtype="datetime64[D]")
+
+    @property
+    def manifest(self) -> dict:
+        path = self.directory / "manifest.json"
+        return json.loads(path.read_text()) if path.exists() else {}
+
+    def _write_manifest(self, **changes) -> None:
+        manifest = {**self.manifest, **changes}
+        tmp = self.directory / "manifest.tmp"
+        tmp.write_text(json.dumps(manifest))
+        os.replace(tmp, self.directory / "manifest.json")
+
+    @contextmanager
+    def _locked(self):
+        """
+        Exclusive write access to the store, across threads and processes
+        """
+        with self._write_lock:
+            if fcntl is None:
+                yield
+                return
+            self.directory.mkdir(parents=True, exist_ok=True)
+            with open(self.directory / "store.lock", "a") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    # ---- State
+
+    @staticmethod
+    def _database() -> str:
+        return str(connection.settings_dict["NAME"])
+
+    def is_current(self) -> bool:
+        """
+        True if the store mirrors this database and its last absorbed row is the last one in it
+        (a smaller last row means the database was replaced or truncated)
+        """
+        manifest = self.manifest
+        if not self._usable(manifest):
+            return False
+
+        last_row_id = FinancialData.objects.order_by("-id").values_list("id", flat=True).first() or 0
+        return manifest.get("last_row_id", 0) == last_row_id
+
+    def _usable(self, manifest: dict) -> bool:
+        return (bool(manifest) and not manifest.get("stale") and "generation" in manifest
+                and manifest.get("database") == self._database())
+
+    def mark_stale(self) -> None:
+        """
+        Rows were deleted or modified: reads go to the database until the store is rebuilt
+        """
+        with self._locked():
+            self._mark_stale()
+
+    def _mark_stale(self) -> None:
+        if self.manifest:
+            self._write_manifest(stale=True)
+
+    # ---- Writes
+
+    def rebuild(self) -> int:
+        """
+        Rebuild the whole store from the database
+        """
+        with self._locked():
+            self._mark_stale()
+            return self._sync()
+
+    def sync(self) -> int:
+        """
+        Absorb the FinancialData rows added since the last sync. Starts over from the whole
+        table on first use, or when the store is stale or mirrors another database.
+        Returns the number of rows absorbed.
+        """
+        with self._locked():
+            return self._sync()
+
+    def _sync(self) -> int:
+        manifest = self.manifest
+        current = manifest.get("generation")
+        if not self._usable(manifest):
+            # Started over in a new generation: reads of the current one are not disturbed
+            manifest = {"last_row_id": 0}
+            target = (current or 0) + 1
+            axis = np.array([], dtype="datetime64[D]")
+            shutil.rmtree(self._generation_dir(target), ignore_errors=True)
+        else:
+            target = current
+            axis = self._load_axis(current)
+
+        rows = (FinancialData.objects
+                .filter(id__gt=manifest.get("last_row_id", 0))
+                .order_by("id")
+                .values_list("id", "id_object_id", "date", "field", "value")
+                .iterator(chunk_size=10000))
+
+        row_ids, row_objects, row_dates, row_fields, row_values = [], [], [], [], []
+        for row in rows:
+            row_ids.append(row[0])
+            row_objects.append(row[1])
+            row_dates.append(row[2])
+            row_fields.append(row[3])
+            row_values.append(row[4])
+
+        if not row_ids and target == current:
+            return 0
+
+        row_objects = np.array(row_objects, dtype=np.int64)
+        row_dates = np.array(row_dates, dtype="datetime64[D]")
+        row_fields = np.array(row_fields)
+        row_values = np.array(row_values, dtype=float)
+
+        # Extend the date axis, re-laying arrays out into a new generation if new dates land inside it
+        new_axis = np.union1d(axis, row_dates)
+        if len(axis) and len(new_axis) > len(axis) and not np.array_equal(new_axis[:len(axis)], axis):
+            target = current + 1
+            self._relayout(current, target, axis, new_axis)
+        self._generation_dir(target).mkdir(parents=True, exist_ok=True)
+
+        positions = np.searchsorted(new_axis, row_dates)
+        for field, fill in FILL_VALUES.items():
+            in_field = row_fields == field
+            for id_object in np.unique(row_objects[in_field]).tolist():
+                mask = in_field & (row_objects == id_object)
+                path = self._path(target, field, id_object)
+
+                existing = np.load(path) if path.exists() else np.array([], dtype=float)
+                array = np.full(max(len(existing), positions[mask].max() + 1), fill)
+                array[:len(existing)] = existing
+                array[positions[mask]] = row_values[mask]
+                self._save(path, array)
+
+        self._save(self._generation_dir(target) / "dates.npy", new_axis)
+        self._write_manifest(database=self._database(), last_row_id=max(row_ids, default=0),
+                             generation=target, stale=False)
+        self._prune(keep={target, current})
+
+        logger.info(f"Price store absorbed {len(row_ids)} rows, {len(new_axis)} dates")
+        return len(row_ids)
+
+    def _relayout(self, generation: int, target: int, axis: np.ndarray, new_axis: np.ndarray) -> None:
+        """
+        Copy every array of a generation, on the old date axis, to a new generation on a new axis containing it
+        """
+        shutil.rmtree(self._generation_dir(target), ignore_errors=True)
+        old_positions = np.searchsorted(new_axis, axis)
+        for field, fill in FILL_VALUES.items():
+            for path in (self._generation_dir(generation) / field).glob("*.npy"):
+                existing = np.load(path)
+                array = np.full(old_positions[len(existing) - 1] + 1 if len(existing) else 0, fill)
+                array[old_positions[:len(existing)]] = existing
+                self._save(self._path(target, field, int(path.stem)), array)
+
+    def _prune(self, keep: set) -> None:
+        """
+        Remove the generations older than the ones in use (and any file of the flat layout of older versions)
+        """
+        for path in self.directory.iterdir():
+            if path.name in ("manifest.json", "store.lock"):
+                continue
+            if path.name.startswith("generation_") and path.name.removeprefix("generation_").isdigit():
+                if int(path.name.removeprefix("generation_")) in keep:
+                    continue
+            if path.is_dir():
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                path.unlink(missing_ok=True)
+
+    # ---- Reads
+
+    def load_panel(self, id_objects: Iterable[int], from_date: date, until_date: date,
+                   fields: Iterable[str] = tuple(FILL_VALUES)) -> InstrumentPanel:
+        """
+        Same result as YahooFinanceQuery.get_panel, read from memory-mapped arrays
+        """
+        ids = sorted(set(id_objects))
+        fields = list(fields)
+        # The generation is read once: a relayout switching to a new one does not move its arrays
+        generation = self.manifest["generation"]
+        axis = np.load(self._generation_dir(generation) / "dates.npy", mmap_mode="r")
+
+        start = np.searchsorted(axis, np.datetime64(from_date, "D"), side="left")
+        end = np.searchsorted(axis, np.datetime64(until_date, "D"), side="right")
+        dates = np.array(axis[start:end])
+
+        matrices = {}
+        for field, fill in FILL_VALUES.items():
+            matrix = np.full((len(dates), len(ids)), fill)
+            if field in fields:
+                for j, id_object in enumerate(ids):
+                    path = self._path(generation, field, id_object)
+                    if path.exists():
+                        column = np.load(path, mmap_mode="r")[start:end]
+                        matrix[:len(column), j] = column
+            matrices[field] = matrix
+
+        nav = matrices[FinancialData.TimeSeriesField.NAV]
+        dividends = matrices[FinancialData.TimeSeriesField.Dividends]
+
+        # Only keep dates on which one of the instruments has a row, as the database query would
+        has_row = ~np.isnan(nav).all(axis=1) | (dividends != 0).any(axis=1)
+        return InstrumentPanel(dates=dates[has_row], ids=ids, nav=nav[has_row], dividends=dividends[has_row])
@@ -0,0 +1,7 @@
+from django.urls import path
+from quotes import consumers
+
+websocket_urlpatterns = [
+    path("ws/portfolios/", consumers.PortfolioUpdatesConsumer.as_asgi()),
+    path("ws/portfolios/<int:pk>/", consumers.PortfolioUpdatesConsumer.as_asgi()),
+]
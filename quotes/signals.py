@@ -0,0 +1,153 @@
+"""
+Signals of the quotes application, and the receivers reacting to them.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import logging
+
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import Signal, receiver
+
+logger = logging.getLogger(__name__)
+
+# Background refreshes of the portfolios whose orders changed, started on first use
+_refresh_pool = None
+
+# Sent once market data was refreshed (management command or auto-updater)
+market_data_refreshed = Signal()
+
+# Sent once orders of a portfolio were added, edited or deleted, with the portfolio
+orders_changed = Signal()
+
+# Sent once FinancialData rows were changed by QuerySet.update() or bulk_update(), which send no
+# post_save, with the first date changed per instrument ({FinancialObject id: date})
+financial_data_updated = Signal()
+
+
+@receiver(market_data_refreshed)
+def refresh_portfolio_snapshots(sender, **kwargs):
+    """
+    Extend the materialized portfolio series with the new price days
+    """
+    from quotes.models import Portfolio, PortfolioSnapshot
+
+    logger.info("Refreshing portfolio snapshots after market data refresh")
+    PortfolioSnapshot.refresh(Portfolio.objects.all())
+
+
+def _refresh_executor() -> ThreadPoolExecutor:
+    # A single thread: snapshot refreshes queue up instead of writing to the database side by side
+    global _refresh_pool
+    if _refresh_pool is None:
+        _refresh_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="snapshot-refresh")
+    return _refresh_pool
+
+
+def _refresh_portfolio(portfolio_id: int) -> None:
+    from django.db import close_old_connections
+    from quotes.models import Portfolio, PortfolioSnapshot
+
+    try:
+        PortfolioSnapshot.refresh(Portfolio.objects.filter(id=portfolio_id))
+    finally:
+        close_old_connections()
+
+
+@receiver(orders_changed)
+def refresh_changed_portfolio(sender, portfolio, **kwargs):
+    """
+    Recompute the series of the portfolio in the background when websocket clients may follow it,
+    so that they get the corrected points. The request that changed the orders does not wait for it,
+    and without any client the series is only recomputed on its next read (invalidate_ts flagged it).
+    """
+    from django.db import transaction
+    from quotes.updates import has_listeners
+
+    if has_listeners(portfolio.id):
+        transaction.on_commit(lambda: _refresh_executor().submit(_refresh_portfolio, portfolio.id))
+
+
+@receiver(post_delete, sender="quotes.FinancialData")
+@receiver(post_save, sender="quotes.FinancialData")
+def invalidate_price_store(sender, instance, created=False, **kwargs):
+    """
+    The price store only absorbs new rows: deleted or modified ones make it stale until rebuilt
+    """
+    from quotes.price_store import PriceStore
+
+    store = PriceStore.default()
+    if store is not None and not created:
+        store.mark_stale()
+
+
+@receiver(post_delete, sender="quotes.FinancialData")
+@receiver(post_save, sender="quotes.FinancialData")
+def invalidate_portfolio_series(sender, instance, created=False, **kwargs):
+    """
+    Cached portfolio series are only extended after their checkpoint: a price or dividend corrected
+    or removed makes the series of the portfolios trading the instrument wrong from its date.
+    A new row after the instrument's watermark is a new day, which the extension picks up (runs
+    before advance_watermark, so the watermark is still the previous one).
+    """
+    from quotes.models import DataWatermark, Portfolio
+
+    if created:
+        watermark = DataWatermark.latest(instance.id_object_id, instance.field)
+        if watermark is not None and instance.date > watermark:
+            return
+    Portfolio.invalidate_holders(instance.id_object_id, instance.date)
+
+
+@receiver(post_save, sender="quotes.FinancialData")
+def advance_watermark(sender, instance, created, **kwargs):
+    """
+    Rows saved one by one (admin, corrections) move the watermark of their instrument too:
+    forward for new rows, read back from the table for modified ones (their date may have moved)
+    """
+    from quotes.models import DataWatermark
+
+    if created:
+        DataWatermark.advance(instance.id_object, {instance.field: instance.date})
+    else:
+        DataWatermark.recompute(instance.id_object_id, [instance.field])
+
+
+@receiver(post_delete, sender="quotes.FinancialData")
+def lower_watermark(sender, instance, **kwargs):
+    """
+    Deleting the latest row of an instrument moves its watermark back to the row before
+    """
+    from quotes.models import DataWatermark
+
+    if DataWatermark.objects.filter(id_object_id=instance.id_object_id, field=instance.field,
+                                    latest_date__lte=instance.date).exists():
+        DataWatermark.recompute(instance.id_object_id, [instance.field])
+
+
+@receiver(post_delete, sender="quotes.FinancialData")
+@receiver(post_save, sender="quotes.FinancialData")
+def invalidate_instrument_charts(sender, instance, **kwargs):
+    """
+    Rows written one by one (admin, corrections) change the charted market data
+    """
+    from quotes.utils.chart_cache import bump_market_data_version
+
+    bump_market_data_version()
+
+
+@receiver(financial_data_updated)
+def invalidate_after_bulk_update(sender, changes, **kwargs):
+    """
+    Same as the post_save receivers above, for rows updated in bulk
+    """
+    from quotes.models import DataWatermark, Portfolio
+    from quotes.price_store import PriceStore
+    from quotes.utils.chart_cache import bump_market_data_version
+
+    store = PriceStore.default()
+    if store is not None:
+        store.mark_stale()
+    for id_object, first_date in changes.items():
+        Portfolio.invalidate_holders(id_object, first_date)
+        # Dates may have been updated too
+        DataWatermark.recompute(id_object)
+    bump_market_data_version()
@@ -1,6 +1,7 @@
 // Track current state
 let currentTimeframe = 'max';
 let currentMode = 'Returns';
+let currentBasis = 'price';
 
 // Add event listeners to timeframe buttons
 document.querySelectorAll('button[data-timeframe]').forEach(button => {
@@ -23,10 +24,18 @@ document.querySelectorAll('input[name="chartMode"]').forEach(radio => {
     });
 });
 
+// Add event listeners to return basis radio buttons
+document.querySelectorAll('input[name="returnBasis"]').forEach(radio => {
+    radio.addEventListener('change', function() {
+        currentBasis = this.value;
+        updateChart();
+    });
+});
+
 // Function to fetch and update chart
 function updateChart() {
     // Build URL with parameters
-    const url = `/api/chart-data?timeframe=${currentTimeframe}&mode=${currentMode}`;
+    const url = `/api/chart-data?timeframe=${currentTimeframe}&mode=${currentMode}&basis=${currentBasis}`;
     
     // Fetch new chart data
     fetch(url)
@@ -36,4 +45,52 @@ function updateChart() {
             Plotly.react('chartDiv', data.chart.data, data.chart.layout, {responsive: true});
         })
         .catch(error => console.error('Error updating chart:', error));
-}
\ No newline at end of file
+}
+// Snapshot column charted by the current mode and basis
+function chartedField() {
+    const field = currentMode === 'Prices' ? 'value' : 'cumulative_return';
+    return currentBasis === 'total' ? `total_${field}` : field;
+}
+
+// Append the points pushed for a portfolio to its trace, or reload the chart when they don't follow it
+function applyUpdate(update) {
+    const chart = document.getElementById('chartDiv');
+    const index = (chart.data || []).findIndex(trace => trace.meta === update.portfolio);
+    const field = chartedField();
+    if (index < 0 || !update.dates || !update.previous || currentTimeframe === 'custom') {
+        updateChart();
+        return;
+    }
+
+    const trace = chart.data[index];
+    const lastDate = String(trace.x[trace.x.length - 1]).slice(0, 10);
+    const base = update.previous[field];
+    if (lastDate !== update.since || base === null) {
+        updateChart();
+        return;
+    }
+
+    // Returns are charted relative to the first point: chained from the last charted one
+    const lastY = trace.y[trace.y.length - 1];
+    const ys = update.series[field].map(value =>
+        currentMode === 'Prices' ? value : (value === null ? null : (1 + lastY) * value / base - 1));
+    Plotly.extendTraces('chartDiv', {x: [update.dates], y: [ys]}, [index]);
+}
+
+// Data updates pushed by the server, reconnecting with a growing delay
+function subscribeUpdates(delay = 1000) {
+    const scheme = window.location.protocol === 'https:' ? 'wss' : 'ws';
+    const socket = new WebSocket(`${scheme}://${window.location.host}/ws/portfolios/`);
+    socket.onopen = () => { delay = 1000; };
+    socket.onmessage = message => {
+        const update = JSON.parse(message.data);
+        if (update.event === 'data_updated') {
+            applyUpdate(update);
+        }
+    };
+    socket.onclose = () => setTimeout(() => subscribeUpdates(Math.min(delay * 2, 60000)), delay);
+}
+
+if ('WebSocket' in window) {
+    subscribeUpdates();
+}
@@ -0,0 +1,129 @@
+"""
+Push of portfolio data updates to the websocket clients (see quotes.consumers).
+
+Whenever the snapshots of a portfolio are rewritten (new prices, changed orders), a compact
+"data_updated" event carrying only the rewritten points is sent to the channel layer groups
+following that portfolio.
+
+The in-memory channel layer only reaches the clients connected to the process sending the event:
+updates made by other processes (runscheduler, snapshotportfolios) need a shared layer such as
+channels_redis (see CHANNEL_LAYERS).
+"""
+from collections import Counter
+from datetime import date
+from typing import Optional
+import asyncio
+import logging
+import threading
+
+import pandas as pd
+from asgiref.sync import async_to_sync
+from channels.layers import InMemoryChannelLayer, get_channel_layer
+
+logger = logging.getLogger(__name__)
+
+ALL_PORTFOLIOS_GROUP = "portfolio_updates"
+
+# Event loop of the websocket consumers, and their number per group: the in-memory layer only
+# lives in their process
+_consumers_loop: Optional[asyncio.AbstractEventLoop] = None
+_subscribers: Counter = Counter()
+_subscribers_lock = threading.Lock()
+
+
+def portfolio_group(portfolio_id: Optional[int] = None) -> str:
+    """
+    Channel layer group following one portfolio, or all of them if None
+    """
+    return ALL_PORTFOLIOS_GROUP if portfolio_id is None else f"portfolio_{portfolio_id}_updates"
+
+
+def subscribe(group: str, loop: asyncio.AbstractEventLoop) -> None:
+    """
+    A consumer joined a group from this event loop: in-memory events are sent to it from now on
+    """
+    global _consumers_loop
+    with _subscribers_lock:
+        _consumers_loop = loop
+        _subscribers[group] += 1
+
+
+def unsubscribe(group: str) -> None:
+    """
+    A consumer left a group
+    """
+    with _subscribers_lock:
+        _subscribers[group] -= 1
+        if _subscribers[group] <= 0:
+            del _subscribers[group]
+
+
+def shared_layer() -> bool:
+    """
+    True if the channel layer reaches the clients of other processes (not the in-memory one)
+    """
+    layer = get_channel_layer()
+    return layer is not None and not isinstance(layer, InMemoryChannelLayer)
+
+
+def _values(values) -> list[Optional[float]]:
+    return [None if pd.isna(value) else float(value) for value in values]
+
+
+def series_event(portfolio_id: int, frame: pd.DataFrame, since: Optional[date],
+                 previous: Optional[pd.Series] = None) -> dict:
+    """
+    Event for the snapshots rewritten after `since`: their dates and the values of each column,
+    with the last unchanged row to chain them to. Without `since`, the whole series was rewritten
+    and the event carries no point: clients reload it.
+    """
+    event = {"type": "data.updated", "portfolio": portfolio_id, "since": since.isoformat() if since else None}
+    if since is not None:
+        event["dates"] = [day.isoformat() for day in frame.index]
+        event["series"] = {column: _values(frame[column]) for column in frame.columns}
+        event["previous"] = None if previous is None else dict(zip(previous.index, _values(previous)))
+    return event
+
+
+def _listening(layer, portfolio_id: Optional[int]) -> bool:
+    # A shared layer may have subscribers in any process, the in-memory one only those counted here
+    if not isinstance(layer, InMemoryChannelLayer):
+        return True
+    if _consumers_loop is None or not _consumers_loop.is_running():
+        return False
+    with _subscribers_lock:
+        if portfolio_id is None:
+            return bool(_subscribers)
+        return _subscribers[portfolio_group()] > 0 or _subscribers[portfolio_group(portfolio_id)] > 0
+
+
+def has_listeners(portfolio_id: Optional[int] = None) -> bool:
+    """
+    True if websocket clients may be following the updates of a portfolio (of any if None) sent from this process
+    """
+    layer = get_channel_layer()
+    return layer is not None and _listening(layer, portfolio_id)
+
+
+def _send(layer, event: dict) -> None:
+    for group in (portfolio_group(), portfolio_group(event["portfolio"])):
+        if isinstance(layer, InMemoryChannelLayer):
+            # Its queues belong to the consumers' loop: sent from any thread through it
+            asyncio.run_coroutine_threadsafe(layer.group_send(group, event), _consumers_loop)
+        else:
+            async_to_sync(layer.group_send)(group, event)
+
+
+def broadcast_series_update(portfolio_id: int, frame: pd.DataFrame, since: Optional[date],
+                            previous: Optional[pd.Series] = None) -> None:
+    """
+    Send the rewritten snapshots of a portfolio to its websocket clients. Failures are only logged:
+    the snapshots are written whatever happens to the notification.
+    """
+    layer = get_channel_layer()
+    if layer is None or not _listening(layer, portfolio_id):
+        return
+    try:
+        _send(layer, series_event(portfolio_id, frame, since, previous))
+    except Exception:
+        logger.exception(f"Could not broadcast the update of portfolio {portfolio_id}")
@@ -7,9 +7,13 @@ urlpatterns = [
 	path('about.html', views.about, name="about"),
 	path("portfolio/<str:pk>/", views.portfolio, name="portfolio"),
     path("portfolio/<str:pk>/chart/", views.portfolio_chart_data, name="portfolio_chart_data"),
+    path("portfolio/<str:pk>/export/", views.export_portfolio_series, name="export_portfolio_series"),
     path("instrument-comparison", views.instrument_comparison, name="instrument_comparison"),
+    path("api/instrument-comparison", views.instrument_comparison_data, name="instrument_comparison_data"),
+    path("api/export/financial-data", views.export_financial_data, name="export_financial_data"),
     path('api/delete-order/<int:order_id>/', views.delete_order, name="delete_order"),
     path('api/add-order/<str:pk>/', views.add_order, name="add_order"),
+    path('api/import-orders/<str:pk>/', views.import_orders_file, name="import_orders"),
     path("portfolio/<str:pk>/orders/", views.portfolio_orders, name="portfolio_orders"),
     path("order_form/<str:pk>/", views.order_form, name="order_form"),
     path("order/<int:order_id>/edit/", views.edit_order, name="edit_order"),
@@ -0,0 +1,45 @@
+"""
+Bounded thread pool running the blocking work (queries, computations, charts) of the async views.
+
+Independent pieces of a page are run concurrently, at most VIEW_WORKERS at a time across all
+requests, so that a slow portfolio only holds its own threads. Each call closes the database
+connection of its thread when done, as Django does at the end of a request.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+
+_executor = None
+
+
+def executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=settings.VIEW_WORKERS, thread_name_prefix="quotes-view")
+    return _executor
+
+
+def _closing(func: Callable[[], Any]) -> Any:
+    try:
+        return func()
+    finally:
+        close_old_connections()
+
+
+async def run(func: Callable, *args, **kwargs) -> Any:
+    """
+    Result of a blocking call, run in the pool
+    """
+    return await sync_to_async(_closing, thread_sensitive=False, executor=executor())(partial(func, *args, **kwargs))
+
+
+async def gather(*calls: Callable[[], Any]) -> list:
+    """
+    Results of several blocking calls without arguments, run concurrently in the pool
+    """
+    return list(await asyncio.gather(*(run(call) for call in calls)))
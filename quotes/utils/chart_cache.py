@@ -0,0 +1,122 @@
+"""
+Cache of serialized chart payloads, stored gzip-compressed.
+
+A payload is keyed by the request parameters and by a version token per portfolio, which
+changes whenever the portfolio's snapshots are rewritten (new prices or orders). Instrument
+charts use a single market data token instead, changing with any price or dividend written.
+The same key is sent as ETag, suffixed with -gzip for compressed bodies so that each encoding
+has its own validator, and browsers get 304 Not Modified until the charted data changes.
+"""
+from datetime import date
+from typing import Callable, Iterable
+from uuid import uuid4
+import gzip
+import hashlib
+import json
+
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+
+PAYLOAD_TIMEOUT = 24 * 3600
+MARKET_DATA_VERSION_KEY = "market_data_version"
+
+
+def _version_key(portfolio_id: int) -> str:
+    return f"portfolio_{portfolio_id}_version"
+
+
+def bump_portfolio_versions(portfolio_ids: Iterable[int]) -> None:
+    """
+    The snapshots of these portfolios changed, or are about to: their cached charts are obsolete
+    """
+    cache.set_many({_version_key(ptf_id): uuid4().hex for ptf_id in portfolio_ids}, timeout=None)
+
+
+def portfolio_versions(portfolio_ids: Iterable[int]) -> dict[int, str]:
+    """
+    {portfolio id: version token}, in one cache call. Order changes bump it as soon as they are made.
+    """
+    portfolio_ids = list(portfolio_ids)
+    found = cache.get_many([_version_key(ptf_id) for ptf_id in portfolio_ids])
+
+    # Unknown version (cache cleared): start a new one rather than reuse an old tag
+    missing = {_version_key(ptf_id): uuid4().hex for ptf_id in portfolio_ids if _version_key(ptf_id) not in found}
+    if missing:
+        cache.set_many(missing, timeout=None)
+        found.update(missing)
+
+    return {ptf_id: found[_version_key(ptf_id)] for ptf_id in portfolio_ids}
+
+
+def bump_market_data_version() -> None:
+    """
+    Prices or dividends were written: cached instrument charts are obsolete
+    """
+    cache.set(MARKET_DATA_VERSION_KEY, uuid4().hex, timeout=None)
+
+
+def market_data_version() -> str:
+    """
+    Token of the market data, started anew when unknown (cache cleared)
+    """
+    version = cache.get(MARKET_DATA_VERSION_KEY)
+    if version is None:
+        version = uuid4().hex
+        cache.set(MARKET_DATA_VERSION_KEY, version, timeout=None)
+    return version
+
+
+def instruments_etag(name: str, params: dict) -> str:
+    """
+    Tag of an instrument chart: which chart, with which parameters, on which market data
+    """
+    raw = json.dumps([name, sorted(params.items()), market_data_version(), date.today().isoformat()])
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+def chart_etag(portfolio_ids: Iterable[int], name: str, params: dict) -> str:
+    """
+    Tag of a chart: which chart, with which parameters, on which portfolio versions.
+    Today's date is part of it, as timeframes like 1M move with it.
+    """
+    versions = portfolio_versions(portfolio_ids)
+    raw = json.dumps([name, sorted(params.items()), sorted(versions.items()), date.today().isoformat()])
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+def get_or_build_payload(etag: str, build: Callable[[], str]) -> bytes:
+    """
+    Gzip-compressed payload of a chart, built and serialized once per tag
+    """
+    key = f"chart_payload_{etag}"
+    payload = cache.get(key)
+    if payload is None:
+        payload = gzip.compress(build().encode(), compresslevel=6)
+        cache.set(key, payload, timeout=PAYLOAD_TIMEOUT)
+    return payload
+
+
+def accepts_gzip(request) -> bool:
+    return "gzip" in request.headers.get("Accept-Encoding", "")
+
+
+def encoded_etag(request, tag: str) -> str:
+    """
+    ETag of the response to a request for a payload: the gzip and identity bodies differ, so do their tags
+    """
+    return f"{tag}-gzip" if accepts_gzip(request) else tag
+
+
+def payload_response(request, payload: bytes) -> HttpResponse:
+    """
+    JSON response sending the stored bytes as they are to clients accepting gzip
+    """
+    if accepts_gzip(request):
+        response = HttpResponse(payload, content_type="application/json")
+        response["Content-Encoding"] = "gzip"
+    else:
+        response = HttpResponse(gzip.decompress(payload), content_type="application/json")
+
+    patch_vary_headers(response, ["Accept-Encoding"])
+    return response
@@ -1,11 +1,19 @@
 from datetime import datetime, date
+import json
 import plotly.graph_objects as go
 import pandas as pd
+import numpy as np
+from plotly.utils import PlotlyJSONEncoder
 
-from quotes.models import Portfolio
+from quotes.models import Portfolio, PortfolioSnapshot
+from quotes.analytics import downsample, compute_performance
 from quotes.utils.date_helpers import prev_business_day, get_first_business_day_of_month
+from quotes.utils.chart_cache import chart_etag, get_or_build_payload
 
 
+# Price return, or total return with dividends reinvested
+RETURN_BASES = ("price", "total")
+
 user_colors = {
     "Guillaume": "darkorange",
     "Marie": "darkgreen",
@@ -60,34 +68,44 @@ def timeframe_to_limit_date(time_frame: str) -> date:
             return date(2000, 1, 1)
 
 
+def horizon_limits(horizons: list[str]) -> dict[str, date | None]:
+    """
+    {horizon: limit date} for the performance engine, "ITD" (since inception) mapping to None
+    """
+    return {horizon: None if horizon.lower() == "itd" else timeframe_to_limit_date(horizon) for horizon in horizons}
+
+
+
+def snapshot_field(chart_mode: str, basis: str = "price") -> str:
+    """
+    Snapshot column holding the series of a chart mode ("Prices" or "Returns") on a return basis
+    """
+    if basis not in RETURN_BASES:
+        raise ValueError(f"basis must be one of {', '.join(RETURN_BASES)}")
+    field = "value" if chart_mode == "Prices" else "cumulative_return"
+    return f"total_{field}" if basis == "total" else field
 
 
-def create_portfolio_chart(portfolios: list[Portfolio], chart_mode: str, time_frame: str, custom_dates: list[datetime]) -> go.Figure:
+def create_portfolio_chart(portfolios: list[Portfolio], chart_mode: str, time_frame: str, custom_dates: list[datetime],
+                           sampling: str = "auto", point_budget: int | None = None, basis: str = "price") -> go.Figure:
     """
-    Depending on the price/return series requested, provide the series to chart on the right time frame.
+    Depending on the price/return series requested, provide the series to chart on the right time frame,
+    downsampled with the sampling method (see quotes.analytics.downsampling) to about point_budget points.
+    basis selects price return or total return (dividends reinvested) series, both materialized together.
     """
     if not chart_mode in ["Prices", "Returns"]:
         raise Exception("chart_mode parameter is not right: either prices or returns.")
     
-    # Ensure all portfolios have time series data loaded
-    for ptf in portfolios:
-        if ptf.ts_ret is None:
-            ptf.get_TS()
-    
-    ts_mode = "ts_val" if chart_mode == "Prices" else "ts_cumul_ret"
+    ts_field = snapshot_field(chart_mode, basis)
 
-    # Get relevant series on the adequate time frame
+    # Get relevant series on the adequate time frame, read from the materialized snapshots
     if time_frame == "custom":
-        start, end = [datetime.strptime(date, "%Y-%m-%d") for date in custom_dates]
-        l_ts = [
-            getattr(ptf, ts_mode)[(start.date() <= getattr(ptf, ts_mode).index) & (getattr(ptf, ts_mode).index <= end.date())]
-            for ptf in portfolios]
-    
+        start, end = [datetime.strptime(date, "%Y-%m-%d").date() for date in custom_dates]
     else:
-        limit_date = timeframe_to_limit_date(time_frame)
-        l_ts = [
-            getattr(ptf, ts_mode)[getattr(ptf, ts_mode).index >= limit_date]
-            for ptf in portfolios]
+        start, end = timeframe_to_limit_date(time_frame), None
+
+    series = PortfolioSnapshot.get_series(portfolios, ts_field, start, end)
+    l_ts = [downsample(series[ptf.id], sampling, point_budget) for ptf in portfolios]
 
     l_traces = []
 
@@ -97,6 +115,7 @@ def create_portfolio_chart(portfolios: list[Portfolio], chart_mode: str, time_fr
             x=list(ts.index),
             y=list(ts.values) if chart_mode == "Prices" else list((ts/ts.iloc[0]).values -1),
             name=portfolios[i].owner.name,
+            meta=portfolios[i].id,  # lets pushed updates find the trace of their portfolio
             line = {"color": user_colors[portfolios[i].owner.name], "width": 4}
         )
         l_traces.append(chart)
@@ -166,48 +185,36 @@ def create_portfolio_chart(portfolios: list[Portfolio], chart_mode: str, time_fr
     return fig
 
 
-def get_portfolio_performance(portfolios: list[Portfolio], latest_date: date) -> list[dict]:
+def home_chart_payload(portfolios: list[Portfolio]) -> bytes:
+    """
+    Serialized returns chart of the home page, gzip-compressed and cached until the snapshots change
+    """
+    tag = chart_etag([ptf.id for ptf in portfolios], "home", {})
+    return get_or_build_payload(tag, lambda: json.dumps(create_portfolio_chart(portfolios, "Returns", "max", None),
+                                                        cls=PlotlyJSONEncoder))
+
+
+def get_portfolio_performance(portfolios: list[Portfolio], latest_date: date,
+                              timeframes: tuple[str, ...] = ("1M", "3M", "6M", "YTD", "1Y")) -> list[dict]:
     """
     Calculate performance for each portfolio across different timeframes.
     Returns a list of dicts with portfolio info and performance data.
     """
-    timeframes = ["1M", "3M", "6M", "YTD", "1Y"]
-    limit_dates = [timeframe_to_limit_date(tmf) for tmf in timeframes]
-    
-    # Ensure all portfolios have time series data loaded
-    for ptf in portfolios:
-        if ptf.ts_ret is None:
-            ptf.get_TS()
-    
-    # Get available dates from first portfolio
-    available_dates = list(portfolios[0].ts_val.index)
-    
-    # Adjust limit dates to closest available date before the target
-    for i, limit_date in enumerate(limit_dates):
-        if limit_date not in available_dates:
-            closest_dates = [d for d in available_dates if d < limit_date]
-            if closest_dates:
-                limit_dates[i] = max(closest_dates)
-    
-    # Calculate performance for each portfolio
-    performance_data = []
-    for ptf in portfolios:
-        perf_dict = {
+    # Cumulative returns of all portfolios, in one query on the snapshots table
+    cumul_rets = PortfolioSnapshot.get_series(portfolios, "cumulative_return", end=latest_date)
+
+    # Every portfolio anchored on its own dates: the last one on or before each limit date
+    performance = compute_performance(cumul_rets, horizon_limits(list(timeframes)), end=latest_date)
+
+    # Portfolios not valued on the latest date get no returns, rather than returns up to an earlier date
+    valued = {key: end == np.datetime64(latest_date, "D") for key, end in zip(performance.keys, performance.end_dates)}
+
+    return [
+        {
             'portfolio_name': f"{ptf.owner.name} - {ptf.name}",
             'portfolio_id': ptf.id,
             'owner_name': ptf.owner.name,
-            'performances': []
+            'performances': performance.row(ptf.id) if valued[ptf.id] else [None] * len(timeframes),
         }
-        
-        for limit_date in limit_dates:
-            if limit_date in ptf.ts_cumul_ret.index and latest_date in ptf.ts_cumul_ret.index:
-                perf = ptf.ts_cumul_ret[latest_date] / ptf.ts_cumul_ret[limit_date] - 1
-                perf_dict['performances'].append(perf)
-            else:
-                perf_dict['performances'].append(None)
-        
-        performance_data.append(perf_dict)
-    
-    return performance_data
-
-
+        for ptf in portfolios
+    ]
@@ -1,30 +1,27 @@
 import numpy as np
+import pandas as pd
 import plotly.graph_objects as go
 from datetime import datetime
 from typing import Optional
 
-from quotes.models import Portfolio, FinancialData, Order
-from quotes.utils.chart_creation import timeframe_to_limit_date
+from quotes.models import Portfolio, PortfolioSnapshot, FinancialData, DataWatermark, YahooFinanceQuery
+from quotes.utils.chart_creation import timeframe_to_limit_date, snapshot_field
+from quotes.analytics import downsample
 
 def performance_overview(id_portfolio):
     """
     Create the performance overview table showing portfolio positions.
     """
     ptf = Portfolio.objects.get(id=id_portfolio)
-    latest_date = FinancialData.get_price_most_recent_date()
+    latest_date = DataWatermark.as_of_date()
 
     df = ptf.inventory_df()
     df["Amount_Paid"] = df["PRU"] * df["Number"]
 
-    prices_map = dict(
-        FinancialData.objects
-        .filter(id_object__in=df["Id"].tolist(), 
-                field="NAV", 
-                origin="Yahoo Finance", 
-                date=latest_date)
-        .values_list("id_object_id", "value")
-    )
-    prices = [prices_map.get(id) for id in df["Id"].tolist()]
+    panel = YahooFinanceQuery.get_panel(df["Id"].tolist(), latest_date, latest_date,
+                                        fields=[FinancialData.TimeSeriesField.NAV])
+    prices_map = dict(zip(panel.ids, panel.nav[0])) if len(panel.dates) else {}
+    prices = [prices_map.get(id, np.nan) for id in df["Id"].tolist()]
     
     df["Current_Value"] = np.multiply(df["Number"], np.array(prices))
     df.sort_values(by="Current_Value", ascending=False, inplace=True)
@@ -41,28 +38,6 @@ def performance_overview(id_portfolio):
     return df.to_dict(orient="records")
 
 
-def get_order_history(portfolio_id):
-    """
-    Get all orders for a portfolio.
-    Returns a list of dicts with order details.
-    """
-    portfolio = Portfolio.objects.get(id=portfolio_id)
-    orders = Order.objects.filter(portfolio=portfolio).order_by('-date')
-
-    l_dicts = []
-    for order in orders:
-        d = {
-            'id': order.id,
-            'date': order.date,
-            'id_object': order.id_object.name,
-            'direction': order.direction,
-            'nb_items': order.nb_items,
-            'price': order.price,
-            'total_fee': order.total_fee,
-        }
-        l_dicts.append(d)
-    return l_dicts
-
 def create_allocation_chart(portfolio_id):
     """
     Create a pie chart showing the allocation of the portfolio.
@@ -97,7 +72,9 @@ def create_allocation_chart(portfolio_id):
     
     return fig
 
-def create_portfolio_performance_chart(portfolio_id, time_frame='max', start_date: Optional[str]=None, end_date: Optional[str]=None):
+def create_portfolio_performance_chart(portfolio_id, time_frame='max', start_date: Optional[str]=None, end_date: Optional[str]=None,
+                                       sampling: str='auto', point_budget: Optional[int]=None, basis: str='price',
+                                       series: Optional[pd.Series]=None):
     """
     Create a time series chart showing portfolio performance over time.
     Single portfolio version - no legend needed.
@@ -107,24 +84,36 @@ def create_portfolio_performance_chart(portfolio_id, time_frame='max', start_dat
         time_frame: '1m', '3m', '6m', 'ytd', '1y', '3y', 'max'
         start_date: Optional custom start date (YYYY-MM-DD string)
         end_date: Optional custom end date (YYYY-MM-DD string)
+        sampling: 'auto', 'none', 'weekly', 'monthly' or 'lttb' (see quotes.analytics.downsampling)
+        point_budget: Approximate number of points to draw with 'auto' and 'lttb'
+        basis: 'price' or 'total' (dividends reinvested) return
+        series: Cumulative return series of the portfolio on that basis, if already computed,
+            instead of the one read from the snapshots
     
     Returns:
         Plotly Figure
     """
     ptf = Portfolio.objects.get(id=portfolio_id)
     
-    # Ensure time series is loaded
-    if ptf.ts_cumul_ret is None:
-        ptf.get_TS()
-    
     # Filter by timeframe
     if start_date and end_date:
         start = datetime.strptime(start_date, '%Y-%m-%d').date()
         end = datetime.strptime(end_date, '%Y-%m-%d').date()
-        ts = ptf.ts_cumul_ret[(ptf.ts_cumul_ret.index >= start) & (ptf.ts_cumul_ret.index <= end)]
     else:
-        limit_date = timeframe_to_limit_date(time_frame)
-        ts = ptf.ts_cumul_ret[ptf.ts_cumul_ret.index >= limit_date]
+        start, end = timeframe_to_limit_date(time_frame), None
+
+    if series is None:
+        # Read from the materialized snapshots
+        ts = PortfolioSnapshot.get_series([ptf], snapshot_field("Returns", basis), start, end)[ptf.id]
+    else:
+        # Same dates as the snapshot range query
+        in_range = np.ones(len(series), dtype=bool)
+        if start is not None:
+            in_range &= series.index >= start
+        if end is not None:
+            in_range &= series.index <= end
+        ts = series[in_range]
+    ts = downsample(ts, sampling, point_budget)
     
     # Normalize to start at 0% for returns view
     ts_normalized = (ts / ts.iloc[0]) - 1
@@ -0,0 +1,196 @@
+"""
+Streamed exports of portfolio series and instrument history, as CSV or Parquet.
+
+Rows are read from the database in chunks with .iterator(), and each chunk is serialized and
+handed out before the next one is read: memory stays bounded whatever the length of the history.
+Parquet files are written one row group per chunk, and need pyarrow.
+Under ASGI, async_chunks hands the chunks out one at a time to the event loop.
+"""
+from dataclasses import dataclass
+from datetime import date
+from importlib.util import find_spec
+from typing import AsyncIterator, Iterable, Iterator, Optional
+import csv
+import io
+
+import pandas as pd
+from asgiref.sync import sync_to_async
+
+from quotes.models import FinancialData, Portfolio, PortfolioSnapshot
+
+EXPORT_FORMATS = ("csv", "parquet")
+CHUNK_SIZE = 10000
+
+CONTENT_TYPES = {
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+# Exported columns and their Arrow types, declared rather than inferred from the first chunk:
+# every row group of a Parquet file must have the same schema, even when a chunk only holds nulls
+SNAPSHOT_COLUMNS = {
+    "portfolio_id": "int64",
+    "date": "date32",
+    "value": "float64",
+    "daily_return": "float64",
+    "cumulative_return": "float64",
+    "total_value": "float64",
+    "total_daily_return": "float64",
+    "total_cumulative_return": "float64",
+}
+FINANCIAL_DATA_COLUMNS = {
+    "object_id": "int64",
+    "ticker": "string",
+    "date": "date32",
+    "field": "string",
+    "value": "float64",
+    "origin": "string",
+}
+
+
+@dataclass
+class Export:
+    """
+    Rows to export, lazily read, with their columns ({name: Arrow type})
+    """
+    columns: dict[str, str]
+    rows: Iterator[tuple]
+
+
+def _chunks(rows: Iterator[tuple], size: int) -> Iterator[list[tuple]]:
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def portfolio_series_export(portfolios: Iterable[Portfolio], start: Optional[date] = None,
+                            end: Optional[date] = None) -> Export:
+    """
+    Daily value and return series of portfolios, from the snapshot table brought up to date first
+    """
+    portfolios = list(portfolios)
+    PortfolioSnapshot.refresh_stale(portfolios)
+
+    rows = PortfolioSnapshot.objects.filter(portfolio__in=portfolios)
+    if start is not None:
+        rows = rows.filter(date__gte=start)
+    if end is not None:
+        rows = rows.filter(date__lte=end)
+
+    rows = rows.order_by("portfolio", "date").values_list(*SNAPSHOT_COLUMNS).iterator(chunk_size=CHUNK_SIZE)
+    return Export(SNAPSHOT_COLUMNS, rows)
+
+
+def financial_data_export(object_ids: Optional[list[int]] = None, field: Optional[str] = None,
+                          start: Optional[date] = None, end: Optional[date] = None) -> Export:
+    """
+    Raw price/dividend history of instruments (all of them if object_ids is None)
+    """
+    if field is not None and field not in FinancialData.TimeSeriesField.values:
+        raise ValueError(f"field must be one of {', '.join(FinancialData.TimeSeriesField.values)}")
+
+    rows = FinancialData.objects.all()
+    if object_ids:
+        rows = rows.filter(id_object__in=object_ids)
+    if field is not None:
+        rows = rows.filter(field=field)
+    if start is not None:
+        rows = rows.filter(date__gte=start)
+    if end is not None:
+        rows = rows.filter(date__lte=end)
+
+    rows = (rows.order_by("id_object", "date", "field")
+            .values_list("id_object_id", "id_object__ticker", "date", "field", "value", "origin")
+            .iterator(chunk_size=CHUNK_SIZE))
+    return Export(FINANCIAL_DATA_COLUMNS, rows)
+
+
+def _stream_csv(export: Export) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(export.columns)
+    for chunk in _chunks(export.rows, CHUNK_SIZE):
+        writer.writerows(chunk)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    # Header only when there is no row
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+class _ParquetSink(io.RawIOBase):
+    """
+    Write-only file handing out what was written so far: pyarrow sees one growing file
+    """
+    def __init__(self):
+        self.parts = []
+        self.position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.parts.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def pop(self) -> bytes:
+        data, self.parts = b"".join(self.parts), []
+        return data
+
+
+def _stream_parquet(export: Export) -> Iterator[bytes]:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    sink = _ParquetSink()
+    names = list(export.columns)
+    schema = pa.schema([(name, getattr(pa, arrow_type)()) for name, arrow_type in export.columns.items()])
+
+    # Opened before the first chunk: without any row, the file still has the columns
+    writer = pq.ParquetWriter(sink, schema)
+    for chunk in _chunks(export.rows, CHUNK_SIZE):
+        frame = pd.DataFrame.from_records(chunk, columns=names)
+        writer.write_table(pa.Table.from_pandas(frame, schema=schema, preserve_index=False))
+        yield sink.pop()
+
+    writer.close()
+    yield sink.pop()
+
+
+def stream_export(export: Export, file_format: str = "csv") -> Iterator[bytes]:
+    """
+    Serialized export, chunk by chunk. Raises ValueError for an unknown or unavailable format.
+    """
+    if file_format not in EXPORT_FORMATS:
+        raise ValueError(f"format must be one of {', '.join(EXPORT_FORMATS)}")
+    if file_format == "parquet":
+        if find_spec("pyarrow") is None:
+            raise ValueError("parquet export needs pyarrow")
+        return _stream_parquet(export)
+    return _stream_csv(export)
+
+
+async def async_chunks(chunks: Iterator[bytes]) -> AsyncIterator[bytes]:
+    """
+    Async iterator over the chunks of a stream_export, each one read and serialized by its own
+    sync_to_async call: a StreamingHttpResponse given a sync iterator under ASGI would buffer the
+    whole export first. The calls are thread sensitive, as the database cursor of the rows
+    can only be used from the thread that opened it.
+    """
+    next_chunk = sync_to_async(next, thread_sensitive=True)
+    try:
+        while (chunk := await next_chunk(chunks, None)) is not None:
+            yield chunk
+    finally:
+        # Client gone before the end: the rows cursor is released
+        await sync_to_async(chunks.close, thread_sensitive=True)()
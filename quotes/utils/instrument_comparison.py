@@ -0,0 +1,69 @@
+"""
+Instrument comparison: rebased price or total-return series of several instruments.
+"""
+from datetime import date
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from quotes.models import FinancialObject, FinancialData, DataWatermark, YahooFinanceQuery
+from quotes.analytics import downsample, rebase
+from quotes.utils.chart_creation import timeframe_to_limit_date
+
+MAX_COMPARED_INSTRUMENTS = 20
+
+
+def compare_instruments(ids: list[int], time_frame: str = "1y", base_date: Optional[date] = None, basis: str = "price",
+                        sampling: str = "auto", point_budget: Optional[int] = None) -> dict:
+    """
+    Cumulative returns of instruments over a time frame, all rebased on the same date, as a JSON-ready dict.
+
+    The prices and dividends of every instrument come from one panel read, and are rebased together.
+    Each series is then downsampled to about point_budget points (see quotes.analytics.downsampling).
+
+    Args:
+        ids: FinancialObject ids, at most MAX_COMPARED_INSTRUMENTS
+        time_frame: '1m', '3m', '6m', 'ytd', '1y', '3y', 'max'...
+        base_date: date the returns are measured from, the start of the time frame if None
+        basis: 'price', or 'total' for dividends reinvested
+    """
+    if len(ids) > MAX_COMPARED_INSTRUMENTS:
+        raise ValueError(f"At most {MAX_COMPARED_INSTRUMENTS} instruments can be compared")
+
+    instruments = FinancialObject.objects.in_bulk(ids)
+    unknown = [id for id in ids if id not in instruments]
+    if unknown:
+        raise ValueError(f"Unknown instruments: {', '.join(map(str, unknown))}")
+
+    start = timeframe_to_limit_date(time_frame)
+    if start is None:
+        raise ValueError(f"Unknown timeframe {time_frame}")
+    base_date = base_date or start
+    end = DataWatermark.as_of_date() or date.today()
+
+    panel = YahooFinanceQuery.get_panel(ids, min(start, base_date), end,
+                                        fields=[FinancialData.TimeSeriesField.NAV, FinancialData.TimeSeriesField.Dividends])
+    rebased = rebase(panel.dates, panel.nav, panel.dividends, base_date, total_return=basis == "total")
+
+    # Only the dates of the time frame are sent
+    shown = panel.dates >= np.datetime64(start, "D")
+    index = pd.DatetimeIndex(panel.dates[shown])
+
+    series = []
+    for id in ids:
+        ts = pd.Series(rebased[shown, panel.ids.index(id)], index=index).dropna()
+        ts = downsample(ts, sampling, point_budget)
+        series.append({
+            "id": id,
+            "name": instruments[id].name,
+            "dates": ts.index.strftime("%Y-%m-%d").tolist(),
+            "returns": ts.round(6).tolist(),
+        })
+
+    return {
+        "timeframe": time_frame,
+        "base_date": base_date.isoformat(),
+        "basis": basis,
+        "series": series,
+    }
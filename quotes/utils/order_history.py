@@ -0,0 +1,77 @@
+"""
+Order history of a portfolio, one page at a time, most recent orders first.
+
+Pages are delimited by the (date, id) of their first and last orders (keyset pagination)
+rather than by an offset: each page is a single indexed query with the instrument name
+joined, whatever the number of orders before it.
+"""
+from dataclasses import dataclass
+from datetime import date
+from typing import Optional
+
+from django.db.models import F, Q
+
+from quotes.models import Order
+
+PAGE_SIZE = 25
+ORDER_FIELDS = ("id", "date", "direction", "nb_items", "price", "total_fee")
+
+
+@dataclass
+class OrderPage:
+    """
+    Orders of one page, as dicts with the instrument name, and the cursors of the adjacent pages
+    """
+    rows: list[dict]
+    has_newer: bool
+    has_older: bool
+
+    @property
+    def newer_cursor(self) -> Optional[str]:
+        return encode_cursor(self.rows[0]) if self.has_newer and self.rows else None
+
+    @property
+    def older_cursor(self) -> Optional[str]:
+        return encode_cursor(self.rows[-1]) if self.has_older and self.rows else None
+
+
+def encode_cursor(row: dict) -> str:
+    return f"{row['date'].isoformat()}_{row['id']}"
+
+
+def decode_cursor(cursor: str) -> tuple[date, int]:
+    """
+    (date, id) of a cursor, ValueError if malformed
+    """
+    day, _, id = cursor.partition("_")
+    try:
+        return date.fromisoformat(day), int(id)
+    except ValueError:
+        raise ValueError(f"Invalid page cursor {cursor!r}")
+
+
+def get_order_history(portfolio_id: int, older_than: Optional[str] = None, newer_than: Optional[str] = None,
+                      page_size: int = PAGE_SIZE) -> OrderPage:
+    """
+    One page of orders of a portfolio: the most recent ones, those just older than a cursor,
+    or those just newer than a cursor
+    """
+    orders = Order.objects.filter(portfolio_id=portfolio_id)
+
+    if newer_than is not None:
+        day, id = decode_cursor(newer_than)
+        orders = orders.filter(Q(date__gt=day) | Q(date=day, id__gt=id)).order_by("date", "id")
+    else:
+        if older_than is not None:
+            day, id = decode_cursor(older_than)
+            orders = orders.filter(Q(date__lt=day) | Q(date=day, id__lt=id))
+        orders = orders.order_by("-date", "-id")
+
+    # One more row than the page tells whether there is another page beyond it
+    rows = list(orders.values(*ORDER_FIELDS, instrument=F("id_object__name"))[:page_size + 1])
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+
+    if newer_than is not None:
+        return OrderPage(rows=rows[::-1], has_newer=has_more, has_older=True)
+    return OrderPage(rows=rows, has_newer=older_than is not None, has_older=has_more)
@@ -0,0 +1,223 @@
+"""
+Bulk import of orders from broker statements, as CSV or XLSX files.
+
+The file needs a header row with the columns date, instrument (ticker or ISIN), direction
+(BUY/SELL), nb_items, price and optionally total_fee. Every row is validated before anything
+is written, sales included against the positions they sell from. Instruments are resolved with
+a single query, the orders are then inserted with bulk_create in one transaction, and the
+portfolio's cached series invalidated once.
+"""
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from pathlib import Path
+from typing import IO, Iterator, Optional
+import csv
+import io
+import logging
+import math
+
+import pandas as pd
+from django.db import transaction
+from django.db.models import Q
+
+from quotes.models import FinancialObject, Order, Portfolio
+from quotes.signals import orders_changed
+
+logger = logging.getLogger(__name__)
+
+IMPORT_FORMATS = ("csv", "xlsx")
+REQUIRED_COLUMNS = ("date", "instrument", "direction", "nb_items", "price")
+DATE_FORMATS = ("%Y-%m-%d", "%d/%m/%Y")
+
+
+@dataclass
+class ImportResult:
+    """
+    Orders read from a file, and the errors found, one per invalid row. Nothing is written if any.
+    """
+    orders: list[Order] = field(default_factory=list)
+    errors: list[str] = field(default_factory=list)
+
+    @property
+    def first_date(self) -> Optional[date]:
+        return min((order.date for order in self.orders), default=None)
+
+
+def import_format(filename: str) -> str:
+    """
+    Format of a file, from its extension
+    """
+    suffix = Path(filename).suffix.lower().lstrip(".")
+    if suffix not in IMPORT_FORMATS:
+        raise ValueError(f"File must be one of {', '.join(IMPORT_FORMATS)}")
+    return suffix
+
+
+def _read_csv(file: IO[bytes]) -> Iterator[tuple]:
+    # utf-8-sig: broker exports often start with a byte order mark
+    text = io.TextIOWrapper(file, encoding="utf-8-sig", newline="")
+    try:
+        dialect = csv.Sniffer().sniff(text.readline(), delimiters=",;\t")
+    except csv.Error:
+        dialect = csv.excel
+    text.seek(0)
+    reader = csv.reader(text, dialect)
+    try:
+        yield from reader
+    except csv.Error as e:
+        # Malformed file (NUL byte, unterminated quote...): reported like any other invalid file
+        raise ValueError(f"Line {reader.line_num}: not a valid CSV file ({e})")
+
+
+def _read_xlsx(file: IO[bytes]) -> Iterator[tuple]:
+    from zipfile import BadZipFile
+    from openpyxl import load_workbook
+    from openpyxl.utils.exceptions import InvalidFileException
+
+    # Read-only mode streams the rows instead of loading the whole workbook
+    try:
+        workbook = load_workbook(file, read_only=True, data_only=True)
+    except (BadZipFile, InvalidFileException):
+        raise ValueError("Not a valid XLSX file")
+    try:
+        yield from workbook.active.iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+
+def read_rows(file: IO[bytes], file_format: str) -> Iterator[tuple[int, dict]]:
+    """
+    (line number, {column: value}) of every non-empty row after the header
+    """
+    rows = _read_xlsx(file) if file_format == "xlsx" else _read_csv(file)
+    header = [str(name or "").strip().lower() for name in next(rows, ())]
+    missing = [column for column in REQUIRED_COLUMNS if column not in header]
+    if missing:
+        raise ValueError(f"Missing columns: {', '.join(missing)}")
+
+    for line, row in enumerate(rows, start=2):
+        if any(value not in (None, "") for value in row):
+            yield line, dict(zip(header, row))
+
+
+def _parse_date(value) -> date:
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(str(value).strip(), date_format).date()
+        except ValueError:
+            pass
+    raise ValueError(f"invalid date {value!r}")
+
+
+def _parse_number(value, name: str) -> float:
+    try:
+        if isinstance(value, (int, float)):
+            number = float(value)
+        else:
+            # Decimal commas of European statements
+            number = float(str(value).strip().replace(" ", "").replace(",", "."))
+    except ValueError:
+        raise ValueError(f"invalid {name} {value!r}")
+    # float() also reads nan and inf, which every comparison of the checks would let through
+    if not math.isfinite(number):
+        raise ValueError(f"invalid {name} {value!r}")
+    return number
+
+
+def _parse_order(row: dict, instruments: dict[str, FinancialObject], portfolio: Portfolio) -> Order:
+    key = str(row["instrument"] or "").strip().upper()
+    if key not in instruments:
+        raise ValueError(f"unknown instrument {row['instrument']!r}")
+
+    direction = str(row["direction"] or "").strip().upper()
+    if direction not in Order.OrderDirection.values:
+        raise ValueError(f"direction must be one of {', '.join(Order.OrderDirection.values)}")
+
+    nb_items = _parse_number(row["nb_items"], "nb_items")
+    if nb_items <= 0 or not nb_items.is_integer():
+        raise ValueError(f"nb_items must be a positive integer, not {row['nb_items']!r}")
+
+    price = _parse_number(row["price"], "price")
+    if price <= 0:
+        raise ValueError(f"price must be positive, not {row['price']!r}")
+
+    fee = row.get("total_fee")
+    total_fee = 0. if fee in (None, "") else _parse_number(fee, "total_fee")
+    if total_fee < 0:
+        raise ValueError(f"total_fee must not be negative, not {fee!r}")
+
+    return Order(portfolio=portfolio, id_object=instruments[key], date=_parse_date(row["date"]),
+                 direction=direction, nb_items=int(nb_items), price=price, total_fee=total_fee)
+
+
+def parse_orders(portfolio: Portfolio, file: IO[bytes], file_format: str) -> ImportResult:
+    """
+    Orders of a file, validated all together without writing anything
+    """
+    if file_format not in IMPORT_FORMATS:
+        raise ValueError(f"format must be one of {', '.join(IMPORT_FORMATS)}")
+    rows = list(read_rows(file, file_format))
+
+    # Tickers and ISINs of every row resolved in one query
+    keys = {str(row["instrument"] or "").strip().upper() for _, row in rows}
+    instruments = {}
+    for obj in FinancialObject.objects.filter(Q(ticker__in=keys) | Q(isin__in=keys)):
+        instruments[obj.isin.upper()] = obj
+        if obj.ticker:
+            instruments[obj.ticker.upper()] = obj
+
+    result = ImportResult()
+    lines = []
+    for line, row in rows:
+        try:
+            result.orders.append(_parse_order(row, instruments, portfolio))
+            lines.append(line)
+        except ValueError as e:
+            result.errors.append(f"Line {line}: {e}")
+
+    if not result.errors:
+        result.errors = _oversold(portfolio, result.orders, lines)
+    return result
+
+
+def _oversold(portfolio: Portfolio, orders: list[Order], lines: list[int]) -> list[str]:
+    """
+    Errors for the sales taking a position below zero, with the portfolio's existing orders
+    """
+    existing = list(Order.objects.filter(portfolio=portfolio)
+                    .values_list("id_object_id", "date", "direction", "nb_items"))
+    imported = [(order.id_object.id, order.date, order.direction, order.nb_items) for order in orders]
+    frame = pd.DataFrame(existing + imported, columns=["id_object", "date", "direction", "nb_items"])
+    frame["line"] = [0] * len(existing) + lines
+
+    # Purchases of a day before its sales
+    frame["is_sale"] = frame["direction"] == Order.OrderDirection.SELL
+    frame["signed"] = frame["nb_items"].where(~frame["is_sale"], -frame["nb_items"])
+    frame = frame.sort_values(["date", "is_sale", "line"], kind="stable")
+    frame["position"] = frame.groupby("id_object")["signed"].cumsum()
+
+    oversold = frame[(frame["position"] < 0) & (frame["line"] > 0)].sort_values("line")
+    return [f"Line {row.line}: selling {row.nb_items} items on {row.date} exceeds the position held"
+            for row in oversold.itertuples()]
+
+
+def import_orders(portfolio: Portfolio, file: IO[bytes], file_format: str, dry_run: bool = False) -> ImportResult:
+    """
+    Insert the orders of a file into a portfolio, all of them or none if any row is invalid
+    """
+    result = parse_orders(portfolio, file, file_format)
+    if result.errors or not result.orders or dry_run:
+        return result
+
+    with transaction.atomic():
+        Order.objects.bulk_create(result.orders, batch_size=1000)
+
+    # Series recomputed once from the earliest imported order
+    portfolio.invalidate_ts(result.first_date)
+    orders_changed.send(sender=Order, portfolio=portfolio)
+    logger.info(f"Imported {len(result.orders)} orders into portfolio {portfolio.id} from {result.first_date}")
+    return result
@@ -1,28 +1,160 @@
 from django.shortcuts import render, get_object_or_404
 from django.db.models import Q
-from django.http import JsonResponse, HttpResponseNotAllowed
-from django.core.cache import cache
+from django.http import JsonResponse, HttpResponse, HttpResponseNotAllowed, HttpResponseBadRequest, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+from django.core.handlers.asgi import ASGIRequest
+import gzip
 import json
+import numpy as np
 from plotly.utils import PlotlyJSONEncoder
 
-from django.core.paginator import Paginator
+from datetime import datetime
 
-from quotes.models import Portfolio, FinancialData, Order, FinancialObject
-from quotes.utils.chart_creation import create_portfolio_chart, get_portfolio_performance
-from quotes.utils.chart_portfolio_util import performance_overview, get_order_history, create_allocation_chart, create_portfolio_performance_chart
+from quotes.models import Portfolio, PortfolioSnapshot, DataWatermark, Order, FinancialObject
+from quotes.analytics import SAMPLING_METHODS, ROLLING_WINDOWS, RiskStatistics
+from quotes.utils.chart_creation import create_portfolio_chart, get_portfolio_performance, home_chart_payload, RETURN_BASES
+from quotes.utils.chart_portfolio_util import performance_overview, create_allocation_chart, create_portfolio_performance_chart
 from quotes.utils.date_helpers import prev_business_day, get_first_business_day_of_month
+from quotes.utils.async_pool import run, gather
+from quotes.utils.chart_cache import chart_etag, encoded_etag, instruments_etag, get_or_build_payload, payload_response
+from quotes.utils.instrument_comparison import compare_instruments, MAX_COMPARED_INSTRUMENTS
+from quotes.utils.order_history import get_order_history
+from quotes.utils.order_import import import_orders, import_format
+from quotes.utils.data_export import (Export, CONTENT_TYPES, portfolio_series_export, financial_data_export, stream_export,
+                                      async_chunks)
+from quotes.signals import orders_changed
 from .forms import OrderForm
 
 
-def home(request):
-    portfolios = Portfolio.objects.all()
-    latest_date = FinancialData.get_price_most_recent_date()
+def _sampling_params(request) -> tuple[str, int | None]:
+    """
+    Chart downsampling requested with ?sampling=auto|none|weekly|monthly|lttb&points=<budget>
+    """
+    sampling = request.GET.get('sampling', 'auto')
+    if sampling not in SAMPLING_METHODS:
+        raise ValueError(f"sampling must be one of {', '.join(SAMPLING_METHODS)}")
 
-    fig = create_portfolio_chart(portfolios, "Returns", "max", None)
-    chart_json = json.dumps(fig, cls=PlotlyJSONEncoder)
-    
-    # Get performance data for the table
-    performance_data = get_portfolio_performance(portfolios, latest_date)
+    points = request.GET.get('points')
+    if points is not None and (not points.isdigit() or int(points) < 3):
+        raise ValueError("points must be an integer of at least 3")
+
+    return sampling, int(points) if points else None
+
+
+def _basis_param(request) -> str:
+    """
+    Return basis requested with ?basis=price|total, total return reinvesting the dividends
+    """
+    basis = request.GET.get('basis', 'price')
+    if basis not in RETURN_BASES:
+        raise ValueError(f"basis must be one of {', '.join(RETURN_BASES)}")
+    return basis
+
+
+def _date_param(request, name: str):
+    """
+    Optional date given as ?<name>=YYYY-MM-DD
+    """
+    value = request.GET.get(name)
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise ValueError(f"{name} must be a date formatted as YYYY-MM-DD")
+
+
+def _ids_param(request) -> list[int]:
+    """
+    Instrument ids given as ?ids=1,2,3
+    """
+    try:
+        return [int(id) for id in request.GET.get('ids', '').split(',') if id]
+    except ValueError:
+        raise ValueError("ids must be a comma-separated list of instrument ids")
+
+
+def _risk_context(stats: RiskStatistics) -> dict:
+    """
+    Risk statistics formatted for the portfolio page, "-" where not computable
+    """
+    def percent(value):
+        return "-" if value is None else f"{value:.1%}"
+
+    def ratio(value):
+        return "-" if value is None else f"{value:.2f}"
+
+    def day(value):
+        return "-" if value is None else value.strftime("%d/%m/%Y")
+
+    return {
+        'windows': list(ROLLING_WINDOWS),
+        'rows': [
+            {'label': "Volatility", 'inception': percent(stats.volatility),
+             'rolling': [percent(stats.rolling_volatility[window]) for window in ROLLING_WINDOWS]},
+            {'label': "Sharpe Ratio", 'inception': ratio(stats.sharpe),
+             'rolling': [ratio(stats.rolling_sharpe[window]) for window in ROLLING_WINDOWS]},
+        ],
+        'sortino': ratio(stats.sortino),
+        'max_drawdown': percent(stats.max_drawdown),
+        'peak_date': day(stats.peak_date),
+        'trough_date': day(stats.trough_date),
+        'recovery_date': "Not yet" if stats.peak_date and not stats.recovery_date else day(stats.recovery_date),
+    }
+
+
+def _attribution_context(ptf: Portfolio) -> dict:
+    """
+    Contribution of each instrument to the portfolio total return for every calendar year, formatted
+    """
+    attribution = ptf.get_attribution()
+    names = FinancialObject.objects.in_bulk(attribution.ids)
+
+    def percent(value, held=True):
+        return "-" if not held or np.isnan(value) else f"{value:+.2%}"
+
+    return {
+        'years': [end.year for _, end in attribution.windows],
+        'rows': [
+            {'name': names[id].name,
+             'cells': [{'total': percent(attribution.total[i, j], attribution.held[i, j]),
+                        'price': percent(attribution.price[i, j], attribution.held[i, j]),
+                        'dividend': percent(attribution.dividend[i, j], attribution.held[i, j])}
+                       for j in range(len(attribution.windows))]}
+            for i, id in enumerate(attribution.ids) if attribution.held[i].any()
+        ],
+        'portfolio': [percent(value) for value in attribution.portfolio_return],
+    }
+
+
+async def _payload_view(request, tag_func, build) -> HttpResponse:
+    """
+    Cached chart payload, or 304 Not Modified if the client already has it. The tag and the
+    payload are computed in the view pool: both may query the database. The snapshots the tag
+    covers must be refreshed beforehand (PortfolioSnapshot.refresh_stale).
+    """
+    tag = await run(tag_func)
+    response_tag = quote_etag(encoded_etag(request, tag))
+    response = get_conditional_response(request, etag=response_tag)
+    if response is None:
+        response = payload_response(request, await run(get_or_build_payload, tag, build))
+    if request.method in ("GET", "HEAD"):
+        response.headers["ETag"] = response_tag
+    return response
+
+
+async def home(request):
+    portfolios, latest_date = await gather(lambda: list(Portfolio.objects.select_related("owner")),
+                                           DataWatermark.as_of_date)
+
+    # Stale series refreshed once, all together: the chart and the table then only read the snapshots
+    await run(PortfolioSnapshot.refresh_stale, portfolios)
+
+    # Serialized chart cached until the snapshots change, built alongside the performance table
+    payload, performance_data = await gather(lambda: home_chart_payload(portfolios),
+                                             lambda: get_portfolio_performance(portfolios, latest_date))
+    chart_json = gzip.decompress(payload).decode()
     
     context = {
         'portfolios': portfolios,
@@ -32,55 +164,72 @@ def home(request):
         'timeframes': ["1M", "3M", "6M", "YTD", "1Y"],
     } 
 
-    return render(request, "home.html", context)
+    return await run(render, request, "home.html", context)
 
 
 
-def chart_data(request):
+def _chart_data_etag(request):
+    # Tag of the chart, sent as ETag and keying the payload cache
+    if not hasattr(request, "chart_etag"):
+        request.chart_etag = chart_etag(Portfolio.objects.values_list("id", flat=True), "chart_data", request.GET.dict())
+    return request.chart_etag
+
+
+async def chart_data(request):
     """
     API endpoint that returns updated chart data based on timeframe and mode.
     Called by JavaScript when user clicks timeframe buttons or changes chart mode.
+    The serialized chart is cached gzip-compressed, and tagged so that browsers revalidate it.
     """
     # Get parameters from request
     time_frame = request.GET.get('timeframe', 'max')
     chart_mode = request.GET.get('mode', 'Returns')
+    try:
+        sampling, point_budget = _sampling_params(request)
+        basis = _basis_param(request)
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
     
     # Fetch portfolios
-    portfolios = Portfolio.objects.all()
-    
-    # Create chart with requested parameters
-    fig = create_portfolio_chart(
-        portfolios=portfolios,
-        chart_mode=chart_mode,
-        time_frame=time_frame,
-        custom_dates=None
-    )
-    
-    # Return JSON response
-    chart_json = json.dumps(fig, cls=PlotlyJSONEncoder)
+    portfolios = Portfolio.objects.select_related("owner")
     
-    return JsonResponse({
-        'chart': json.loads(chart_json)
-    })
+    # Create chart with requested parameters, serialized once
+    def build() -> str:
+        fig = create_portfolio_chart(
+            portfolios=portfolios,
+            chart_mode=chart_mode,
+            time_frame=time_frame,
+            custom_dates=None,
+            sampling=sampling,
+            point_budget=point_budget,
+            basis=basis
+        )
+        return '{"chart": ' + json.dumps(fig, cls=PlotlyJSONEncoder) + '}'
+
+    # Stale series refreshed before tagging: the build would otherwise change the snapshots under the tag
+    await run(PortfolioSnapshot.refresh_stale, portfolios)
+    return await _payload_view(request, lambda: _chart_data_etag(request), build)
 
 
 def about(request):
     return render(request, "about.html", {})
 
 
-def portfolio(request, pk):
+async def portfolio(request, pk):
     """
-    For a given portfolio, provides the inventory and cumulative amount invested 
+    For a given portfolio, provides the inventory and cumulative amount invested.
+    The charts, tables and statistics of the page are computed concurrently.
     """
-    import numpy as np
-    
-    ptf = get_object_or_404(Portfolio, id=pk)
-    latest_date = FinancialData.get_price_most_recent_date()
+    ptf, latest_date = await gather(lambda: get_object_or_404(Portfolio, id=pk), DataWatermark.as_of_date)
 
-    inventory = ptf.get_inventory(latest_date)
+    # Series and risk statistics computed once, first: the concurrent tasks below are handed them
+    # instead of each one reading (and possibly rewriting) the series
+    def series_and_risk():
+        series = Portfolio.get_many_TS([ptf])
+        ptf.get_TS(series)
+        return _risk_context(ptf.get_risk_statistics(series))
 
-    if ptf.ts_val is None:
-        ptf.get_TS()
+    inventory, risk = await gather(lambda: ptf.get_inventory(latest_date), series_and_risk)
 
     # Portfolio Value
     ptf_value = ptf.ts_val[latest_date]
@@ -88,19 +237,19 @@ def portfolio(request, pk):
     # Portfolio PnL
     pnl = ptf_value - np.dot(inventory.nbs, inventory.prus)
 
-    # Allocation chart
-    allocation_chart = create_allocation_chart(pk)
-    allocation_json = json.dumps(allocation_chart, cls=PlotlyJSONEncoder)
-
-    # Performance chart
-    performance_chart = create_portfolio_performance_chart(pk)
-    performance_json = json.dumps(performance_chart, cls=PlotlyJSONEncoder)
-
-    # inventory table
-    inv_df = performance_overview(pk)
+    (allocation_json,       # Allocation chart
+     performance_json,      # Performance chart
+     inv_df,                # inventory table
+     ytd_price_return,      # YTD Price Return
+     attribution,           # Attribution of every calendar year, in one pass
+     ) = await gather(
+        lambda: json.dumps(create_allocation_chart(pk), cls=PlotlyJSONEncoder),
+        lambda: json.dumps(create_portfolio_performance_chart(pk, series=ptf.ts_cumul_ret), cls=PlotlyJSONEncoder),
+        lambda: performance_overview(pk),
+        ptf.get_ytd_price_return,
+        lambda: _attribution_context(ptf),
+    )
 
-    # YTD Price Return
-    ytd_price_return = ptf.get_ytd_price_return()
     if ytd_price_return is not None:
         sign = "+" if ytd_price_return >= 0 else ""
         ytd_price_return_str = f"{sign}{ytd_price_return:.1%}"
@@ -120,8 +269,10 @@ def portfolio(request, pk):
         'pk': pk,
         'ytd_price_return': ytd_price_return_str,
         'ytd_price_return_color': ytd_price_return_color,
+        'risk': risk,
+        'attribution': attribution,
     }
-    return render(request, "portfolio.html", context)
+    return await run(render, request, "portfolio.html", context)
 
 def portfolio_orders(request, pk):
     """
@@ -129,11 +280,11 @@ def portfolio_orders(request, pk):
     """
     portfolio = get_object_or_404(Portfolio, id=pk)
     
-    # Get paginated orders
-    orders = get_order_history(pk)
-    paginator = Paginator(orders, 25)
-    page_number = request.GET.get('page', 1)
-    page_obj = paginator.get_page(page_number)
+    # Requested page of orders, from the cursor of an adjacent page
+    try:
+        page = get_order_history(pk, older_than=request.GET.get('older'), newer_than=request.GET.get('newer'))
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
     
     # Empty form for adding orders
     form = OrderForm()
@@ -141,7 +292,7 @@ def portfolio_orders(request, pk):
     
     context = {
         'portfolio': portfolio,
-        'page_obj': page_obj,
+        'page': page,
         'form': form,
         'financial_objects': financial_objects,
         'pk': pk,
@@ -150,30 +301,52 @@ def portfolio_orders(request, pk):
     return render(request, 'orders.html', context)
 
 
-def portfolio_chart_data(request, pk):
+def _portfolio_chart_etag(request, pk):
+    if not hasattr(request, "chart_etag"):
+        request.chart_etag = chart_etag([pk], "portfolio_chart_data", request.GET.dict())
+    return request.chart_etag
+
+
+async def portfolio_chart_data(request, pk):
     """
     AJAX endpoint to get portfolio performance chart data for a specific timeframe.
+    The serialized chart is cached gzip-compressed, and tagged so that browsers revalidate it.
     """
     start_date = request.GET.get('start_date')
     end_date = request.GET.get('end_date')
     year = request.GET.get('year')
+    try:
+        sampling, point_budget = _sampling_params(request)
+        basis = _basis_param(request)
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+
+    def build() -> str:
+        if start_date and end_date:
+            chart = create_portfolio_performance_chart(pk, start_date=start_date, end_date=end_date,
+                                                       sampling=sampling, point_budget=point_budget, basis=basis)
+            
+        elif year:
+            year_start = get_first_business_day_of_month(int(year), 1)
+            year_end = prev_business_day(get_first_business_day_of_month(int(year)+1, 1))
+            chart = create_portfolio_performance_chart(pk, 
+                                                       start_date=year_start.strftime('%Y-%m-%d'),
+                                                       end_date=year_end.strftime('%Y-%m-%d'),
+                                                       sampling=sampling,
+                                                       point_budget=point_budget,
+                                                       basis=basis
+                                                       )
+        else:
+            timeframe = request.GET.get('timeframe', 'max')
+            chart = create_portfolio_performance_chart(pk, timeframe, sampling=sampling, point_budget=point_budget, basis=basis)
 
-    if start_date and end_date:
-        chart = create_portfolio_performance_chart(pk, start_date=start_date, end_date=end_date)
-        
-    elif year:
-        start_date = get_first_business_day_of_month(int(year), 1)
-        end_date = prev_business_day(get_first_business_day_of_month(int(year)+1, 1))
-        chart = create_portfolio_performance_chart(pk, 
-                                                   start_date=start_date.strftime('%Y-%m-%d'),
-                                                   end_date=end_date.strftime('%Y-%m-%d')
-                                                   )
-    else:
-        timeframe = request.GET.get('timeframe', 'max')
-        chart = create_portfolio_performance_chart(pk, timeframe)
+        return json.dumps(chart.to_dict(), cls=PlotlyJSONEncoder)
     
+    # Stale series refreshed before tagging, as in chart_data
+    await run(PortfolioSnapshot.refresh_stale, Portfolio.objects.filter(pk=pk))
+
     # Return as JSON
-    return JsonResponse(chart.to_dict(), encoder=PlotlyJSONEncoder)
+    return await _payload_view(request, lambda: _portfolio_chart_etag(request, pk), build)
 
 
 def delete_order(request, order_id):
@@ -188,15 +361,12 @@ def delete_order(request, order_id):
 
     # Delete the order
     order.delete()
-    cache.delete(f"portfolio_{portfolio_id}_ts")
+    order.portfolio.invalidate_ts(order.date)
+    orders_changed.send(sender=Order, portfolio=order.portfolio)
 
-    # Get updated order history
-    orders = get_order_history(portfolio_id)
-    paginator = Paginator(orders, 25)
-    page_obj = paginator.get_page(1)
-
-    # Only return the updated table HTML
-    return render(request, "partials/portfolio/orders_table.html", {'page_obj': page_obj, 'pk': portfolio_id, 'financial_objects': financial_objects})
+    # Only return the updated table HTML, most recent orders first
+    page = get_order_history(portfolio_id)
+    return render(request, "partials/portfolio/orders_table.html", {'page': page, 'pk': portfolio_id, 'financial_objects': financial_objects})
 
 def add_order(request, pk):
     """
@@ -208,14 +378,13 @@ def add_order(request, pk):
             order = form.save(commit=False)
             order.portfolio_id = pk
             order.save()
-            cache.delete(f"portfolio_{pk}_ts")
+            order.portfolio.invalidate_ts(order.date)
+            orders_changed.send(sender=Order, portfolio=order.portfolio)
             # Get updated order list and render template
-            orders = get_order_history(pk)
+            page = get_order_history(pk)
             financial_objects = FinancialObject.objects.all()
-            paginator = Paginator(orders, 25)
-            page_obj = paginator.get_page(paginator.num_pages)
             return render(request, 'partials/portfolio/orders_table.html', {
-                'page_obj': page_obj,
+                'page': page,
                 'pk': pk,
                 'financial_objects': financial_objects
             })
@@ -226,9 +395,121 @@ def add_order(request, pk):
             })
 
 
+def import_orders_file(request, pk):
+    """
+    Import the orders of an uploaded broker statement (CSV or XLSX) and return the updated orders table.
+    Nothing is imported if any row is invalid: the errors are listed above the table instead.
+    """
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+    portfolio = get_object_or_404(Portfolio, id=pk)
+
+    upload = request.FILES.get('file')
+    if upload is None:
+        return HttpResponseBadRequest("No file uploaded")
+
+    context = {'pk': pk, 'financial_objects': FinancialObject.objects.all()}
+    try:
+        result = import_orders(portfolio, upload, import_format(upload.name))
+    except ValueError as e:
+        context['import_errors'] = [str(e)]
+    else:
+        if result.errors:
+            context['import_errors'] = result.errors
+        else:
+            context['import_message'] = f"Imported {len(result.orders)} orders"
+
+    context['page'] = get_order_history(pk)
+    return render(request, 'partials/portfolio/orders_table.html', context)
+
+
 def instrument_comparison(request):
-    
-    return render(request, "instrument_comparison.html", {})
+    financial_objects = FinancialObject.objects.order_by("name")
+    return render(request, "instrument_comparison.html", {
+        'financial_objects': financial_objects,
+        'max_instruments': MAX_COMPARED_INSTRUMENTS,
+    })
+
+
+def _comparison_etag(request):
+    if not hasattr(request, "chart_etag"):
+        request.chart_etag = instruments_etag("instrument_comparison", request.GET.dict())
+    return request.chart_etag
+
+
+def instrument_comparison_data(request):
+    """
+    API endpoint returning the rebased returns of up to MAX_COMPARED_INSTRUMENTS instruments:
+    ?ids=1,2,3&timeframe=1y&base=YYYY-MM-DD&basis=price|total&sampling=...&points=...
+    The payload is cached gzip-compressed until market data changes, and tagged for revalidation.
+    """
+    try:
+        ids = _ids_param(request)
+        base_date = _date_param(request, 'base')
+        sampling, point_budget = _sampling_params(request)
+        basis = _basis_param(request)
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+
+    if not ids:
+        return HttpResponseBadRequest("ids must list at least one instrument id")
+    if len(ids) > MAX_COMPARED_INSTRUMENTS:
+        return HttpResponseBadRequest(f"At most {MAX_COMPARED_INSTRUMENTS} instruments can be compared")
+
+    time_frame = request.GET.get('timeframe', '1y')
+    def build() -> str:
+        return json.dumps(compare_instruments(ids, time_frame, base_date, basis, sampling, point_budget))
+
+    # Only valid requests are tagged: a 400 must not be revalidated into a 304
+    tag = _comparison_etag(request)
+    response_tag = quote_etag(encoded_etag(request, tag))
+    response = get_conditional_response(request, etag=response_tag)
+    if response is None:
+        try:
+            response = payload_response(request, get_or_build_payload(tag, build))
+        except ValueError as e:
+            return HttpResponseBadRequest(str(e))
+    response.headers["ETag"] = response_tag
+    return response
+
+
+def _export_response(request, export: Export, file_format: str, filename: str) -> StreamingHttpResponse:
+    # Each server streams its own kind of iterator without buffering it: async under ASGI, sync under WSGI
+    chunks = stream_export(export, file_format)
+    if isinstance(request, ASGIRequest):
+        chunks = async_chunks(chunks)
+    response = StreamingHttpResponse(chunks, content_type=CONTENT_TYPES[file_format])
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{file_format}"'
+    return response
+
+
+def export_portfolio_series(request, pk):
+    """
+    Streams the daily value/return series of a portfolio:
+    ?format=csv|parquet&start=YYYY-MM-DD&end=YYYY-MM-DD
+    """
+    ptf = get_object_or_404(Portfolio, id=pk)
+    file_format = request.GET.get('format', 'csv')
+    try:
+        start, end = _date_param(request, 'start'), _date_param(request, 'end')
+        export = portfolio_series_export([ptf], start, end)
+        return _export_response(request, export, file_format, f"portfolio_{ptf.id}_series")
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+
+
+def export_financial_data(request):
+    """
+    Streams the price/dividend history of instruments (all of them without ids):
+    ?ids=1,2,3&field=NAV|Dividends&format=csv|parquet&start=YYYY-MM-DD&end=YYYY-MM-DD
+    """
+    file_format = request.GET.get('format', 'csv')
+    try:
+        export = financial_data_export(_ids_param(request), request.GET.get('field'),
+                                       _date_param(request, 'start'), _date_param(request, 'end'))
+        return _export_response(request, export, file_format, "financial_data")
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
 
 
 def databases(request):
@@ -260,22 +541,20 @@ def edit_order(request, order_id):
     Handle POST request to edit an existing order.
     """
     order = get_object_or_404(Order, id=order_id)
+    previous_date = order.date
     
     if request.method == 'POST':
         form = OrderForm(request.POST, instance=order)
         if form.is_valid():
             form.save()
             portfolio_id = order.portfolio.id
-            cache.delete(f"portfolio_{portfolio_id}_ts")
+            order.portfolio.invalidate_ts(min(previous_date, order.date))
+            orders_changed.send(sender=Order, portfolio=order.portfolio)
             
-            # Get paginated orders
-            orders = get_order_history(portfolio_id)
-            paginator = Paginator(orders, 25)
-            page_obj = paginator.get_page(request.GET.get('page', 1))
-
             # Get updated order list and render template
+            page = get_order_history(portfolio_id)
             return render(request, 'partials/portfolio/orders_table.html', {
-                'orders': page_obj,
+                'page': page,
                 'form': OrderForm(),
                 'pk': portfolio_id,
             })